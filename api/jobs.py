@@ -0,0 +1,141 @@
+# api/jobs.py
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, List, Optional
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class SourcesBusy(Exception):
+    pass
+
+
+class SourceLocks:
+    """One lock per document source, plus an exclusive hold over all sources.
+
+    ``hold(source)`` serializes jobs writing the same source; its lock only
+    exists while someone holds or waits for it. ``exclusive()`` is for
+    operations on the whole store: it raises SourcesBusy while any source is
+    held, and new holders wait until it is released.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._locks: Dict[str, List[Any]] = {}  # source -> [lock, holders and waiters]
+        self._exclusive = False
+
+    @contextmanager
+    def hold(self, source: str):
+        with self._cond:
+            while self._exclusive:
+                self._cond.wait()
+            entry = self._locks.setdefault(source, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._cond:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[source]
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            if self._exclusive:
+                raise SourcesBusy("the knowledge base is already being changed as a whole")
+            if self._locks:
+                raise SourcesBusy(f"documents being written: {len(self._locks)}")
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class JobManager:
+    """Runs ingestion jobs on a bounded thread pool and keeps their status for polling.
+
+    ``fn`` receives a ``report(progress: dict)`` callback as its first
+    argument; whatever it returns becomes the job result.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 100, max_history: int = 1000):
+        self.max_pending = max_pending
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[..., Any], *args, name: str = "", **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            if self._count_active() >= self.max_pending:
+                raise JobQueueFull(f"{self.max_pending} jobs already queued or running")
+            job_id = uuid.uuid4().hex
+            job = {
+                "job_id": job_id,
+                "name": name,
+                "status": "queued",
+                "progress": {},
+                "result": None,
+                "error": None,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+            }
+            self._jobs[job_id] = job
+            self._trim_history()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return dict(job)
+
+    def _run(self, job: Dict[str, Any], fn: Callable[..., Any], args, kwargs):
+        def report(progress: Dict[str, Any]):
+            job["progress"] = progress
+
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        try:
+            job["result"] = fn(report, *args, **kwargs)
+            job["status"] = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job["error"] = str(e)
+            job["status"] = "failed"
+        finally:
+            job["finished_at"] = time.time()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(job) for job in self._jobs.values()]
+
+    def count_active(self) -> int:
+        """Jobs queued or running"""
+        with self._lock:
+            return self._count_active()
+
+    def _count_active(self) -> int:
+        return sum(1 for job in self._jobs.values() if job["status"] in ("queued", "running"))
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs once the history is full
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("done", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
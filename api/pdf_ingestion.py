@@ -1,15 +1,26 @@
 # api/pdf_ingestion.py
+import asyncio
+import json
 import os
 import shutil
+import uuid
 import yaml
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, File, UploadFile, HTTPException, status
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from pathlib import Path
+from pydantic import BaseModel
 
 # Import your core modules
-from core.pdf_processor import PDFProcessor
-from core.embedding_model import EmbeddingModel
-from core.vector_database import VectorDatabase
+from core import model_registry
+from core.ingestion import ingest_pdf
+from core.prompt import build_prompt, GENERATION_ERROR_MESSAGE, GenerationError
+from core.batch_scheduler import MicroBatchScheduler
+from core.context_packer import QuestionTooLong
+from core.metrics import metrics, log_event, configure as configure_metrics
+from core.llm_pool import LLMPoolBusy
+from api.jobs import JobManager, JobQueueFull, SourceLocks, SourcesBusy
 
 
 # Load shared config
@@ -22,84 +33,362 @@ def load_config():
 
 
 config = load_config()
+configure_metrics(quiet=config.get("quiet", False), structured_logs=config.get("structured_logs", False))
 
-# Initialize components (shared across requests)
-pdf_processor = PDFProcessor()
-embedding_model = EmbeddingModel(config["embedding_model_path"])
-vector_db = VectorDatabase(persist_directory=config["vector_db_dir"])
+# Models are loaded on first use (or in the background after startup, see warmup_models)
+# through the process-wide registry, so the service is ready within seconds
+pdf_processor = model_registry.get_pdf_processor(config)
 
-app = FastAPI(title="Edge RAG PDF Ingestion API", version="1.0")
+jobs = JobManager(
+    max_workers=config.get("ingest_workers", 2),
+    max_pending=config.get("ingest_max_pending", 100)
+)
+# Two uploads of the same file name must not interleave their upserts/deletes,
+# and the knowledge base is not cleared under a job that is writing
+source_locks = SourceLocks()
 
+# Answers are reused for near-identical questions until the knowledge base changes
+answer_cache = model_registry.get_answer_cache(config)
 
-@app.post("/upload-pdf", summary="Upload and process a new PDF")
+
+def get_embedding_model():
+    return model_registry.get_embedding_model(config)
+
+
+def get_vector_db():
+    return model_registry.get_vector_db(config)
+
+
+def get_llm():
+    return model_registry.get_llm(config)
+
+
+def get_context_packer():
+    return model_registry.get_context_packer(config)
+
+
+def _retrieve(questions, query_embeddings, timings=None):
+    packer = get_context_packer()
+    results, prompts = [], []
+    with metrics.stage_timer("retrieve", timings):
+        all_similar = get_vector_db().search_similar_batch(query_embeddings, top_k=config.get("top_k", 2),
+                                                           query_texts=questions)
+    with metrics.stage_timer("prompt_build", timings):
+        for question, similar in zip(questions, all_similar):
+            context, packed = packer.pack(question, similar)
+            results.append(packed)
+            prompts.append(build_prompt(question, context))
+    return results, prompts
+
+
+def _answer_batch(questions):
+    llm = get_llm()
+    timings = {}
+    metrics.inc("rag_queries_total", len(questions), entry="api")
+    kb_version = get_vector_db().version
+    with metrics.stage_timer("embed", timings):
+        query_embeddings = get_embedding_model().create_embeddings(questions)
+    responses = [None] * len(questions)
+    for i, q_emb in enumerate(query_embeddings):
+        cached = answer_cache.lookup(q_emb, kb_version)
+        metrics.inc("rag_answer_cache_total", result="hit" if cached else "miss")
+        if cached:
+            responses[i] = {"question": questions[i], "answer": cached["answer"],
+                            "context_chunks": cached["context_chunks"], "cached": True}
+
+    todo = [i for i, response in enumerate(responses) if response is None]
+    if todo:
+        results, prompts = _retrieve([questions[i] for i in todo], query_embeddings[todo], timings)
+        with metrics.stage_timer("generate", timings):
+            answers = llm.generate_batch(prompts, temperature=config.get("temperature", 0.3))
+        for i, answer, similar in zip(todo, answers, results):
+            responses[i] = {"question": questions[i], "answer": answer, "context_chunks": similar, "cached": False}
+            if answer != GENERATION_ERROR_MESSAGE:
+                answer_cache.store(query_embeddings[i], kb_version,
+                                   {"answer": answer, "context_chunks": similar})
+    log_event("query_batch", entry="api", questions=len(questions), generated=len(todo), **timings)
+    return responses
+
+
+query_scheduler = MicroBatchScheduler(
+    _answer_batch,
+    max_batch_size=config.get("query_max_batch_size", 4),
+    max_wait_ms=config.get("query_max_wait_ms", 25)
+)
+# An LLM worker pool runs one generation per worker and rejects overload when a request is
+# submitted; behind the single micro-batcher thread at most one batch would be generating
+# and the backlog would pile up in its unbounded queue instead
+micro_batching = config.get("llm_workers", 0) <= 1
+
+
+class QueryRequest(BaseModel):
+    question: str
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream_answer(question: str):
+    # Sync generator: StreamingResponse iterates it in a worker thread
+    try:
+        llm = get_llm()
+        timings = {}
+        metrics.inc("rag_queries_total", entry="api_stream")
+        kb_version = get_vector_db().version
+        with metrics.stage_timer("embed", timings):
+            q_emb = get_embedding_model().create_embeddings([question])[0]
+        cached = answer_cache.lookup(q_emb, kb_version)
+        metrics.inc("rag_answer_cache_total", result="hit" if cached else "miss")
+        if cached:
+            yield _sse("context", {"question": question, "context_chunks": cached["context_chunks"]})
+            yield _sse("token", {"text": cached["answer"]})
+            yield _sse("done", {"answer": cached["answer"], "cached": True})
+            return
+
+        results, prompts = _retrieve([question], [q_emb], timings)
+        yield _sse("context", {"question": question, "context_chunks": results[0]})
+        answer = ""
+        generation = {}
+        for piece in llm.stream_response(prompts[0], temperature=config.get("temperature", 0.3), stats=generation):
+            answer += piece
+            yield _sse("token", {"text": piece})
+        answer = answer.strip()
+        # Only reached when generation finished: a failed stream raises GenerationError
+        answer_cache.store(q_emb, kb_version, {"answer": answer, "context_chunks": results[0]})
+        log_event("query", entry="api_stream", cached=False, **timings, **generation)
+        yield _sse("done", {"answer": answer, "cached": False})
+    except (GenerationError, QuestionTooLong) as e:
+        yield _sse("error", {"detail": str(e)})
+    except Exception as e:
+        yield _sse("error", {"detail": f"Query failed: {str(e)}"})
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Loads in a daemon thread: the server accepts requests while models warm up
+    model_registry.warm_up(config)
+    yield
+
+
+app = FastAPI(title="Edge RAG PDF Ingestion API", version="1.0", lifespan=lifespan)
+
+
+def _save_upload(file: UploadFile, file_path: Path):
+    with open(file_path, "wb") as f:
+        shutil.copyfileobj(file.file, f, length=1 << 20)
+
+
+def _ingest_job(report, file_path: Path, source: str):
+    try:
+        with source_locks.hold(source):
+            stats = ingest_pdf(
+                str(file_path),
+                pdf_processor,
+                get_embedding_model(),
+                get_vector_db(),
+                chunk_size=config.get("chunk_size", 400),
+                chunk_overlap=config.get("chunk_overlap", 50),
+                source=source,
+                batch_size=config.get("ingest_batch_size", 64),
+                progress=report,
+                chunking=config.get("chunking", "words")
+            )
+        if not stats["chunks"]:
+            raise ValueError("No text extracted from PDF")
+        if not stats["unchanged"]:
+            answer_cache.invalidate()
+        return stats
+    finally:
+        # Clean up uploaded file
+        if file_path.exists():
+            os.remove(file_path)
+
+
+@app.post("/upload-pdf", summary="Upload a PDF and queue it for processing",
+          status_code=status.HTTP_202_ACCEPTED)
 async def upload_pdf(file: UploadFile = File(...)):
     if not file.filename.lower().endswith(".pdf"):
         raise HTTPException(status_code=400, detail="Only PDF files allowed")
 
-    # Save uploaded file temporarily
+    # Save uploaded file under a unique name, the job removes it when done
     upload_dir = Path("uploads")
     upload_dir.mkdir(exist_ok=True)
-    file_path = upload_dir / file.filename
+    source = os.path.basename(file.filename)
+    file_path = upload_dir / f"{uuid.uuid4().hex}_{source}"
 
     try:
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-
-        # Process PDF
-        chunks = pdf_processor.load_pdf(
-            str(file_path),
-            chunk_size=config.get("chunk_size", 400),
-            chunk_overlap=config.get("chunk_overlap", 50)
-        )
-
-        if not chunks:
-            raise HTTPException(status_code=400, detail="No text extracted from PDF")
-
-        # Generate embeddings
-        embeddings = embedding_model.create_embeddings(chunks)
-
-        # Clear existing DB and add new docs
-        vector_db.collection.delete(where={})  # Delete all entries
-        metadatas = [{"chunk_id": i, "source": file.filename} for i in range(len(chunks))]
-        vector_db.add_documents(chunks, embeddings, metadatas)
-
-        return JSONResponse(
-            status_code=status.HTTP_200_OK,
-            content={
-                "message": "PDF processed successfully",
-                "chunks_created": len(chunks),
-                "filename": file.filename
-            }
-        )
-
+        await run_in_threadpool(_save_upload, file, file_path)
+        job = jobs.submit(_ingest_job, file_path, source, name=source)
+    except JobQueueFull as e:
+        if file_path.exists():
+            os.remove(file_path)
+        raise HTTPException(status_code=429, detail=f"Ingestion queue full: {str(e)}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
-
-    finally:
-        # Clean up uploaded file
         if file_path.exists():
             os.remove(file_path)
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "message": "PDF queued for processing",
+            "job_id": job["job_id"],
+            "filename": source,
+            "status_url": f"/jobs/{job['job_id']}"
+        }
+    )
+
+
+@app.get("/jobs/{job_id}", summary="Get status and progress of an ingestion job")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs", summary="List recent ingestion jobs")
+async def list_jobs():
+    return {"jobs": jobs.list()}
+
+
+@app.get("/documents", summary="List documents in the knowledge base")
+async def list_documents():
+    try:
+        sources = await run_in_threadpool(lambda: get_vector_db().list_sources())
+        return {"documents": [{"source": s, "chunks": n} for s, n in sorted(sources.items())]}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Listing failed: {str(e)}")
+
+
+@app.delete("/documents/{source}", summary="Delete one document from the knowledge base")
+async def delete_document(source: str):
+    def delete():
+        with source_locks.hold(source):
+            removed = get_vector_db().delete_source(source)
+        answer_cache.invalidate()
+        return removed
+
+    try:
+        removed = await run_in_threadpool(delete)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Deletion failed: {str(e)}")
+    if not removed:
+        raise HTTPException(status_code=404, detail=f"No document named '{source}'")
+    return {"message": f"Document '{source}' deleted", "chunks_removed": removed}
 
 
 @app.delete("/delete-knowledge", summary="Delete entire knowledge base")
 async def delete_knowledge():
+    def clear():
+        # Queued jobs would write right after the clear, running ones into the cleared store
+        with source_locks.exclusive():
+            active = jobs.count_active()
+            if active:
+                raise SourcesBusy(f"{active} ingestion jobs are queued or running")
+            get_vector_db().clear_collection()
+        answer_cache.invalidate()
+
     try:
-        vector_db.collection.delete(where={})  # Clear all
+        await run_in_threadpool(clear)
         # Optional: also clear persist directory (hard reset)
         # shutil.rmtree(config["vector_db_dir"], ignore_errors=True)
         return {"message": "Knowledge base cleared successfully"}
+    except SourcesBusy as e:
+        raise HTTPException(status_code=409, detail=f"Knowledge base is in use, retry later: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Deletion failed: {str(e)}")
 
 
+@app.post("/query", summary="Ask a question about the stored documents")
+async def query(request: QueryRequest):
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question must not be empty")
+    try:
+        # Rejected up front: failing inside a micro-batch would fail the other questions too
+        await run_in_threadpool(lambda: get_context_packer().check_question(question))
+        if micro_batching:
+            # Concurrent questions are grouped into one embed/search/generate batch
+            return await asyncio.wrap_future(query_scheduler.submit(question))
+        return (await run_in_threadpool(_answer_batch, [question]))[0]
+    except QuestionTooLong as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LLMPoolBusy as e:
+        raise HTTPException(status_code=429, detail=f"Too many questions in progress: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Query failed: {str(e)}")
+
+
+@app.post("/query/stream", summary="Ask a question and stream the answer as server-sent events")
+async def query_stream(request: QueryRequest):
+    question = request.question.strip()
+    if not question:
+        raise HTTPException(status_code=400, detail="Question must not be empty")
+    return StreamingResponse(
+        _stream_answer(question),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _collect_gauges():
+    # Scraping must not load anything, components that are not loaded yet are skipped
+    vector_db = model_registry.get_vector_db(config, load=False)
+    if vector_db is not None:
+        yield "rag_vector_store_documents", {}, vector_db.count()
+        vectors = vector_db.get_collection_info().get("vectors")
+        if vectors:
+            yield "rag_vector_store_bytes", {"kind": "full_precision"}, vectors["full_precision_mb"] * 2 ** 20
+            yield "rag_vector_store_bytes", {"kind": "search_index"}, vectors["search_index_mb"] * 2 ** 20
+    yield "rag_ingest_jobs_active", {}, jobs.count_active()
+    yield "rag_query_queue_depth", {}, query_scheduler.get_stats()["queued"]
+    embedding_model = model_registry.get_embedding_model(config, load=False)
+    llm = model_registry.get_llm(config, load=False)
+    caches = {"embedding": embedding_model.get_cache_stats() if embedding_model else {},
+              "answer": answer_cache.get_stats()}
+    if llm is not None and llm.prefix_cache is not None:
+        caches["prefix"] = llm.prefix_cache.get_stats()
+    for cache, stats in caches.items():
+        if stats:
+            yield "rag_cache_hit_rate", {"cache": cache}, stats["hit_rate"]
+            yield "rag_cache_entries", {"cache": cache}, stats["entries"]
+
+
+metrics.register_collector(_collect_gauges)
+
+
+@app.get("/metrics", summary="Metrics in the Prometheus text format", response_class=PlainTextResponse)
+def get_metrics():
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/status", summary="Get current knowledge base status")
 async def get_status():
-    try:
-        count = vector_db.collection.count()
+    def status_report():
+        # Never loads anything: a store or model that is still loading is reported as such
+        vector_db = model_registry.get_vector_db(config, load=False)
+        embedding_model = model_registry.get_embedding_model(config, load=False)
+        llm = model_registry.get_llm(config, load=False)
+        models = model_registry.registry.status()
+        # "loading" while the warm-up thread opens it, "not loaded" until something first needs it
+        vector_db_state = next((m["state"] for m in models if m["component"] == "vector_db"), "not loaded")
         return {
-            "documents_in_db": count,
+            "documents_in_db": vector_db.count() if vector_db is not None else vector_db_state,
+            "active_jobs": jobs.count_active(),
             "vector_db_path": config["vector_db_dir"],
-            "embedding_model": config["embedding_model_path"]
+            "embedding_model": config["embedding_model_path"],
+            "embedding_cache": embedding_model.get_cache_stats() if embedding_model else None,
+            "query_batching": query_scheduler.get_stats(),
+            "answer_cache": answer_cache.get_stats(),
+            "vector_store": vector_db.get_collection_info() if vector_db is not None else vector_db_state,
+            "models": models,
+            "llm_pool": llm.get_stats() if hasattr(llm, "get_stats") else None
         }
+
+    try:
+        # Counting and collection info touch the store, keep them off the event loop
+        return await run_in_threadpool(status_report)
     except Exception as e:
         return {"error": str(e)}
\ No newline at end of file
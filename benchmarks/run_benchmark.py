@@ -0,0 +1,423 @@
+"""Offline performance benchmark of the ingestion and query pipeline.
+
+    python -m benchmarks.run_benchmark run --pages 200 --output base.json
+    python -m benchmarks.run_benchmark run --pages 200 --output new.json
+    python -m benchmarks.run_benchmark compare base.json new.json --threshold 0.15
+    python -m benchmarks.run_benchmark library --docs 10,100,1000 --docs-to-expand 5
+
+Stub embedding and LLM models are used unless model paths are given, so
+the suite runs without downloads. ``compare`` exits with status 1 when a
+stage got slower than the threshold allows. ``library`` compares flat and
+two-level (document -> chunk) retrieval latency as the number of documents
+grows, on synthetic topic-clustered vectors.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import List, Dict, Any
+
+import numpy as np
+
+from benchmarks.stubs import StubEmbeddingModel, StubLLM
+from benchmarks.synthetic_pdf import make_synthetic_pdf
+from core.answer_cache import SemanticAnswerCache
+from core.context_packer import ContextPacker
+from core.ingestion import ingest_pdf, batched, make_chunker, CHUNKING_MODES
+from core.pdf_processor import PDFProcessor
+from core.prompt import build_prompt
+from core.vector_database import VectorDatabase
+
+
+class StageTimer:
+    """Collects per-call durations and item counts for each benchmark stage"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.items: Dict[str, int] = {}
+        self.units: Dict[str, str] = {}
+
+    @contextlib.contextmanager
+    def measure(self, stage: str, items: int = 1, unit: str = "items"):
+        start = time.perf_counter()
+        yield
+        self.record(stage, time.perf_counter() - start, items, unit)
+
+    def record(self, stage: str, seconds: float, items: int = 1, unit: str = "items"):
+        self.samples.setdefault(stage, []).append(seconds)
+        self.items[stage] = self.items.get(stage, 0) + items
+        self.units[stage] = unit
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for stage, samples in self.samples.items():
+            ms = np.asarray(samples) * 1000.0
+            total = float(np.sum(samples))
+            result[stage] = {
+                "calls": len(samples),
+                "items": self.items[stage],
+                "unit": self.units[stage],
+                "total_s": round(total, 4),
+                "throughput_per_s": round(self.items[stage] / total, 2) if total > 0 else None,
+                "mean_ms": round(float(ms.mean()), 4),
+                "p50_ms": round(float(np.percentile(ms, 50)), 4),
+                "p95_ms": round(float(np.percentile(ms, 95)), 4),
+                "p99_ms": round(float(np.percentile(ms, 99)), 4),
+            }
+        return result
+
+
+def _timed_iter(iterator, timer: StageTimer, stage: str, unit: str):
+    """Yields from ``iterator``, recording the time spent producing each item"""
+    iterator = iter(iterator)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        timer.record(stage, time.perf_counter() - start, 1, unit)
+        yield item
+
+
+def _quiet(verbose: bool):
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _load_models(args):
+    if args.embedding_model:
+        from core.embedding_model import EmbeddingModel
+        embedding_model = EmbeddingModel(args.embedding_model, backend=args.embedding_backend)
+    else:
+        embedding_model = StubEmbeddingModel(args.embedding_dim)
+    if args.llm_model:
+        from core.local_llm import LocalLLM
+        llm = LocalLLM(args.llm_model, max_length=args.max_new_tokens, draft_model_path=args.draft_model)
+    else:
+        llm = StubLLM(max_length=args.max_new_tokens, prefill_ms_per_token=args.stub_prefill_ms,
+                      decode_ms_per_token=args.stub_decode_ms)
+    return embedding_model, llm
+
+
+def _make_queries(chunks: List[str], n_queries: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n_queries):
+        words = rng.choice(chunks).split()
+        start = rng.randrange(max(1, len(words) - 8))
+        queries.append("what about " + " ".join(words[start:start + 8]))
+    return queries
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    timer = StageTimer()
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    pdf_path = os.path.join(workdir, "synthetic.pdf")
+    make_synthetic_pdf(pdf_path, args.pages, seed=args.seed)
+    embedding_model, llm = _load_models(args)
+    processor = PDFProcessor(extract_workers=args.extract_workers)
+    db_options = dict(backend=args.vector_backend, hybrid_search=args.hybrid,
+                      quantization=args.quantization)
+
+    try:
+        with _quiet(args.verbose):
+            stages = _run_stages(args, timer, workdir, pdf_path, processor, embedding_model, llm, db_options)
+    finally:
+        processor.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "chunks": stages["chunks"],
+            "settings": {key: value for key, value in vars(args).items() if key not in ("func", "output")},
+        },
+        "stages": timer.summary(),
+    }
+
+
+def _run_stages(args, timer: StageTimer, workdir: str, pdf_path: str, processor: PDFProcessor,
+                embedding_model, llm, db_options: Dict[str, Any]) -> Dict[str, Any]:
+    # Stage by stage over one document
+    pages = list(_timed_iter(processor.iter_pages(pdf_path), timer, "extract", "pages"))
+    _, chunk_pages = make_chunker(processor, embedding_model, args.chunking, args.chunk_size, args.chunk_overlap)
+    chunks = [text for text, _, _ in _timed_iter(chunk_pages(iter(pages)), timer, "chunk", "chunks")]
+
+    vector_db = VectorDatabase(os.path.join(workdir, "db_stages"), **db_options)
+    offset = 0
+    for batch in batched(iter(chunks), args.batch_size):
+        with timer.measure("embed", len(batch), "chunks"):
+            embeddings = embedding_model.create_embeddings(batch)
+        ids = [f"chunk_{offset + i}" for i in range(len(batch))]
+        metadatas = [{"chunk_id": offset + i, "source": "synthetic.pdf"} for i in range(len(batch))]
+        with timer.measure("index", len(batch), "chunks"):
+            vector_db.add_documents(batch, embeddings, metadatas, ids=ids)
+        offset += len(batch)
+    with timer.measure("index_flush", len(chunks), "chunks"):
+        vector_db.flush()
+
+    # The whole ingestion path (hashing, dedup lookups, streaming) on a fresh store
+    ingest_db = VectorDatabase(os.path.join(workdir, "db_ingest"), **db_options)
+    with timer.measure("ingest_pdf", len(pages), "pages"):
+        ingest_pdf(pdf_path, processor, embedding_model, ingest_db, chunk_size=args.chunk_size,
+                   chunk_overlap=args.chunk_overlap, batch_size=args.batch_size, chunking=args.chunking)
+
+    queries = _make_queries(chunks, args.queries, args.seed)
+    query_embeddings = embedding_model.create_embeddings(queries)
+    for query in queries:
+        with timer.measure("embed_query", 1, "queries"):
+            embedding_model.create_embeddings([query])
+    all_similar = []
+    for query, query_embedding in zip(queries, query_embeddings):
+        with timer.measure("retrieve", 1, "queries"):
+            all_similar.append(vector_db.search_similar(query_embedding, top_k=args.top_k, query_text=query))
+    for batch in batched(iter(range(len(queries))), args.batch_size):
+        with timer.measure("retrieve_batch", len(batch), "queries"):
+            vector_db.search_similar_batch(query_embeddings[batch], top_k=args.top_k,
+                                           query_texts=[queries[i] for i in batch])
+
+    packer = ContextPacker(llm.tokenizer, max_prompt_tokens=args.prompt_token_budget)
+    prompts = []
+    for query, similar in zip(queries, all_similar):
+        with timer.measure("prompt_build", 1, "queries"):
+            context, _ = packer.pack(query, similar)
+            prompts.append(build_prompt(query, context))
+    for prompt in prompts:
+        with timer.measure("generate", 1, "queries"):
+            llm.generate_response(prompt, temperature=args.temperature)
+
+    rag = _benchmark_rag_class()(embedding_model, vector_db, llm, args.top_k, args.temperature, packer)
+    for query in queries:
+        with timer.measure("ask_question", 1, "queries"):
+            rag.ask_question(query)
+    return {"chunks": len(chunks)}
+
+
+def _benchmark_rag_class():
+    # RAGSystem pulls in torch through LocalLLM, only import it when the benchmark runs
+    from core.rag_system import RAGSystem
+
+    class BenchmarkRAGSystem(RAGSystem):
+        """RAGSystem around already built components (no model loading, no ingestion)"""
+
+        def __init__(self, embedding_model, vector_db, llm, top_k, temperature, context_packer):
+            self.embedding_model = embedding_model
+            self.vector_db = vector_db
+            self.llm = llm
+            self.top_k = top_k
+            self.temperature = temperature
+            self.context_packer = context_packer
+            # Every query should run the full pipeline
+            self.answer_cache = SemanticAnswerCache(max_entries=0)
+
+    return BenchmarkRAGSystem
+
+
+def _synthetic_library(n_docs: int, chunks_per_doc: int, dim: int, spread: float,
+                       rng: np.random.Generator) -> np.ndarray:
+    """(n_docs, chunks_per_doc, dim) vectors scattered around one random topic per document"""
+    topics = rng.standard_normal((n_docs, 1, dim), dtype=np.float32)
+    return topics + spread * rng.standard_normal((n_docs, chunks_per_doc, dim), dtype=np.float32)
+
+
+def run_library_benchmark(args) -> Dict[str, Any]:
+    """Flat versus two-level retrieval latency and recall for growing libraries"""
+    timer = StageTimer()
+    rng = np.random.default_rng(args.seed)
+    workdir = tempfile.mkdtemp(prefix="rag_bench_library_")
+    quality = {}
+    try:
+        for n_docs in sorted(int(n) for n in args.docs.split(",")):
+            vectors = _synthetic_library(n_docs, args.chunks_per_doc, args.embedding_dim, args.spread, rng)
+            with _quiet(args.verbose):
+                vector_db = VectorDatabase(os.path.join(workdir, f"db_{n_docs}"), backend=args.vector_backend,
+                                           two_level_search=True, docs_to_expand=args.docs_to_expand,
+                                           section_chunks=args.section_chunks)
+                for doc in range(n_docs):
+                    source = f"doc_{doc}.pdf"
+                    vector_db.add_documents([f"{source} chunk {i}" for i in range(args.chunks_per_doc)],
+                                            vectors[doc],
+                                            [{"chunk_id": i, "source": source} for i in range(args.chunks_per_doc)],
+                                            ids=[f"{doc}_{i}" for i in range(args.chunks_per_doc)])
+                    vector_db.update_source_vectors(source)
+                vector_db.flush()
+
+            # Queries are perturbed chunks, their document is the one that should be found
+            targets = rng.integers(0, n_docs, args.queries)
+            chunks = rng.integers(0, args.chunks_per_doc, args.queries)
+            queries = vectors[targets, chunks] + args.spread * rng.standard_normal(
+                (args.queries, args.embedding_dim), dtype=np.float32)
+            overlap = found = 0
+            for query, target in zip(queries, targets):
+                with timer.measure(f"flat_{n_docs}_docs", 1, "queries"):
+                    flat = vector_db.store.query([query], args.top_k)[0]
+                with timer.measure(f"two_level_{n_docs}_docs", 1, "queries"):
+                    two_level = vector_db.search_similar(query, top_k=args.top_k)
+                overlap += len({hit["id"] for hit in flat} & {hit["id"] for hit in two_level})
+                found += f"doc_{target}.pdf" in vector_db.select_documents([query])[0]
+            quality[n_docs] = {"recall_vs_flat": round(overlap / (args.queries * args.top_k), 4),
+                               "target_doc_selected": round(found / args.queries, 4)}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "quality": quality,
+            "settings": {key: value for key, value in vars(args).items() if key not in ("func", "output")},
+        },
+        "stages": timer.summary(),
+    }
+
+
+def compare_runs(base: Dict[str, Any], new: Dict[str, Any], threshold: float, min_ms: float) -> List[Dict[str, Any]]:
+    """One row per stage present in both runs; latency ratios > 1 + threshold are regressions"""
+    rows = []
+    for stage, before in base["stages"].items():
+        after = new["stages"].get(stage)
+        if after is None:
+            continue
+        row = {"stage": stage, "regression": False}
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            ratio = after[key] / before[key] if before[key] > 0 else None
+            row[key] = (before[key], after[key], ratio)
+            # Sub-noise timings are reported but never fail the comparison
+            if ratio is not None and max(before[key], after[key]) >= min_ms and ratio > 1 + threshold:
+                row["regression"] = True
+        if before["throughput_per_s"] and after["throughput_per_s"]:
+            ratio = after["throughput_per_s"] / before["throughput_per_s"]
+            row["throughput_per_s"] = (before["throughput_per_s"], after["throughput_per_s"], ratio)
+        rows.append(row)
+    return rows
+
+
+def _format_ratio(values) -> str:
+    before, after, ratio = values
+    return f"{before:>10.3f} -> {after:>10.3f} ({ratio:5.2f}x)" if ratio is not None else f"{before} -> {after}"
+
+
+def _cmd_run(args):
+    result = run_benchmark(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        for stage, stats in result["stages"].items():
+            print(f"{stage:<15} p50 {stats['p50_ms']:>9.3f} ms  p95 {stats['p95_ms']:>9.3f} ms  "
+                  f"p99 {stats['p99_ms']:>9.3f} ms  {stats['throughput_per_s']} {stats['unit']}/s")
+        print(f"Results written to {args.output}")
+    else:
+        print(text)
+
+
+def _cmd_library(args):
+    result = run_library_benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    stages = result["stages"]
+    print(f"{'documents':>10} {'chunks':>9} {'flat p50':>10} {'2-level p50':>12} {'speedup':>8} "
+          f"{'recall':>7} {'doc hit':>8}")
+    for n_docs, quality in result["meta"]["quality"].items():
+        flat, two_level = stages[f"flat_{n_docs}_docs"], stages[f"two_level_{n_docs}_docs"]
+        print(f"{n_docs:>10} {n_docs * args.chunks_per_doc:>9} {flat['p50_ms']:>8.3f}ms {two_level['p50_ms']:>10.3f}ms "
+              f"{flat['p50_ms'] / two_level['p50_ms']:>7.2f}x {quality['recall_vs_flat']:>7.3f} "
+              f"{quality['target_doc_selected']:>8.3f}")
+    if args.output:
+        print(f"Results written to {args.output}")
+
+
+def _cmd_compare(args):
+    with open(args.base, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, "r", encoding="utf-8") as f:
+        new = json.load(f)
+    base_settings, new_settings = base["meta"]["settings"], new["meta"]["settings"]
+    changed = sorted(key for key in set(base_settings) | set(new_settings)
+                     if base_settings.get(key) != new_settings.get(key))
+    if changed:
+        print(f"Note: runs used different settings: {', '.join(changed)}")
+    rows = compare_runs(base, new, args.threshold, args.min_ms)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else "ok"
+        print(f"{row['stage']:<15} p50 {_format_ratio(row['p50_ms'])}  p95 {_format_ratio(row['p95_ms'])}  "
+              f"p99 {_format_ratio(row['p99_ms'])}  {flag}")
+    regressions = [row["stage"] for row in rows if row["regression"]]
+    if regressions:
+        print(f"Regressions (> {args.threshold:.0%} slower): {', '.join(regressions)}")
+        sys.exit(1)
+    print("No regressions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline RAG pipeline benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmark and report JSON")
+    run.add_argument("--pages", type=int, default=100, help="pages of the synthetic PDF")
+    run.add_argument("--queries", type=int, default=50)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--chunk-size", type=int, default=300)
+    run.add_argument("--chunk-overlap", type=int, default=50)
+    run.add_argument("--chunking", default="words", choices=CHUNKING_MODES)
+    run.add_argument("--batch-size", type=int, default=64)
+    run.add_argument("--extract-workers", type=int, default=1)
+    run.add_argument("--top-k", type=int, default=2)
+    run.add_argument("--prompt-token-budget", type=int, default=1024)
+    run.add_argument("--temperature", type=float, default=0.3)
+    run.add_argument("--max-new-tokens", type=int, default=64)
+    run.add_argument("--vector-backend", default="numpy", choices=["numpy", "chroma"])
+    run.add_argument("--quantization", default="none", choices=["none", "int8", "binary"])
+    run.add_argument("--hybrid", action="store_true", help="fuse BM25 with vector search")
+    run.add_argument("--embedding-dim", type=int, default=384, help="stub embedding size")
+    run.add_argument("--embedding-model", help="real embedding model path instead of the stub")
+    run.add_argument("--embedding-backend", default="torch")
+    run.add_argument("--llm-model", help="real LLM path instead of the stub")
+    run.add_argument("--draft-model", help="draft model for speculative decoding with --llm-model")
+    run.add_argument("--stub-prefill-ms", type=float, default=0.0, help="simulated cost per prompt token")
+    run.add_argument("--stub-decode-ms", type=float, default=0.0, help="simulated cost per generated token")
+    run.add_argument("--output", help="write the JSON report here instead of stdout")
+    run.add_argument("--verbose", action="store_true", help="keep the pipeline's own log output")
+    run.set_defaults(func=_cmd_run)
+
+    library = commands.add_parser("library", help="flat vs two-level retrieval as the library grows")
+    library.add_argument("--docs", default="10,100,1000", help="comma-separated library sizes (documents)")
+    library.add_argument("--chunks-per-doc", type=int, default=50)
+    library.add_argument("--docs-to-expand", type=int, default=5)
+    library.add_argument("--section-chunks", type=int, default=0, help="also store section vectors")
+    library.add_argument("--queries", type=int, default=200)
+    library.add_argument("--top-k", type=int, default=5)
+    library.add_argument("--embedding-dim", type=int, default=384)
+    library.add_argument("--spread", type=float, default=0.8, help="chunk noise around the document topic")
+    library.add_argument("--vector-backend", default="numpy", choices=["numpy", "chroma"])
+    library.add_argument("--seed", type=int, default=0)
+    library.add_argument("--output", help="also write the JSON report here")
+    library.add_argument("--verbose", action="store_true", help="keep the pipeline's own log output")
+    library.set_defaults(func=_cmd_library)
+
+    compare = commands.add_parser("compare", help="compare two JSON reports")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown")
+    compare.add_argument("--min-ms", type=float, default=0.05, help="ignore latencies below this")
+    compare.set_defaults(func=_cmd_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
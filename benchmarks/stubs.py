@@ -0,0 +1,112 @@
+import re
+import time
+import zlib
+from typing import List, Dict, Any, Iterator
+
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\S+")
+
+
+def _stable_hash(text: str) -> int:
+    # Python's hash() is salted per process, runs must be comparable
+    return zlib.crc32(text.encode("utf-8"))
+
+
+class StubEmbeddingModel:
+    """Deterministic feature-hashing embeddings with the EmbeddingModel interface.
+
+    Texts sharing words get similar vectors, so retrieval results are
+    meaningful without downloading a model.
+    """
+
+    def __init__(self, embedding_size: int = 384):
+        self.embedding_size = embedding_size
+        self.model_path = f"stub-hashing-{embedding_size}"
+        self.model_id = self.model_path
+        self.tokenizer = StubTokenizer()
+        self.max_seq_length = 256
+
+    def create_embeddings(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.embedding_size), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _TOKEN_RE.findall(text.lower()):
+                h = _stable_hash(token)
+                vectors[row, h % self.embedding_size] += 1.0 if h & (1 << 31) else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return {}
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with the parts of the Hugging Face tokenizer API the repo uses"""
+
+    is_fast = True
+    bos_token_id = 1
+    vocab_size = 32000
+
+    def __call__(self, text, add_special_tokens: bool = True, return_offsets_mapping: bool = False,
+                 **kwargs) -> Dict[str, list]:
+        if isinstance(text, list):
+            encoded = [self(t, add_special_tokens, return_offsets_mapping) for t in text]
+            return {key: [e[key] for e in encoded] for key in encoded[0]} if encoded else {"input_ids": []}
+        matches = list(_TOKEN_RE.finditer(text))
+        ids = [2 + _stable_hash(m.group()) % (self.vocab_size - 2) for m in matches]
+        offsets = [(m.start(), m.end()) for m in matches]
+        if add_special_tokens:
+            ids = [self.bos_token_id] + ids
+            offsets = [(0, 0)] + offsets
+        encoded = {"input_ids": ids}
+        if return_offsets_mapping:
+            encoded["offset_mapping"] = offsets
+        return encoded
+
+    def decode(self, ids: List[int], skip_special_tokens: bool = True) -> str:
+        return " ".join(f"tok{i}" for i in ids if not (skip_special_tokens and i == self.bos_token_id))
+
+
+class StubLLM:
+    """Deterministic LocalLLM stand-in that answers by echoing context words.
+
+    ``prefill_ms_per_token`` and ``decode_ms_per_token`` add a simulated
+    compute cost so the rest of the pipeline can be measured against a
+    realistic generation time; both default to zero.
+    """
+
+    def __init__(self, max_length: int = 64, prefill_ms_per_token: float = 0.0,
+                 decode_ms_per_token: float = 0.0):
+        self.max_length = max_length
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.tokenizer = StubTokenizer()
+
+    def _answer_tokens(self, prompt: str) -> List[str]:
+        words = _TOKEN_RE.findall(prompt)
+        start = _stable_hash(prompt) % max(1, len(words))
+        return (words[start:] + words[:start])[:self.max_length]
+
+    def _simulate(self, prompt: str, new_tokens: int):
+        cost_ms = (len(self.tokenizer(prompt)["input_ids"]) * self.prefill_ms_per_token +
+                   new_tokens * self.decode_ms_per_token)
+        if cost_ms > 0:
+            time.sleep(cost_ms / 1000.0)
+
+    def generate_response(self, prompt: str, temperature: float = 0.3, stats: Dict[str, Any] = None) -> str:
+        tokens = self._answer_tokens(prompt)
+        self._simulate(prompt, len(tokens))
+        return " ".join(tokens)
+
+    def generate_batch(self, prompts: List[str], temperature: float = 0.3,
+                       stats: Dict[str, Any] = None) -> List[str]:
+        return [self.generate_response(prompt, temperature) for prompt in prompts]
+
+    def stream_response(self, prompt: str, temperature: float = 0.3,
+                        stats: Dict[str, Any] = None) -> Iterator[str]:
+        self._simulate(prompt, 0)
+        for token in self._answer_tokens(prompt):
+            if self.decode_ms_per_token > 0:
+                time.sleep(self.decode_ms_per_token / 1000.0)
+            yield token + " "
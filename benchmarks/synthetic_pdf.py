@@ -0,0 +1,65 @@
+import random
+from typing import List
+
+# Mix of prose and the kind of identifiers the hybrid (BM25) search is meant for
+_WORDS = """
+the model layer network training gradient descent loss function weight bias input output
+tensor batch epoch learning rate optimizer dropout activation convolution attention embedding
+vector matrix dimension feature dataset validation accuracy precision recall inference latency
+memory cache thread process queue buffer stream token sequence context window chunk page
+""".split()
+_IDENTIFIERS = ["torch.nn.Linear", "ERR_CONN-42", "v4.2.1", "keras.layers.Dense", "HTTP-503", "CUDA_VISIBLE_DEVICES"]
+
+
+def synthetic_pages(n_pages: int, lines_per_page: int = 40, words_per_line: int = 12,
+                    seed: int = 0) -> List[List[str]]:
+    """Deterministic page text: ``lines_per_page`` lines of random words per page"""
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(n_pages):
+        lines = []
+        for _ in range(lines_per_page):
+            words = [rng.choice(_WORDS) for _ in range(words_per_line)]
+            if rng.random() < 0.1:
+                words[rng.randrange(words_per_line)] = rng.choice(_IDENTIFIERS)
+            lines.append(" ".join(words))
+        pages.append(lines)
+    return pages
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: List[List[str]]):
+    """Minimal text-only PDF (Helvetica, one line per entry) readable by PyPDF2"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 50 760 Td 12 TL " + " ".join(f"({_escape(line)}) '" for line in lines) + " ET"
+        content = content.encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = (b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % k for k in kids) +
+                  b"] /Count %d >>" % len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def make_synthetic_pdf(path: str, n_pages: int, seed: int = 0, **kwargs) -> List[List[str]]:
+    pages = synthetic_pages(n_pages, seed=seed, **kwargs)
+    write_pdf(path, pages)
+    return pages
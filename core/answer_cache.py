@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """LRU cache of answers looked up by cosine similarity of question embeddings.
+
+    Entries remember the knowledge base version they were answered against
+    and are ignored (and dropped) once the version changes.
+    """
+
+    def __init__(self, max_entries: int = 256, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._next_id = 0
+        self._matrix = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, embedding, kb_version: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._drop_stale(kb_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries)
+                self._matrix = np.vstack([self._entries[i]["embedding"] for i in self._matrix_ids])
+            scores = self._matrix @ self._normalize(embedding)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            return dict(self._entries[entry_id]["result"], similarity=float(scores[best]))
+
+    def store(self, embedding, kb_version: str, result: Dict[str, Any]):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._drop_stale(kb_version)
+            self._entries[self._next_id] = {
+                "embedding": self._normalize(embedding),
+                "version": kb_version,
+                "result": result,
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def _drop_stale(self, kb_version: str):
+        stale = [i for i, entry in self._entries.items() if entry["version"] != kb_version]
+        for i in stale:
+            del self._entries[i]
+        if stale:
+            self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
@@ -0,0 +1,186 @@
+import csv
+import json
+import os
+import time
+from collections import deque
+from typing import List, Dict, Any, Callable, Optional, Set
+
+from core.context_packer import QuestionTooLong
+from core.metrics import metrics, console, log_event
+from core.prompt import build_prompt, GENERATION_ERROR_MESSAGE
+
+
+def read_questions(path: str) -> List[Dict[str, Any]]:
+    """Questions from a .jsonl file (objects or plain strings) or a .csv file with a "question" column.
+
+    Every question gets an "id" (the given one, else its 1-based row number)
+    which is what a resumed run uses to skip answered questions. Other
+    fields, such as an expected answer, are passed through to the output.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if ext == ".csv":
+            rows = list(csv.DictReader(f))
+        elif ext in (".jsonl", ".ndjson"):
+            rows = [json.loads(line) for line in f if line.strip()]
+            rows = [{"question": row} if isinstance(row, str) else row for row in rows]
+        else:
+            raise ValueError(f"Unsupported questions file (use .jsonl or .csv): {path}")
+
+    questions, seen = [], set()
+    for row_num, row in enumerate(rows, start=1):
+        question = str(row.get("question") or "").strip()
+        if not question:
+            continue
+        question_id = str(row.get("id") or row_num)
+        if question_id in seen:
+            raise ValueError(f"Duplicate question id '{question_id}' in {path}")
+        seen.add(question_id)
+        questions.append(dict(row, id=question_id, question=question))
+    return questions
+
+
+def completed_ids(output_path: str) -> Set[str]:
+    """Ids already in an output file; a line cut off by an interrupted run is removed"""
+    if not os.path.exists(output_path):
+        return set()
+    done, good_end = set(), 0
+    with open(output_path, "rb") as f:
+        for line in f:
+            try:
+                done.add(str(json.loads(line)["id"]))
+            except (ValueError, KeyError):
+                break
+            good_end += len(line)
+    if good_end < os.path.getsize(output_path):
+        with open(output_path, "r+b") as f:
+            f.truncate(good_end)
+    return done
+
+
+def available_memory_bytes() -> Optional[int]:
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def generation_batch_size(llm, max_batch_size: int = 8, memory_fraction: float = 0.5) -> int:
+    """Largest batch whose key/value cache fits in ``memory_fraction`` of the available memory"""
+    per_token = llm.kv_cache_bytes_per_token() if hasattr(llm, "kv_cache_bytes_per_token") else 0
+    available = available_memory_bytes()
+    if not per_token or not available:
+        return max(1, max_batch_size)
+    tokens = getattr(llm, "max_input_tokens", 1024) + getattr(llm, "max_length", 256)
+    return max(1, min(max_batch_size, int(available * memory_fraction) // (per_token * tokens)))
+
+
+def run_batch_qa(
+        questions: List[Dict[str, Any]],
+        output_path: str,
+        embedding_model,
+        vector_db,
+        llm,
+        context_packer,
+        top_k: int = 2,
+        temperature: float = 0.3,
+        batch_size: int = 0,
+        max_batch_size: int = 8,
+        memory_fraction: float = 0.5,
+        resume: bool = True,
+        progress: Callable[[Dict[str, Any]], None] = None
+) -> Dict[str, Any]:
+    """Answer ``questions`` and append one JSON line per answer to ``output_path``.
+
+    All pending questions are embedded in one call and retrieved in one
+    vectorized query; answers are generated in left-padded batches of
+    ``batch_size`` (0 = sized to the available memory), shortest prompts
+    first so rows of a batch need little padding. Each batch is written as
+    soon as it is done, so an interrupted run resumes where it stopped
+    unless ``resume`` is False.
+
+    A failed batch (typically out of memory) is retried at half the size,
+    which is kept for the rest of the run. Questions that still fail on
+    their own are not written, so the next run retries them. Questions too
+    long for the prompt token budget are skipped and counted as failed.
+    """
+    started = time.perf_counter()
+    done = completed_ids(output_path) if resume else set()
+    if not resume and os.path.exists(output_path):
+        open(output_path, "w").close()
+    todo = [q for q in questions if q["id"] not in done]
+    size = batch_size or generation_batch_size(llm, max_batch_size, memory_fraction)
+    stats = {"questions": len(questions), "skipped": len(questions) - len(todo), "answered": 0,
+             "failed": 0, "batch_size": size}
+    if not todo:
+        console(f"All {len(questions)} questions already answered in {output_path}")
+        return stats
+    console(f"Answering {len(todo)} questions ({stats['skipped']} done before) in batches of {size}")
+    metrics.inc("rag_queries_total", len(todo), entry="batch")
+
+    texts = [q["question"] for q in todo]
+    shared = {}
+    with metrics.stage_timer("embed", shared):
+        query_embeddings = embedding_model.create_embeddings(texts)
+    with metrics.stage_timer("retrieve", shared):
+        all_similar = vector_db.search_similar_batch(query_embeddings, top_k=top_k, query_texts=texts)
+    # Embedding and retrieval ran once for all questions, each question gets its share
+    shared = {stage: round(ms / len(todo), 3) for stage, ms in shared.items()}
+
+    prompts, contexts, timings = [], [], []
+    for item, question, similar in zip(todo, texts, all_similar):
+        timing = dict(shared)
+        try:
+            with metrics.stage_timer("prompt_build", timing):
+                context, packed = context_packer.pack(question, similar)
+                prompts.append(build_prompt(question, context))
+        except QuestionTooLong as e:
+            stats["failed"] += 1
+            console(f"Question {item['id']} skipped: {e}")
+            prompts.append(None)
+            packed = None
+        contexts.append(packed)
+        timings.append(timing)
+
+    answerable = [i for i in range(len(todo)) if prompts[i] is not None]
+    pending = deque(sorted(answerable, key=lambda i: len(prompts[i])))
+    with open(output_path, "a", encoding="utf-8") as out:
+        while pending:
+            batch = [pending.popleft() for _ in range(min(size, len(pending)))]
+            batch_timing, generation = {}, {}
+            with metrics.stage_timer("generate", batch_timing):
+                answers = llm.generate_batch([prompts[i] for i in batch], temperature=temperature, stats=generation)
+            failed = [i for i, answer in zip(batch, answers) if answer == GENERATION_ERROR_MESSAGE]
+            if failed and len(batch) > 1:
+                size = max(1, len(batch) // 2)
+                console(f"{len(failed)} of {len(batch)} generations failed, retrying in batches of {size}")
+                pending.extendleft(reversed(failed))
+            elif failed:
+                stats["failed"] += 1
+                console(f"Question {todo[batch[0]]['id']} failed, it is retried on the next run")
+            for i, answer in zip(batch, answers):
+                if i in failed:
+                    continue
+                record = dict(todo[i], answer=answer, context_chunks=contexts[i],
+                              timings={**timings[i], "generate_batch_ms": batch_timing["generate_ms"],
+                                       "batch_size": len(batch), **generation})
+                out.write(json.dumps(record, default=str) + "\n")
+                stats["answered"] += 1
+            out.flush()
+            stats["batch_size"] = size
+            if progress:
+                progress(dict(stats))
+
+    stats["total_s"] = round(time.perf_counter() - started, 3)
+    stats["questions_per_sec"] = round(stats["answered"] / stats["total_s"], 3) if stats["total_s"] else 0.0
+    console(f"Answered {stats['answered']} questions in {stats['total_s']}s "
+            f"({stats['questions_per_sec']} questions/sec) -> {output_path}")
+    log_event("query_batch", entry="batch", **stats, **shared)
+    return stats
@@ -0,0 +1,70 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Any
+
+
+class MicroBatchScheduler:
+    """Collects items submitted within a short window and processes them as one batch.
+
+    A single background thread waits for the first item, then keeps taking
+    items until ``max_batch_size`` is reached or ``max_wait_ms`` has passed
+    since the first one arrived. ``process_batch`` must return one result
+    per item, in order.
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 4, max_wait_ms: float = 25):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def _collect(self) -> List[Any]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.process_batch(items))
+                if len(results) != len(batch):
+                    # zip would stop early and leave the remaining callers waiting forever
+                    raise RuntimeError(f"process_batch returned {len(results)} results for {len(batch)} items")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            self.batches += 1
+            self.items += len(batch)
+
+    def get_stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
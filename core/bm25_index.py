@@ -0,0 +1,211 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple, Iterable, Optional
+
+import numpy as np
+
+# Compound tokens (torch.nn.Linear, ERR_CONN-42, 4.2.1) are indexed whole and by their parts
+_TOKEN_RE = re.compile(r"[a-z0-9_]+(?:[.\-:/][a-z0-9_]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token not in _STOPWORDS:
+            tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p not in _STOPWORDS)
+    return tokens
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """In-process BM25 inverted index persisted next to the vector store.
+
+    Documents are kept as arrays of (term id, term frequency). Searches use
+    a term-major CSR copy of those arrays that is rebuilt lazily after
+    changes, so adding or removing chunks costs no more than tokenizing
+    them and a query is a few vectorized numpy operations per query term.
+    The index is saved as an uncompressed .npz file: call ``save`` after a
+    batch of changes, ``reload_if_changed`` picks up saves from other
+    processes.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._loaded_mtime = None
+        self.dirty = False
+        self._reset()
+        self.load()
+
+    def _reset(self):
+        self.terms: List[str] = []
+        self.term_ids: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self.doc_index: Dict[str, int] = {}
+        # Per document, aligned with doc_ids; None marks a removed document until compaction
+        self._doc_terms: List[Optional[np.ndarray]] = []
+        self._doc_tfs: List[Optional[np.ndarray]] = []
+        self._csr = None
+
+    def __len__(self) -> int:
+        return len(self.doc_index)
+
+    def load(self):
+        with self._lock:
+            self._reset()
+            if not os.path.exists(self.path):
+                return
+            with np.load(self.path, allow_pickle=False) as data:
+                self.terms = data["terms"].tolist()
+                self.doc_ids = data["doc_ids"].tolist()
+                offsets = data["doc_offsets"]
+                flat_terms = data["doc_terms"]
+                flat_tfs = data["doc_tfs"].astype(np.float32)
+            self.term_ids = {term: i for i, term in enumerate(self.terms)}
+            self.doc_index = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+            self._doc_terms = np.split(flat_terms, offsets[1:-1]) if self.doc_ids else []
+            self._doc_tfs = np.split(flat_tfs, offsets[1:-1]) if self.doc_ids else []
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+            self.dirty = False
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            self._compact()
+            lengths = np.array([len(t) for t in self._doc_terms], dtype=np.int64)
+            offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=offsets[1:])
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    terms=np.array(self.terms, dtype=str),
+                    doc_ids=np.array(self.doc_ids, dtype=str),
+                    doc_offsets=offsets,
+                    doc_terms=np.concatenate(self._doc_terms) if self._doc_terms else np.zeros(0, np.int32),
+                    doc_tfs=(np.concatenate(self._doc_tfs) if self._doc_tfs else np.zeros(0)).astype(np.uint16)
+                )
+            os.replace(tmp_path, self.path)
+            self._loaded_mtime = os.stat(self.path).st_mtime_ns
+            self.dirty = False
+
+    def reload_if_changed(self):
+        with self._lock:
+            if self.dirty or not os.path.exists(self.path):
+                return
+            if os.stat(self.path).st_mtime_ns != self._loaded_mtime:
+                self.load()
+
+    def _term_id(self, term: str) -> int:
+        tid = self.term_ids.get(term)
+        if tid is None:
+            tid = len(self.terms)
+            self.term_ids[term] = tid
+            self.terms.append(term)
+        return tid
+
+    def add(self, ids: List[str], texts: List[str]):
+        with self._lock:
+            for doc_id, text in zip(ids, texts):
+                self._remove(doc_id)
+                counts = Counter(tokenize(text))
+                self.doc_index[doc_id] = len(self.doc_ids)
+                self.doc_ids.append(doc_id)
+                self._doc_terms.append(np.fromiter((self._term_id(t) for t in counts), dtype=np.int32,
+                                                   count=len(counts)))
+                self._doc_tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            self._csr = None
+            self.dirty = True
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            self._csr = None
+            self.dirty = True
+
+    def _remove(self, doc_id: str):
+        idx = self.doc_index.pop(doc_id, None)
+        if idx is not None:
+            self._doc_terms[idx] = None
+            self._doc_tfs[idx] = None
+
+    def _compact(self):
+        keep = [i for i, terms in enumerate(self._doc_terms) if terms is not None]
+        if len(keep) == len(self.doc_ids):
+            return
+        self.doc_ids = [self.doc_ids[i] for i in keep]
+        self._doc_terms = [self._doc_terms[i] for i in keep]
+        self._doc_tfs = [self._doc_tfs[i] for i in keep]
+        self.doc_index = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+            self.dirty = True
+
+    def _build(self):
+        self._compact()
+        lengths = np.array([len(t) for t in self._doc_terms], dtype=np.int64)
+        flat_terms = np.concatenate(self._doc_terms)
+        flat_tfs = np.concatenate(self._doc_tfs)
+        flat_docs = np.repeat(np.arange(len(self.doc_ids), dtype=np.int32), lengths)
+        order = np.argsort(flat_terms, kind="stable")
+        term_offsets = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(flat_terms, minlength=len(self.terms)), out=term_offsets[1:])
+        doc_len = np.array([tfs.sum() for tfs in self._doc_tfs], dtype=np.float32)
+        avg_len = float(doc_len.mean()) or 1.0
+        norm = self.k1 * (1.0 - self.b + self.b * doc_len / avg_len)
+        self._csr = (term_offsets, flat_docs[order], flat_tfs[order], norm)
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        with self._lock:
+            if not self.doc_index:
+                return []
+            if self._csr is None:
+                self._build()
+            term_offsets, post_docs, post_tfs, norm = self._csr
+            n_docs = len(self.doc_ids)
+            scores = None
+            for term, query_tf in Counter(tokenize(query)).items():
+                tid = self.term_ids.get(term)
+                if tid is None:
+                    continue
+                start, end = term_offsets[tid], term_offsets[tid + 1]
+                df = end - start
+                if not df:
+                    continue
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                docs, tfs = post_docs[start:end], post_tfs[start:end]
+                if scores is None:
+                    scores = np.zeros(n_docs, dtype=np.float32)
+                # A document appears once per term posting, so plain fancy-index addition is safe
+                scores[docs] += query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm[docs])
+            if scores is None:
+                return []
+            candidates = np.flatnonzero(scores)
+            if len(candidates) > top_k:
+                candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            return [(self.doc_ids[i], float(scores[i])) for i in candidates]
@@ -0,0 +1,93 @@
+import json
+from typing import List, Dict, Any, Iterable
+
+import chromadb
+import numpy as np
+
+from core.vector_store import VectorStore, MAX_BATCH, DEFAULT_COLLECTION
+
+
+class ChromaStore(VectorStore):
+    """Chroma persistent collection with an HNSW cosine index"""
+
+    def __init__(self, persist_directory: str, name: str = DEFAULT_COLLECTION):
+        self.name = name
+        self.client = chromadb.PersistentClient(path=persist_directory)
+        self.collection = self._open_collection()
+
+    def _open_collection(self):
+        return self.client.get_or_create_collection(
+            name=self.name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        for start in range(0, len(ids), MAX_BATCH):
+            end = start + MAX_BATCH
+            self.collection.upsert(
+                embeddings=np.asarray(embeddings[start:end], dtype=np.float32),
+                documents=documents[start:end],
+                metadatas=metadatas[start:end],
+                ids=ids[start:end]
+            )
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        for start in range(0, len(ids), MAX_BATCH):
+            end = start + MAX_BATCH
+            self.collection.update(ids=ids[start:end], metadatas=metadatas[start:end])
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None,
+            include: Iterable[str] = ("documents", "metadatas"), limit: int = None,
+            offset: int = 0) -> Dict[str, list]:
+        include = list(include)
+        if ids is None:
+            found = self.collection.get(where=where, include=include, limit=limit, offset=offset or None)
+            return {key: found[key] for key in ["ids"] + include}
+        merged = {key: [] for key in ["ids"] + include}
+        for start in range(0, len(ids), MAX_BATCH):
+            found = self.collection.get(ids=ids[start:start + MAX_BATCH], where=where, include=include)
+            for key in merged:
+                merged[key].extend(found[key])
+        return merged
+
+    def query(self, query_embeddings, top_k: int, where=None) -> List[List[Dict]]:
+        if isinstance(where, list):
+            # One call per distinct filter
+            groups = {}
+            for q, clause in enumerate(where):
+                groups.setdefault(json.dumps(clause, sort_keys=True), []).append(q)
+            all_formatted = [None] * len(query_embeddings)
+            for key, members in groups.items():
+                hits = self.query([query_embeddings[q] for q in members], top_k, where=json.loads(key) or None)
+                for q, formatted in zip(members, hits):
+                    all_formatted[q] = formatted
+            return all_formatted
+        results = self.collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
+            n_results=top_k,
+            where=where
+        )
+        all_formatted = []
+        for q in range(len(query_embeddings)):
+            formatted = []
+            for i in range(len(results['documents'][q])):
+                formatted.append({
+                    'document': results['documents'][q][i],
+                    'metadata': results['metadatas'][q][i] if results['metadatas'] else {},
+                    'distance': float(results['distances'][q][i]),
+                    'id': results['ids'][q][i]
+                })
+            all_formatted.append(formatted)
+        return all_formatted
+
+    def delete(self, ids: List[str]):
+        for start in range(0, len(ids), MAX_BATCH):
+            self.collection.delete(ids=ids[start:start + MAX_BATCH])
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def clear(self):
+        # Chroma rejects an empty where filter, dropping the collection is also faster
+        self.client.delete_collection(self.collection.name)
+        self.collection = self._open_collection()
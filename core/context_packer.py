@@ -0,0 +1,146 @@
+from typing import List, Dict, Any, Tuple
+
+from core.prompt import build_prompt
+
+# Separator between context pieces, as used by build_prompt callers
+SEPARATOR = "\n\n"
+
+
+class QuestionTooLong(ValueError):
+    """The question alone does not fit the prompt token budget"""
+
+
+def _word_overlap(left: List[str], right: List[str], min_words: int) -> int:
+    """Length of the longest suffix of ``left`` that is also a prefix of ``right``"""
+    for k in range(min(len(left), len(right)), min_words - 1, -1):
+        if left[-k:] == right[:k]:
+            return k
+    return 0
+
+
+class ContextPacker:
+    """Turns retrieved chunks into a context that fits the prompt token budget.
+
+    Neighbouring chunks of the same source are merged without their shared
+    overlap words, duplicates are dropped, and pieces are added in relevance
+    order until ``max_prompt_tokens`` (counted with the LLM tokenizer over
+    the full prompt, question included) would be exceeded. The last piece
+    that does not fit whole is cut at a token boundary. A question that
+    does not fit even without context raises QuestionTooLong.
+    """
+
+    def __init__(self, tokenizer, max_prompt_tokens: int = 1024, min_piece_tokens: int = 32,
+                 min_overlap_words: int = 5):
+        self.tokenizer = tokenizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.min_piece_tokens = min_piece_tokens
+        self.min_overlap_words = min_overlap_words
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=True)["input_ids"])
+
+    def check_question(self, question: str) -> int:
+        """Tokens left for context; raises QuestionTooLong when the prompt without context is over budget"""
+        budget = self.max_prompt_tokens - self.count_tokens(build_prompt(question, ""))
+        if budget < 0:
+            # The LLM would truncate the prompt and cut off the question itself
+            raise QuestionTooLong(f"Question is too long: the prompt needs {self.max_prompt_tokens - budget} "
+                                  f"tokens without any context, the budget is {self.max_prompt_tokens}")
+        return budget
+
+    def pack(self, question: str, similar: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Returns the context string and the (merged) chunks it contains, best first"""
+        budget = self.check_question(question)
+        pieces = self._merge_neighbours(similar)
+        separator_tokens = len(self.tokenizer(SEPARATOR, add_special_tokens=False)["input_ids"])
+
+        used, texts = [], []
+        for piece in pieces:
+            cost = len(self.tokenizer(piece["document"], add_special_tokens=False)["input_ids"])
+            if texts:
+                cost += separator_tokens
+            if cost <= budget:
+                used.append(piece)
+                texts.append(piece["document"])
+                budget -= cost
+                continue
+            room = budget - (separator_tokens if texts else 0)
+            if room >= self.min_piece_tokens:
+                piece = dict(piece, document=self._truncate(piece["document"], room), truncated=True)
+                used.append(piece)
+                texts.append(piece["document"])
+            break
+
+        context = SEPARATOR.join(texts)
+        # Token counts of pieces do not always add up exactly at the seams, shrink until it fits
+        while texts and self.count_tokens(build_prompt(question, context)) > self.max_prompt_tokens:
+            words = texts[-1].split()
+            keep = max(0, len(words) - max(1, len(words) // 10))
+            if keep == 0:
+                texts.pop()
+                used.pop()
+            else:
+                texts[-1] = " ".join(words[:keep])
+                used[-1] = dict(used[-1], document=texts[-1], truncated=True)
+            context = SEPARATOR.join(texts)
+        return context, used
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        if getattr(self.tokenizer, "is_fast", False):
+            encoded = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            offsets = encoded["offset_mapping"]
+            if len(offsets) <= max_tokens:
+                return text
+            return text[:offsets[max_tokens - 1][1]]
+        ids = self.tokenizer(text, add_special_tokens=False)["input_ids"][:max_tokens]
+        return self.tokenizer.decode(ids, skip_special_tokens=True)
+
+    def _merge_neighbours(self, similar: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        groups = []
+        for rank, doc in enumerate(similar):
+            metadata = doc.get("metadata") or {}
+            chunk_id = metadata.get("chunk_id")
+            words = doc["document"].split()
+            if any(doc["document"] in g["document"] for g in groups):
+                continue
+            groups.append({
+                "document": doc["document"],
+                "metadata": metadata,
+                "distance": doc.get("distance", 0.0),
+                "id": doc.get("id"),
+                "ids": [doc.get("id")],
+                "rank": rank,
+                "source": metadata.get("source"),
+                "first": chunk_id,
+                "last": chunk_id,
+                "words": words,
+            })
+
+        merged = True
+        while merged:
+            merged = False
+            for a in groups:
+                for b in groups:
+                    if a is b or a["source"] != b["source"] or a["last"] is None or b["first"] is None:
+                        continue
+                    if b["first"] != a["last"] + 1:
+                        continue
+                    overlap = _word_overlap(a["words"], b["words"], self.min_overlap_words)
+                    a["words"] = a["words"] + b["words"][overlap:]
+                    a["document"] = " ".join(a["words"])
+                    a["last"] = b["last"]
+                    a["ids"] += b["ids"]
+                    a["rank"] = min(a["rank"], b["rank"])
+                    a["distance"] = min(a["distance"], b["distance"])
+                    groups.remove(b)
+                    merged = True
+                    break
+                if merged:
+                    break
+
+        groups.sort(key=lambda g: g["rank"])
+        return [
+            {"document": g["document"], "metadata": g["metadata"], "distance": g["distance"],
+             "id": g["id"], "merged_ids": g["ids"]}
+            for g in groups
+        ]
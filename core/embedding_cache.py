@@ -0,0 +1,143 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+
+
+# last_used is only rewritten for entries not used within this many seconds: LRU order at
+# that granularity is enough for eviction, and repeated hits do not write (and commit) at all
+TOUCH_INTERVAL_S = 60.0
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class EmbeddingCache:
+    """SQLite-backed cache of float32 embedding vectors with an LRU size cap.
+
+    Several processes (API and UI) may share one cache directory, so the
+    size tracked here is only an estimate between writes; it is recomputed
+    from the table before evicting and after every tenth of the cap written.
+    """
+
+    def __init__(self, cache_dir: str, model_id: str, max_mb: float = 512):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.model_id = model_id
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(os.path.join(cache_dir, "embeddings.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, vec BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self.total_bytes = 0
+        self._written_since_sync = 0
+        self._sync_size()
+
+    def _sync_size(self):
+        """Size of all stored vectors, including those written by other processes; called with the lock held"""
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vec)), 0) FROM embeddings").fetchone()[0]
+        self._written_since_sync = 0
+
+    def _key(self, text: str) -> bytes:
+        raw = f"{self.model_id}\0{normalize_text(text)}".encode("utf-8")
+        return hashlib.sha256(raw).digest()
+
+    def get_many(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        keys = [self._key(t) for t in texts]
+        found = {}
+        stale_keys = []
+        now = time.time()
+        stale_before = now - TOUCH_INTERVAL_S
+        with self._lock:
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vec, last_used FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, blob, last_used in rows:
+                    found[key] = blob
+                    if last_used < stale_before:
+                        stale_keys.append(key)
+            if stale_keys:
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in stale_keys])
+                self._conn.commit()
+            results = [np.frombuffer(found[k], dtype=np.float32) if k in found else None for k in keys]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(keys) - hits
+        return results
+
+    def put_many(self, texts: List[str], vectors: np.ndarray):
+        now = time.time()
+        rows = [
+            (self._key(t), np.asarray(v, dtype=np.float32).tobytes(), now)
+            for t, v in zip(texts, vectors)
+        ]
+        written = sum(len(blob) for _, blob, _ in rows)
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            # Replaced rows make this an overestimate, other processes' writes an underestimate
+            self.total_bytes += written
+            self._written_since_sync += written
+            if self.total_bytes > self.max_bytes or self._written_since_sync > self.max_bytes // 10:
+                self._sync_size()
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Trim to 90% of the cap so a full cache does not evict on every insert
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, LENGTH(vec) FROM embeddings ORDER BY last_used LIMIT 500"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            doomed = []
+            for key, size in rows:
+                if self.total_bytes <= target:
+                    break
+                doomed.append((key,))
+                self.total_bytes -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+            self.evictions += len(doomed)
+        self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size_mb": round(self.total_bytes / (1024 * 1024), 2),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._sync_size()
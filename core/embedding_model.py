@@ -1,14 +1,69 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from typing import List, Dict, Any
+import numpy as np
+
+from core.embedding_cache import EmbeddingCache
+from core.metrics import console, is_quiet
+
+PROGRESS_BAR_MIN_TEXTS = 256
+
 
 class EmbeddingModel:
-    def __init__(self, model_path: str = "sentence-transformers/all-MiniLM-L6-v2"):
-        print(f"🔧 Loading embedding model: {model_path}")
-        self.model = SentenceTransformer(model_path, device="cpu")
-        self.embedding_size = self.model.get_sentence_embedding_dimension()
-        print(f"Embedding model ready. Dim: {self.embedding_size}")
-
-    def create_embeddings(self, texts: List[str]) -> List[List[float]]:
-        print(f"Creating embeddings for {len(texts)} texts...")
-        embeddings = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=True)
-        return embeddings.tolist()
\ No newline at end of file
+    def __init__(self, model_path: str = "sentence-transformers/all-MiniLM-L6-v2",
+                 cache_dir: str = None, cache_max_mb: float = 512,
+                 backend: str = "torch", onnx_quantize: bool = False):
+        console(f"🔧 Loading embedding model: {model_path} ({backend})")
+        # Imported here: sentence-transformers/transformers take seconds to import
+        from transformers.utils import logging as hf_logging
+        if is_quiet():
+            hf_logging.disable_progress_bar()
+        self.model_path = model_path
+        self.backend = backend
+        if backend == "onnx":
+            from core.onnx_embedding import OnnxEmbeddingBackend
+            self.model = OnnxEmbeddingBackend(model_path, quantize=onnx_quantize)
+            self.embedding_size = self.model.embedding_size
+            # ONNX vectors differ slightly from PyTorch ones, keep them apart in the cache
+            self.model_id = f"{model_path}|onnx{'-int8' if onnx_quantize else ''}"
+        elif backend == "torch":
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(model_path, device="cpu")
+            self.embedding_size = self.model.get_sentence_embedding_dimension()
+            self.model_id = model_path
+        else:
+            raise ValueError(f"Unknown embedding backend: {backend}")
+        # Longer inputs are truncated by the model, token chunking sizes chunks to fit
+        self.tokenizer = self.model.tokenizer
+        self.max_seq_length = self.model.max_seq_length
+        self.cache = EmbeddingCache(cache_dir, self.model_id, max_mb=cache_max_mb) if cache_dir else None
+        console(f"Embedding model ready. Dim: {self.embedding_size}")
+
+    def create_embeddings(self, texts: List[str]) -> np.ndarray:
+        """float32 matrix with one row per text"""
+        if self.cache is None:
+            console(f"Creating embeddings for {len(texts)} texts...")
+            return np.asarray(self._encode(texts), dtype=np.float32).reshape(len(texts), self.embedding_size)
+
+        cached = self.cache.get_many(texts)
+        missing = [i for i, vec in enumerate(cached) if vec is None]
+        console(f"Creating embeddings for {len(texts)} texts ({len(texts) - len(missing)} cached)...")
+        if missing:
+            # Encode each distinct text once even if it repeats within the batch
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            encoded = self._encode(unique_texts)
+            self.cache.put_many(unique_texts, encoded)
+            by_text = dict(zip(unique_texts, encoded))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+        if not cached:
+            return np.zeros((0, self.embedding_size), dtype=np.float32)
+        return np.vstack(cached).astype(np.float32)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if self.backend == "onnx":
+            return self.model.encode(texts)
+        # A progress bar only helps for ingestion-sized batches, not for single questions
+        show_progress = len(texts) >= PROGRESS_BAR_MIN_TEXTS and not is_quiet()
+        return self.model.encode(texts, convert_to_numpy=True, show_progress_bar=show_progress)
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        return self.cache.get_stats() if self.cache else {}
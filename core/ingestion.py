@@ -0,0 +1,271 @@
+import hashlib
+import os
+import time
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+from core.metrics import console, metrics, log_event
+from core.token_chunker import TokenChunker
+
+# Bump when the chunk id / fingerprint scheme changes so old entries are rebuilt
+INGEST_SCHEMA_VERSION = 1
+
+# "words": chunk_size/chunk_overlap words with "Page N:" markers in the text (the original scheme)
+# "tokens": sentence-aligned chunks of embedding-model tokens, pages recorded in metadata
+CHUNKING_MODES = ("words", "tokens")
+
+# (text, page_start, page_end); pages are None for word chunks
+Chunk = Tuple[str, Optional[int], Optional[int]]
+
+T = TypeVar("T")
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def ingest_key(chunk_size: int, chunk_overlap: int, embedding_model_id: str, chunking: str = "words") -> str:
+    """Fingerprint of everything besides the PDF bytes that shapes the stored vectors."""
+    raw = f"v{INGEST_SCHEMA_VERSION}|{chunk_size}|{chunk_overlap}|{embedding_model_id}"
+    # Word chunking keeps its original key so existing stores are not re-ingested
+    if chunking != "words":
+        raw += f"|{chunking}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunker(pdf_processor, embedding_model, chunking: str, chunk_size: int,
+                 chunk_overlap: int) -> Tuple[str, Callable[[Iterable[Tuple[int, str]]], Iterator[Chunk]]]:
+    """Ingest key and a function turning (page_number, text) pages into chunks for ``chunking``.
+
+    For token chunking ``chunk_size`` and ``chunk_overlap`` count tokens of
+    the embedding model, the size is capped at the model's max sequence length.
+    """
+    if chunking == "words":
+        def chunk_words(pages):
+            return ((text, None, None) for text in pdf_processor.chunk_pages(pages, chunk_size, chunk_overlap))
+        return ingest_key(chunk_size, chunk_overlap, embedding_model.model_id), chunk_words
+    if chunking == "tokens":
+        chunker = TokenChunker.for_model(embedding_model, chunk_size, chunk_overlap)
+        key = ingest_key(chunker.max_tokens, chunker.overlap_tokens, embedding_model.model_id, chunking)
+        return key, chunker.chunk_pages
+    raise ValueError(f"Unknown chunking mode: {chunking} (choose from {', '.join(CHUNKING_MODES)})")
+
+
+class ChunkIdGenerator:
+    """Content-addressed ids: the same chunk text of the same source keeps its id across runs.
+
+    Stateful so that repeated texts get distinct ids even when the chunks
+    arrive over several batches.
+    """
+
+    def __init__(self, source: str, key: str):
+        self.source = source
+        self.key = key
+        self._seen = {}
+
+    def __call__(self, chunks: List[str]) -> List[str]:
+        ids = []
+        for text in chunks:
+            text_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            occurrence = self._seen.get(text_hash, 0)
+            self._seen[text_hash] = occurrence + 1
+            raw = f"{self.source}|{self.key}|{text_hash}|{occurrence}"
+            ids.append(hashlib.sha1(raw.encode("utf-8")).hexdigest())
+        return ids
+
+
+def make_chunk_ids(source: str, key: str, chunks: List[str]) -> List[str]:
+    return ChunkIdGenerator(source, key)(chunks)
+
+
+def batched(items: Iterator[T], batch_size: int) -> Iterator[List[T]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def ingest_pdf(
+        pdf_path: str,
+        pdf_processor,
+        embedding_model,
+        vector_db,
+        chunk_size: int = 300,
+        chunk_overlap: int = 50,
+        source: str = None,
+        batch_size: int = 64,
+        progress: Callable[[Dict[str, Any]], None] = None,
+        chunking: str = "words",
+        pages: Iterable[Tuple[int, str]] = None
+) -> Dict[str, Any]:
+    """Stream one PDF into the vector store, embedding only chunks that are not stored yet.
+
+    Pages are extracted lazily and chunks are embedded and written in batches
+    of ``batch_size``, so memory stays flat and earlier chunks become
+    searchable while later pages are still being read. Chunks of ``source``
+    from an older version of the file (or older chunking settings) are
+    removed, other sources are left untouched. ``progress`` is called after
+    every batch with the counters of the returned stats dict. With
+    ``chunking="tokens"`` each chunk's pages are stored as page_start/page_end.
+    The source's document vectors for two-level search are rebuilt at the end.
+    ``pages`` are the file's (page_number, text) pages if they are already
+    being extracted elsewhere (see ingest_pdfs), by default they are read
+    with ``pdf_processor.iter_pages``.
+    """
+    started = time.perf_counter()
+    source = source or os.path.basename(pdf_path)
+    doc_hash = file_hash(pdf_path)
+    key, chunk_pages = make_chunker(pdf_processor, embedding_model, chunking, chunk_size, chunk_overlap)
+    stats = {"source": source, "pages": 0, "total_pages": 0, "chunks": 0,
+             "embedded": 0, "removed": 0, "unchanged": False}
+
+    stored = vector_db.count_source_version(source, doc_hash, key)
+    if stored:
+        console(f"'{source}' unchanged, reusing {stored} stored chunks")
+        # Stored before two-level search was turned on
+        if vector_db.update_source_vectors(source, if_missing=True):
+            vector_db.flush()
+        stats.update(chunks=stored, unchanged=True)
+        return stats
+
+    console(f"Loading PDF: {pdf_path}")
+    stats["total_pages"] = pdf_processor.count_pages(pdf_path)
+
+    def tracked_pages():
+        for page_num, page_text in pages if pages is not None else pdf_processor.iter_pages(pdf_path):
+            stats["pages"] = page_num
+            yield page_num, page_text
+
+    chunks = chunk_pages(tracked_pages())
+    make_ids = ChunkIdGenerator(source, key)
+    wanted = set()
+    last_id, last_meta = None, None
+    # Per-stage totals for the log event; each batch is also observed in the metrics
+    timings = {"extract": 0.0, "embed": 0.0, "index": 0.0}
+
+    def timed(stage: str, since: float) -> float:
+        now = time.perf_counter()
+        metrics.observe("rag_stage_seconds", now - since, stage=f"ingest_{stage}")
+        timings[stage] += now - since
+        return now
+
+    batches = batched(chunks, batch_size)
+    while True:
+        # Waiting for the next batch is page extraction plus chunking
+        tick = time.perf_counter()
+        batch = next(batches, None)
+        tick = timed("extract", tick)
+        if batch is None:
+            break
+        texts = [text for text, _, _ in batch]
+        ids = make_ids(texts)
+        # chunk_count is only known at the end; it is stamped on the last chunk below
+        metadatas = []
+        for i, (_, page_start, page_end) in enumerate(batch):
+            metadata = {"chunk_id": stats["chunks"] + i, "source": source, "doc_hash": doc_hash,
+                        "ingest_key": key, "chunk_count": 0}
+            if page_start is not None:
+                metadata.update(page_start=page_start, page_end=page_end)
+            metadatas.append(metadata)
+        existing = vector_db.get_existing_ids(ids)
+        new_idx = [i for i, chunk_id in enumerate(ids) if chunk_id not in existing]
+        kept_idx = [i for i, chunk_id in enumerate(ids) if chunk_id in existing]
+
+        if new_idx:
+            embeddings = embedding_model.create_embeddings([texts[i] for i in new_idx])
+            tick = timed("embed", tick)
+            vector_db.add_documents(
+                [texts[i] for i in new_idx],
+                embeddings,
+                [metadatas[i] for i in new_idx],
+                ids=[ids[i] for i in new_idx]
+            )
+        if kept_idx:
+            # Positions and file hash may have moved even if the text did not
+            vector_db.update_metadatas([ids[i] for i in kept_idx], [metadatas[i] for i in kept_idx])
+        timed("index", tick)
+
+        wanted.update(ids)
+        last_id, last_meta = ids[-1], metadatas[-1]
+        stats["chunks"] += len(batch)
+        stats["embedded"] += len(new_idx)
+        metrics.inc("rag_ingested_chunks_total", len(batch), kind="total")
+        metrics.inc("rag_ingested_chunks_total", len(new_idx), kind="embedded")
+        if progress:
+            progress(dict(stats))
+
+    if not stats["chunks"]:
+        return stats
+
+    # Marks this version as complete for the fast path in count_source_version
+    vector_db.update_metadatas([last_id], [dict(last_meta, chunk_count=stats["chunks"])])
+
+    stale = [chunk_id for chunk_id in vector_db.get_source_ids(source) if chunk_id not in wanted]
+    if stale:
+        vector_db.delete_ids(stale)
+    vector_db.update_source_vectors(source)
+    vector_db.flush()
+    stats["removed"] = len(stale)
+    total = time.perf_counter() - started
+    metrics.observe("rag_stage_seconds", total, stage="ingest_total")
+
+    console(f"'{source}': {stats['chunks']} chunks, {stats['embedded']} embedded, "
+            f"{stats['chunks'] - stats['embedded']} reused, {stats['removed']} removed")
+    log_event("ingest", **stats, total_ms=round(total * 1000.0, 3),
+              **{f"{stage}_ms": round(seconds * 1000.0, 3) for stage, seconds in timings.items()})
+    return stats
+
+
+def ingest_pdfs(
+        pdf_paths: List[str],
+        pdf_processor,
+        embedding_model,
+        vector_db,
+        chunk_size: int = 300,
+        chunk_overlap: int = 50,
+        batch_size: int = 64,
+        progress: Callable[[Dict[str, Any]], None] = None,
+        chunking: str = "words"
+) -> List[Dict[str, Any]]:
+    """ingest_pdf for several files, each stored under its base name; returns the stats per file.
+
+    Unchanged files are skipped without being read. The pages of the others
+    come from one ``pdf_processor.iter_pages_many`` stream, so with
+    extract_workers > 1 the workers already extract the next file while the
+    tail of the current one is being embedded.
+    """
+    pdf_paths = list(dict.fromkeys(pdf_paths))
+    key, _ = make_chunker(pdf_processor, embedding_model, chunking, chunk_size, chunk_overlap)
+    changed = [path for path in pdf_paths
+               if not vector_db.count_source_version(os.path.basename(path), file_hash(path), key)]
+    stream = pdf_processor.iter_pages_many(changed)
+    head = [next(stream, None) if changed else None]
+
+    def file_pages(path: str) -> Iterator[Tuple[int, str]]:
+        # Files without any text yield no pages at all, so the stream is split on the path
+        while head[0] is not None and head[0][0] == path:
+            _, page_num, page_text = head[0]
+            head[0] = next(stream, None)
+            yield page_num, page_text
+
+    results = []
+    try:
+        for path in pdf_paths:
+            pages = file_pages(path) if path in changed else None
+            results.append(ingest_pdf(path, pdf_processor, embedding_model, vector_db, chunk_size=chunk_size,
+                                      chunk_overlap=chunk_overlap, batch_size=batch_size, progress=progress,
+                                      chunking=chunking, pages=pages))
+            if pages is not None:
+                # Whatever ingest_pdf did not read of this file
+                for _ in pages:
+                    pass
+    finally:
+        stream.close()
+    return results
@@ -0,0 +1,347 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait as wait_connections
+from typing import List, Dict, Any, Iterator
+
+from core.metrics import metrics, console, is_quiet, configure as configure_metrics
+from core.prompt import GenerationError
+
+
+class LLMPoolBusy(RuntimeError):
+    """Raised when max_pending requests are already queued or running"""
+
+
+def split_cores(workers: int) -> List[List[int]]:
+    """Contiguous, disjoint core sets of the cores this process may run on, one per worker"""
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(os.cpu_count() or 1))
+    if workers >= len(cores):
+        # More workers than cores: one core each, shared round-robin
+        return [[cores[i % len(cores)]] for i in range(workers)]
+    size, extra = divmod(len(cores), workers)
+    sets, start = [], 0
+    for i in range(workers):
+        end = start + size + (1 if i < extra else 0)
+        sets.append(cores[start:end])
+        start = end
+    return sets
+
+
+def _worker_main(index: int, cores: List[int], threads: int, llm_kwargs: Dict[str, Any], quiet: bool, conn):
+    # Pin before torch starts its thread pool so every thread stays on this worker's cores
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    configure_metrics(quiet=quiet)
+    try:
+        from core.local_llm import LocalLLM
+        llm = LocalLLM(**dict(llm_kwargs, num_threads=threads, num_interop_threads=1))
+    except Exception as e:
+        conn.send(("failed", None, repr(e)))
+        return
+    conn.send(("ready", None, os.getpid()))
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        request_id, kind, prompt, temperature = task
+        generation = {}
+        try:
+            if kind == "stream":
+                for piece in llm.stream_response(prompt, temperature=temperature, stats=generation):
+                    conn.send(("token", request_id, piece))
+                answer = None
+            else:
+                answer = llm.generate_response(prompt, temperature=temperature, stats=generation)
+            conn.send(("done", request_id, (answer, generation)))
+        except GenerationError as e:
+            conn.send(("error", request_id, str(e)))
+        except Exception as e:
+            conn.send(("error", request_id, repr(e)))
+
+
+class LLMWorkerPool:
+    """LocalLLM replicas in worker processes, each pinned to its own cores.
+
+    A drop-in for LocalLLM (generate_response, stream_response,
+    generate_batch, tokenizer) for concurrent serving: instead of every
+    request fighting over all cores in one process, each worker runs one
+    generation at a time with ``threads`` torch threads on its own core set.
+    Requests wait in a FIFO queue and are sent to the next idle worker over
+    that worker's own pipe, so a crashed worker cannot block the others. At
+    most ``max_pending`` requests are queued or running; further callers
+    wait up to ``submit_timeout`` seconds for a slot and then get LLMPoolBusy.
+    """
+
+    def __init__(self, llm_kwargs: Dict[str, Any], workers: int = 2, threads_per_worker: int = 0,
+                 core_sets: List[List[int]] = None, max_pending: int = 32, submit_timeout: float = 10.0,
+                 start_timeout: float = 600.0):
+        from transformers import AutoTokenizer
+
+        core_sets = [list(cores) for cores in core_sets] if core_sets else split_cores(workers)
+        if len(core_sets) != workers:
+            raise ValueError(f"{workers} workers need {workers} core sets, got {len(core_sets)}")
+        self.max_length = llm_kwargs.get("max_length", 256)
+        self.max_input_tokens = llm_kwargs.get("max_input_tokens", 1024)
+        self.submit_timeout = submit_timeout
+        self.prefix_cache = None
+
+        # Prompts are tokenized in this process for context packing, the replicas tokenize their own
+        self.tokenizer = AutoTokenizer.from_pretrained(llm_kwargs["model_path"], trust_remote_code=True)
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.tokenizer.padding_side = "left"
+
+        # spawn: forking a process whose torch/OpenMP threads are running can deadlock
+        ctx = mp.get_context("spawn")
+        self._queue = deque()
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._requests: Dict[int, Dict[str, Any]] = {}
+        self._closed = False
+        self._workers = []
+        for index, cores in enumerate(core_sets):
+            threads = threads_per_worker or len(cores)
+            conn, child_conn = ctx.Pipe()
+            process = ctx.Process(target=_worker_main, name=f"llm-worker-{index}", daemon=True,
+                                  args=(index, cores, threads, llm_kwargs, is_quiet(), child_conn))
+            process.start()
+            child_conn.close()
+            self._workers.append({"index": index, "cores": cores, "threads": threads, "process": process,
+                                  "conn": conn, "alive": True, "current": None, "busy_since": None,
+                                  "busy_seconds": 0.0, "requests": 0})
+        console(f"Starting {workers} LLM workers: " +
+                ", ".join(f"cores {w['cores']} x{w['threads']} threads" for w in self._workers))
+        self._wait_ready(start_timeout)
+        self.started = time.perf_counter()
+
+        self._reader = threading.Thread(target=self._read_results, name="llm-pool-results", daemon=True)
+        self._reader.start()
+        metrics.register_collector(self._collect_gauges)
+
+    def _wait_ready(self, timeout: float):
+        deadline = time.monotonic() + timeout
+        waiting = {worker["conn"]: worker for worker in self._workers}
+        while waiting:
+            ready = wait_connections(list(waiting), timeout=max(0.0, deadline - time.monotonic()))
+            if not ready:
+                self.close()
+                raise RuntimeError(f"LLM workers not ready after {timeout:.0f}s")
+            for conn in ready:
+                worker = waiting.pop(conn)
+                try:
+                    kind, _, payload = conn.recv()
+                except EOFError:
+                    worker["process"].join(1.0)
+                    kind, payload = "failed", f"exit code {worker['process'].exitcode}"
+                if kind == "failed":
+                    self.close()
+                    raise RuntimeError(f"LLM worker {worker['index']} failed to load the model: {payload}")
+        console(f"LLM worker pool ready ({len(self._workers)} replicas)")
+
+    # --- LocalLLM interface ---
+
+    def generate_response(self, prompt: str, temperature: float = None, stats: Dict[str, Any] = None) -> str:
+        future = Future()
+        self._submit("generate", prompt, temperature, future)
+        answer, generation = future.result()
+        if stats is not None:
+            stats.update(generation)
+        return answer
+
+    def generate_batch(self, prompts: List[str], temperature: float = None,
+                       stats: Dict[str, Any] = None) -> List[str]:
+        """Spreads the prompts over the workers instead of padding them into one batch.
+
+        ``stats`` receives the numbers of the last prompt's generation.
+        """
+        futures = []
+        for prompt in prompts:
+            future = Future()
+            self._submit("generate", prompt, temperature, future)
+            futures.append(future)
+        results = [future.result() for future in futures]
+        if results and stats is not None:
+            stats.update(results[-1][1])
+        return [answer for answer, _ in results]
+
+    def stream_response(self, prompt: str, temperature: float = None,
+                        stats: Dict[str, Any] = None) -> Iterator[str]:
+        sink = queue.Queue()
+        self._submit("stream", prompt, temperature, sink)
+        while True:
+            kind, payload = sink.get()
+            if kind == "token":
+                yield payload
+            elif kind == "done":
+                if stats is not None:
+                    stats.update(payload[1])
+                return
+            else:
+                raise GenerationError(payload)
+
+    # --- dispatch ---
+
+    def _submit(self, kind: str, prompt: str, temperature: float, sink):
+        if self._closed:
+            raise RuntimeError("LLM worker pool is closed")
+        if not self._slots.acquire(timeout=self.submit_timeout):
+            metrics.inc("rag_llm_pool_rejected_total")
+            raise LLMPoolBusy(f"{self.get_stats()['pending']} generation requests pending")
+        request_id = next(self._ids)
+        with self._lock:
+            self._requests[request_id] = {"sink": sink, "worker": None, "submitted": time.perf_counter(),
+                                          "task": (request_id, kind, prompt, temperature)}
+            self._queue.append(request_id)
+            self._dispatch()
+
+    def _dispatch(self):
+        """Sends queued requests to idle workers; called with the lock held"""
+        for worker in self._workers:
+            if not self._queue:
+                return
+            if not worker["alive"] or worker["current"] is not None:
+                continue
+            request = self._requests[self._queue.popleft()]
+            try:
+                worker["conn"].send(request["task"])
+            except (OSError, ValueError):
+                # Broken pipe: the reader thread notices the exit, the request goes to another worker
+                self._queue.appendleft(request["task"][0])
+                continue
+            now = time.perf_counter()
+            worker.update(current=request["task"][0], busy_since=now)
+            request["worker"] = worker["index"]
+            metrics.observe("rag_llm_pool_wait_seconds", now - request["submitted"])
+
+    def _read_results(self):
+        while not self._closed:
+            conns = {worker["conn"]: worker for worker in self._workers if worker["alive"]}
+            if not conns:
+                self._fail_all("No LLM worker left")
+                return
+            for conn in wait_connections(list(conns), timeout=1.0):
+                worker = conns[conn]
+                try:
+                    kind, request_id, payload = conn.recv()
+                except (EOFError, OSError):
+                    self._worker_exited(worker)
+                    continue
+                self._handle(worker, kind, request_id, payload)
+
+    def _handle(self, worker: Dict[str, Any], kind: str, request_id: int, payload):
+        finished = kind in ("done", "error")
+        with self._lock:
+            request = self._requests.get(request_id)
+            if finished:
+                self._finish(worker, time.perf_counter())
+                self._requests.pop(request_id, None)
+                self._dispatch()
+        if request is not None:
+            self._deliver(request["sink"], kind, payload)
+            if finished:
+                self._slots.release()
+
+    def _finish(self, worker: Dict[str, Any], now: float):
+        if worker["busy_since"] is not None:
+            worker["busy_seconds"] += now - worker["busy_since"]
+            worker["requests"] += 1
+        worker.update(current=None, busy_since=None)
+
+    @staticmethod
+    def _deliver(sink, kind: str, payload):
+        if isinstance(sink, Future):
+            if kind == "done":
+                sink.set_result(payload)
+            elif kind == "error":
+                sink.set_exception(RuntimeError(payload))
+        else:
+            sink.put((kind, payload))
+
+    def _worker_exited(self, worker: Dict[str, Any]):
+        """Fails the request the worker was running; queued requests go to the remaining workers"""
+        worker["process"].join(1.0)
+        if not self._closed:
+            console(f"LLM worker {worker['index']} exited (code {worker['process'].exitcode})")
+        with self._lock:
+            worker["alive"] = False
+            request = self._requests.pop(worker["current"], None) if worker["current"] is not None else None
+            self._finish(worker, time.perf_counter())
+        if request is not None:
+            self._deliver(request["sink"], "error", "LLM worker exited")
+            self._slots.release()
+
+    def _fail_all(self, reason: str):
+        with self._lock:
+            requests = list(self._requests.values())
+            self._requests.clear()
+            self._queue.clear()
+        for request in requests:
+            self._deliver(request["sink"], "error", reason)
+            self._slots.release()
+
+    # --- stats and shutdown ---
+
+    def get_stats(self) -> Dict[str, Any]:
+        now = time.perf_counter()
+        elapsed = max(1e-9, now - getattr(self, "started", now))
+        with self._lock:
+            pending = len(self._requests)
+            running = pending - len(self._queue)
+            workers = []
+            for worker in self._workers:
+                busy = worker["busy_seconds"] + (now - worker["busy_since"] if worker["busy_since"] else 0.0)
+                workers.append({"worker": worker["index"], "pid": worker["process"].pid, "cores": worker["cores"],
+                                "threads": worker["threads"], "alive": worker["alive"],
+                                "busy": worker["current"] is not None, "requests": worker["requests"],
+                                "utilization": round(busy / elapsed, 3)})
+        return {"workers": len(workers), "pending": pending, "queued": len(self._queue), "running": running,
+                "per_worker": workers}
+
+    def _collect_gauges(self):
+        stats = self.get_stats()
+        yield "rag_llm_pool_queue_depth", {}, stats["queued"]
+        yield "rag_llm_pool_running", {}, stats["running"]
+        for worker in stats["per_worker"]:
+            yield "rag_llm_pool_worker_utilization", {"worker": worker["worker"]}, worker["utilization"]
+
+    def close(self, timeout: float = 10.0):
+        if self._closed:
+            return
+        self._closed = True
+        for worker in self._workers:
+            try:
+                worker["conn"].send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker["process"].join(timeout)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "LLMWorkerPool":
+        from core.local_llm import cpu_options_from_config
+        llm_kwargs = dict(model_path=config["llm_model_path"],
+                          max_length=config.get("max_length", 256),
+                          temperature=config.get("temperature", 0.3),
+                          **cpu_options_from_config(config))
+        return cls(llm_kwargs,
+                   workers=config.get("llm_workers", 2),
+                   threads_per_worker=config.get("llm_worker_threads", 0),
+                   core_sets=config.get("llm_worker_cores"),
+                   max_pending=config.get("llm_pool_max_pending", 32),
+                   submit_timeout=config.get("llm_pool_submit_timeout_s", 10.0))
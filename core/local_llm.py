@@ -1,21 +1,137 @@
+import threading
+import time
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from typing import List
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from transformers.utils import logging as hf_logging
+from typing import List, Dict, Any, Iterator
+
+from core.prompt import GENERATION_ERROR_MESSAGE, PROMPT_PREAMBLE, GenerationError
+from core.prefix_cache import PrefixKVCache
+from core.metrics import metrics, console, log_event, is_quiet
+
+try:
+    from transformers import DynamicCache
+except ImportError:  # transformers without Cache classes: prefix reuse is disabled
+    DynamicCache = None
+
+try:
+    from transformers.generation.streamers import BaseStreamer
+except ImportError:
+    BaseStreamer = object
+
+
+def _bf16_supported() -> bool:
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def cpu_options_from_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """LocalLLM keyword arguments for the CPU inference settings in config.yaml"""
+    return dict(
+        cpu_quantization=config.get("llm_cpu_quantization", "none"),
+        num_threads=config.get("llm_num_threads", 0),
+        num_interop_threads=config.get("llm_num_interop_threads", 0),
+        compile_model=config.get("llm_compile", False),
+        warmup=config.get("llm_warmup", False),
+        prefix_cache_size=config.get("llm_prefix_cache_size", 4),
+        max_input_tokens=config.get("prompt_token_budget", 1024),
+        draft_model_path=config.get("llm_draft_model_path"),
+        draft_tokens=config.get("llm_draft_tokens", 5)
+    )
+
+
+# generate() errors that mean assisted generation is not available for this model or setup
+_ASSISTED_UNSUPPORTED = ("assisted generat", "assistant")
+
+
+def _draft_incompatibility(tokenizer, draft_tokenizer) -> str:
+    """Why a draft model's tokenizer cannot propose tokens for the main model, "" if it can"""
+    if tokenizer.get_vocab() != draft_tokenizer.get_vocab():
+        return "its tokenizer has a different vocabulary"
+    for name in ("bos_token_id", "eos_token_id"):
+        if getattr(tokenizer, name) != getattr(draft_tokenizer, name):
+            return f"its tokenizer has a different {name}"
+    return ""
+
+
+class _GenerationTimer(BaseStreamer):
+    """Streamer that splits a generate() call into prefill and decode time.
+
+    generate() first puts the prompt ids, then one token (per row) per
+    decoding step; the first new token marks the end of the prefill.
+    Assisted generation puts all tokens accepted in a step at once, so
+    ``tokens`` can exceed ``steps``. ``draft_calls`` counts the draft
+    model's forward passes during this generation. Everything is forwarded
+    to ``inner`` when streaming text as well.
+    """
+
+    def __init__(self, inner=None):
+        self.inner = inner
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self.end_at = None
+        self.steps = 0
+        self.tokens = 0
+        self.draft_calls = 0
+        self._prompt_seen = False
+
+    def put(self, value):
+        if self._prompt_seen:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.steps += 1
+            self.tokens += value.numel()
+        self._prompt_seen = True
+        if self.inner is not None:
+            self.inner.put(value)
+
+    def end(self):
+        self.end_at = time.perf_counter()
+        if self.inner is not None:
+            self.inner.end()
 
 
 class LocalLLM:
-    def __init__(self, model_path: str, max_length: int = 256, temperature: float = 0.3):
-        print(f"Loading LLM: {model_path}")
+    def __init__(
+            self,
+            model_path: str,
+            max_length: int = 256,
+            temperature: float = 0.3,
+            cpu_quantization: str = "none",
+            num_threads: int = 0,
+            num_interop_threads: int = 0,
+            compile_model: bool = False,
+            warmup: bool = False,
+            prefix_cache_size: int = 4,
+            max_input_tokens: int = 1024,
+            draft_model_path: str = None,
+            draft_tokens: int = 5
+    ):
+        console(f"Loading LLM: {model_path}")
+        if is_quiet():
+            hf_logging.disable_progress_bar()
 
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Using device: {device}")
+        console(f"Using device: {device}")
+        if device == "cpu":
+            self._configure_threads(num_threads, num_interop_threads)
+            if cpu_quantization == "bf16" and not _bf16_supported():
+                console("bf16 is not supported by this CPU, keeping float32")
+                cpu_quantization = "none"
+        self.cpu_quantization = cpu_quantization if device == "cpu" else "none"
 
         self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
         if self.tokenizer.pad_token is None:
             self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Decoder-only models must be left-padded for batched generation
+        self.tokenizer.padding_side = "left"
+        self.max_input_tokens = max_input_tokens
 
+        cpu_dtype = torch.bfloat16 if self.cpu_quantization == "bf16" else torch.float32
         model_kwargs = dict(
-            dtype=torch.float16 if device == "cuda" else torch.float32,
+            dtype=torch.float16 if device == "cuda" else cpu_dtype,
             trust_remote_code=True,
             low_cpu_mem_usage=True
         )
@@ -28,7 +144,7 @@ class LocalLLM:
                     **model_kwargs
                 )
             except Exception as e:
-                print(f"GPU load failed ({e}), falling back to CPU...")
+                console(f"GPU load failed ({e}), falling back to CPU...")
                 device = "cpu"
                 model_kwargs["dtype"] = torch.float32
                 self.model = AutoModelForCausalLM.from_pretrained(model_path, **model_kwargs)
@@ -37,41 +153,304 @@ class LocalLLM:
 
         if device == "cpu":
             self.model.to(device)
+            if self.cpu_quantization == "int8":
+                self._quantize_int8()
+        self.model.eval()
+        # Assisted (speculative) decoding: the draft proposes tokens, the model verifies them in one pass
+        # generate() runs in the calling thread: the draft's forward hook counts into that thread's timer
+        self._local = threading.local()
+        self.draft_model = None
+        if draft_model_path:
+            self.draft_model = self._load_draft_model(draft_model_path, model_kwargs, draft_tokens)
         self.max_length = max_length
         self.default_temperature = temperature
-        print(f"LLM loaded on {device}")
+        console(f"LLM loaded on {device} ({self.cpu_quantization}), "
+                f"weights: {self.model_memory_mb():.1f} MB, threads: {torch.get_num_threads()}")
+
+        self.prefix_cache = None
+        if prefix_cache_size and DynamicCache is not None:
+            self.prefix_cache = PrefixKVCache(max_entries=prefix_cache_size)
+            self.register_prefix(PROMPT_PREAMBLE)
+
+        self._eager_forward = None
+        if compile_model:
+            self._eager_forward = self.model.forward
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
+        self.load_stats = self.warmup() if warmup or compile_model else {}
+
+    def register_prefix(self, text: str):
+        """Prefill ``text`` once and keep its key/value state for every prompt that starts with it"""
+        if self.prefix_cache is None:
+            return
+        inputs = self._tokenize([text])
+        with torch.no_grad():
+            outputs = self.model(**inputs, use_cache=True)
+        if not isinstance(outputs.past_key_values, DynamicCache):
+            console("Model does not return a DynamicCache, prefix reuse disabled")
+            self.prefix_cache = None
+            return
+        self.prefix_cache.store(inputs["input_ids"][0], outputs.past_key_values, pinned=True)
+
+    def _load_draft_model(self, draft_model_path: str, model_kwargs: Dict[str, Any], draft_tokens: int):
+        """The draft model, or None (plain decoding) if it cannot assist this model"""
+        try:
+            reason = _draft_incompatibility(
+                self.tokenizer, AutoTokenizer.from_pretrained(draft_model_path, trust_remote_code=True))
+            if not reason:
+                draft = AutoModelForCausalLM.from_pretrained(draft_model_path, **model_kwargs)
+                if draft.config.vocab_size != self.model.config.vocab_size:
+                    reason = "its vocabulary size differs from the model's"
+        except (OSError, ValueError) as e:
+            reason = f"it could not be loaded ({e})"
+        if reason:
+            console(f"Draft model {draft_model_path} not used, {reason}; speculative decoding is off")
+            return None
+
+        draft.to(self.model.device)
+        if self.cpu_quantization == "int8":
+            draft = torch.ao.quantization.quantize_dynamic(draft, {torch.nn.Linear}, dtype=torch.qint8)
+        draft.eval()
+        # Starting number of proposed tokens per step, generate() adapts it to the acceptance
+        draft.generation_config.num_assistant_tokens = draft_tokens
+        # Every draft forward pass proposes one token
+        draft.register_forward_hook(self._count_draft_call)
+        console(f"Draft model loaded: {draft_model_path}, speculative decoding on")
+        return draft
+
+    def _count_draft_call(self, module, inputs, outputs):
+        timer = getattr(self._local, "timer", None)
+        if timer is not None:
+            timer.draft_calls += 1
+
+    def _configure_threads(self, num_threads: int, num_interop_threads: int):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        if num_interop_threads:
+            try:
+                torch.set_num_interop_threads(num_interop_threads)
+            except RuntimeError as e:
+                # Only allowed before the first inter-op parallel work in the process
+                console(f"Could not set inter-op threads: {e}")
+
+    def _quantize_int8(self):
+        # Dynamic quantization: int8 weights for every nn.Linear, activations quantized on the fly
+        self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    def model_memory_mb(self) -> float:
+        """Size of all weights and buffers, including packed int8 weights"""
+        def tensor_bytes(value) -> int:
+            if isinstance(value, torch.Tensor):
+                return value.numel() * value.element_size()
+            if isinstance(value, (tuple, list)):
+                return sum(tensor_bytes(v) for v in value)
+            return 0
+
+        return sum(tensor_bytes(v) for v in self.model.state_dict().values()) / (1024 * 1024)
 
-    def generate_response(self, prompt: str, temperature: float = None) -> str:
+    def kv_cache_bytes_per_token(self) -> int:
+        """Key/value cache size of one token of one sequence, 0 if the model config does not tell"""
+        config = self.model.config
         try:
-            inputs = self.tokenizer(
-                prompt,
-                return_tensors="pt",
-                truncation=True,
-                max_length=1024,
-                padding=True
-            ).to(self.model.device)
+            heads = getattr(config, "num_key_value_heads", None) or config.num_attention_heads
+            head_dim = getattr(config, "head_dim", None) or config.hidden_size // config.num_attention_heads
+            layers = config.num_hidden_layers
+        except AttributeError:
+            return 0
+        element_size = torch.tensor([], dtype=self.model.dtype).element_size()
+        return 2 * layers * heads * head_dim * element_size
 
-            temp = temperature if temperature is not None else self.default_temperature
+    def warmup(self, new_tokens: int = 16) -> Dict[str, Any]:
+        """Run one short generation so lazy init and compilation happen before the first user request"""
+        inputs = self._tokenize([PROMPT_PREAMBLE])
+        kwargs = dict(max_new_tokens=new_tokens, min_new_tokens=new_tokens, do_sample=False,
+                      pad_token_id=self.tokenizer.pad_token_id)
+        if self.draft_model is not None:
+            kwargs["assistant_model"] = self.draft_model
+        try:
+            with torch.no_grad():
+                self.model.generate(**inputs, **kwargs)
+        except Exception as e:
+            if self._eager_forward is None:
+                raise
+            console(f"torch.compile failed ({e}), using eager mode")
+            self.model.forward = self._eager_forward
+            self._eager_forward = None
+            with torch.no_grad():
+                self.model.generate(**inputs, **kwargs)
+
+        # Second, timed run reflects steady-state speed
+        start = time.perf_counter()
+        with torch.no_grad():
+            outputs = self.model.generate(**inputs, **kwargs)
+        elapsed = time.perf_counter() - start
+        generated = outputs.shape[1] - inputs["input_ids"].shape[1]
+        stats = {
+            "mode": self.cpu_quantization,
+            "compiled": self._eager_forward is not None,
+            "speculative": self.draft_model is not None,
+            "threads": torch.get_num_threads(),
+            "memory_mb": round(self.model_memory_mb(), 1),
+            "tokens_per_sec": round(generated / elapsed, 2) if elapsed else 0.0,
+        }
+        console(f"LLM warm-up: {stats['tokens_per_sec']} tokens/sec ({stats['mode']}, "
+                f"{'compiled' if stats['compiled'] else 'eager'}, {stats['threads']} threads)")
+        return stats
+
+    def generate_response(self, prompt: str, temperature: float = None, stats: Dict[str, Any] = None) -> str:
+        """The answer to ``prompt``; ``stats`` (if given) receives this generation's prefill/decode numbers"""
+        try:
+            inputs = self._tokenize([prompt])
+            outputs = self._generate_single(inputs, temperature, stats=stats)
+
+            # Decode only the generated tokens, so the answer stays clean even if the prompt was truncated
+            new_tokens = outputs[0, inputs["input_ids"].shape[1]:]
+            return self.tokenizer.decode(new_tokens, skip_special_tokens=True).strip()
+
+        except RuntimeError as e:
+            return self._handle_error(e)
+
+    def stream_response(self, prompt: str, temperature: float = None,
+                        stats: Dict[str, Any] = None) -> Iterator[str]:
+        """Yield decoded text pieces of the answer as soon as tokens are generated.
+
+        Raises GenerationError (after the pieces already produced) if generation fails.
+        ``stats`` is filled in once the last piece has been yielded.
+        """
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def run():
+            try:
+                inputs = self._tokenize([prompt])
+                self._generate_single(inputs, temperature, streamer=streamer, stats=stats)
+            except Exception as e:
+                errors.append(e)
+                # Unblocks the consumer loop below
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+        if errors:
+            if isinstance(errors[0], RuntimeError):
+                raise GenerationError(self._handle_error(errors[0])) from errors[0]
+            raise errors[0]
 
+    def _generate_single(self, inputs, temperature: float = None, streamer=None,
+                         stats: Dict[str, Any] = None) -> torch.Tensor:
+        """generate() for one prompt, resuming from the longest cached prompt prefix"""
+        kwargs = self._generation_kwargs(temperature)
+        timer = _GenerationTimer(streamer)
+        kwargs["streamer"] = timer
+        self._local.timer = timer
+        try:
             with torch.no_grad():
-                outputs = self.model.generate(
-                    **inputs,
-                    max_new_tokens=self.max_length,
-                    temperature=temp,
-                    do_sample=True,
-                    pad_token_id=self.tokenizer.eos_token_id,
-                )
+                if self.prefix_cache is None:
+                    sequences = self._assisted_generate(inputs, kwargs)
+                    self._record_generation(timer, timer.tokens, inputs["input_ids"].shape[1], stats)
+                    return sequences
+
+                input_ids = inputs["input_ids"][0]
+                past, cached_len = self.prefix_cache.lookup(input_ids)
+                if past is not None:
+                    # generate() only prefills the positions beyond the cached length
+                    kwargs["past_key_values"] = past
+                outputs = self._assisted_generate(inputs, dict(kwargs, return_dict_in_generate=True))
+        finally:
+            self._local.timer = None
+        self._record_generation(timer, timer.tokens, len(input_ids) - cached_len, stats)
+        # Keep this prompt's state for follow-up prompts that extend it
+        if isinstance(outputs.past_key_values, DynamicCache):
+            self.prefix_cache.store(input_ids, outputs.past_key_values)
+        return outputs.sequences
+
+    def _assisted_generate(self, inputs, kwargs: Dict[str, Any]):
+        """generate() with the draft model when there is one; disabled if generate() does not support it"""
+        if self.draft_model is None:
+            return self.model.generate(**inputs, **kwargs)
+        try:
+            return self.model.generate(**inputs, **kwargs, assistant_model=self.draft_model)
+        except (ValueError, NotImplementedError) as e:
+            # Other errors concern this request only and must not turn the draft off for everyone
+            if not any(marker in str(e).lower() for marker in _ASSISTED_UNSUPPORTED):
+                raise
+            console(f"Speculative decoding not supported here ({e}), continuing without the draft model")
+            self.draft_model = None
+            return self.model.generate(**inputs, **kwargs)
+
+    def _record_generation(self, timer: _GenerationTimer, new_tokens: int, prefill_tokens: int,
+                           into: Dict[str, Any] = None) -> Dict[str, Any]:
+        end = timer.end_at or time.perf_counter()
+        first = timer.first_token_at or end
+        prefill, decode = first - timer.start, end - first
+        metrics.observe("rag_stage_seconds", prefill, stage="prefill")
+        metrics.observe("rag_stage_seconds", decode, stage="decode")
+        metrics.inc("rag_generated_tokens_total", new_tokens)
+        # The first new token comes out of the prefill pass
+        stats = {
+            "prefill_ms": round(prefill * 1000.0, 3),
+            "prefill_tokens": int(prefill_tokens),
+            "decode_ms": round(decode * 1000.0, 3),
+            "new_tokens": int(new_tokens),
+            "decode_tokens_per_sec": round((new_tokens - 1) / decode, 2) if decode > 0 and new_tokens > 1 else 0.0,
+        }
+        if timer.draft_calls:
+            # Each verification step emits the accepted draft tokens plus one token of its own
+            drafted = timer.draft_calls
+            accepted = min(drafted, max(0, new_tokens - timer.steps))
+            metrics.inc("rag_draft_tokens_total", accepted, result="accepted")
+            metrics.inc("rag_draft_tokens_total", drafted - accepted, result="rejected")
+            stats.update(drafted_tokens=drafted, accepted_tokens=accepted,
+                         acceptance_rate=round(accepted / drafted, 3) if drafted else 0.0)
+        # Handed to the caller of this generation: concurrent requests must not read each other's numbers
+        if into is not None:
+            into.update(stats)
+        log_event("generate", **stats)
+        return stats
+
+    def _tokenize(self, prompts: List[str]):
+        return self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            truncation=True,
+            max_length=self.max_input_tokens,
+            padding=True
+        ).to(self.model.device)
+
+    def _generation_kwargs(self, temperature: float = None) -> Dict[str, Any]:
+        temp = temperature if temperature is not None else self.default_temperature
+        return dict(
+            max_new_tokens=self.max_length,
+            temperature=temp,
+            do_sample=True,
+            pad_token_id=self.tokenizer.pad_token_id,
+        )
+
+    def _handle_error(self, e: RuntimeError) -> str:
+        if "out of memory" in str(e).lower():
+            print("Out of memory! Try reducing max_length or context.")
+        else:
+            print(f"Generation error: {e}")
+        return GENERATION_ERROR_MESSAGE
+
+    def generate_batch(self, prompts: List[str], temperature: float = None,
+                       stats: Dict[str, Any] = None) -> List[str]:
+        """Generate answers for several prompts in one left-padded generate call"""
+        try:
+            inputs = self._tokenize(prompts)
+
+            timer = _GenerationTimer()
+            with torch.no_grad():
+                outputs = self.model.generate(**inputs, **self._generation_kwargs(temperature), streamer=timer)
 
-            full_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-            if full_response.startswith(prompt):
-                response = full_response[len(prompt):].strip()
-            else:
-                response = full_response.strip()
-            return response
+            # Every row shares the padded prompt length, so the answer is what follows it
+            new_tokens = outputs[:, inputs["input_ids"].shape[1]:]
+            self._record_generation(timer, int((new_tokens != self.tokenizer.pad_token_id).sum()),
+                                    int(inputs["attention_mask"].sum()), stats)
+            return [text.strip() for text in self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)]
 
         except RuntimeError as e:
-            if "out of memory" in str(e).lower():
-                print("Out of memory! Try reducing max_length or context.")
-            else:
-                print(f"Generation error: {e}")
-            return "I'm sorry, I ran into a technical issue while generating a response."
\ No newline at end of file
+            return [self._handle_error(e)] * len(prompts)
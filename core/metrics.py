@@ -0,0 +1,199 @@
+import bisect
+import json
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterable, List, Tuple
+
+# Seconds; covers sub-millisecond retrieval up to slow CPU generation
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_HELP = {
+    "rag_stage_seconds": "Duration of pipeline stages (embed, retrieve, prompt_build, prefill, decode, ingest_*)",
+    "rag_queries_total": "Questions answered, by entry point",
+    "rag_answer_cache_total": "Semantic answer cache lookups, by result",
+    "rag_generated_tokens_total": "Tokens generated by the LLM",
+    "rag_draft_tokens_total": "Draft model tokens proposed for speculative decoding, by result",
+    "rag_ingested_chunks_total": "Chunks written by ingestion (embedded = newly embedded)",
+    "rag_llm_pool_wait_seconds": "Time a generation request waited for an idle LLM worker",
+    "rag_llm_pool_worker_utilization": "Share of time each LLM worker spent generating since the pool started",
+}
+
+_logger = logging.getLogger("edge_rag")
+_settings = {"quiet": False, "structured_logs": False}
+
+
+def configure(quiet: bool = False, structured_logs: bool = False):
+    """quiet silences console() diagnostics; structured_logs emits one JSON line per event"""
+    _settings["quiet"] = bool(quiet)
+    _settings["structured_logs"] = bool(structured_logs)
+    if structured_logs and not _logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+
+
+def is_quiet() -> bool:
+    return _settings["quiet"]
+
+
+def console(*args, **kwargs):
+    """print() for diagnostics, silenced by configure(quiet=True)"""
+    if not _settings["quiet"]:
+        print(*args, **kwargs)
+
+
+def log_event(event: str, **fields):
+    if _settings["structured_logs"]:
+        _logger.info(json.dumps({"ts": round(time.time(), 3), "event": event, **fields}, default=str))
+
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[str, str] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metrics:
+    """Process-wide counters, gauges and histograms rendered in the Prometheus text format.
+
+    Recording is a dict update under a lock, cheap enough for every query.
+    Gauges that are expensive or owned elsewhere (store sizes, cache hit
+    rates) come from collectors that only run when metrics are scraped.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._gauges: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, list]] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]] = []
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                state = series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def stage_timer(self, stage: str, record: Dict[str, float] = None):
+        """Observes the block's duration as rag_stage_seconds{stage=...}, optionally also into ``record`` (ms)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("rag_stage_seconds", elapsed, stage=stage)
+            if record is not None:
+                record[f"{stage}_ms"] = round(elapsed * 1000.0, 3)
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, Dict[str, Any], float]]]):
+        """collector() yields (gauge name, labels, value) when metrics are rendered"""
+        self._collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Plain dict view: counters and gauges by series, histograms as count/sum/mean"""
+        with self._lock:
+            counters = {name: {_format_labels(k) or "": v for k, v in series.items()}
+                        for name, series in self._counters.items()}
+            histograms = {name: {_format_labels(k) or "": {"count": s[2], "sum": round(s[1], 6),
+                                                             "mean": round(s[1] / s[2], 6) if s[2] else 0.0}
+                                 for k, s in series.items()}
+                          for name, series in self._histograms.items()}
+        gauges = {}
+        for name, key, value in self._collect_gauges():
+            gauges.setdefault(name, {})[_format_labels(key) or ""] = value
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def _collect_gauges(self) -> List[Tuple[str, tuple, float]]:
+        with self._lock:
+            gauges = [(name, key, value) for name, series in self._gauges.items() for key, value in series.items()]
+        for collector in list(self._collectors):
+            try:
+                for name, labels, value in collector():
+                    if value is not None:
+                        gauges.append((name, _label_key(labels), float(value)))
+            except Exception as e:
+                console(f"Metrics collector failed: {e}")
+        return gauges
+
+    def render_prometheus(self) -> str:
+        lines = []
+
+        def header(name: str, kind: str):
+            if name in _HELP:
+                lines.append(f"# HELP {name} {_HELP[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {k: [list(s[0]), s[1], s[2]] for k, s in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for key, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        gauges: Dict[str, List[Tuple[tuple, float]]] = {}
+        for name, key, value in self._collect_gauges():
+            gauges.setdefault(name, []).append((key, value))
+        for name in sorted(gauges):
+            header(name, "gauge")
+            for key, value in sorted(gauges[name]):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for key, (bucket_counts, total, count) in sorted(histograms[name].items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Shared by every component of the process
+metrics = Metrics()
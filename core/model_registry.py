@@ -0,0 +1,213 @@
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+from core.metrics import metrics, console, log_event
+
+# Components warm_up() knows how to load, in load order
+WARMUP_COMPONENTS = ("vector_db", "embedding_model", "llm", "context_packer")
+
+
+class ModelRegistry:
+    """Process-wide components built on first use, one instance per distinct key.
+
+    Keys start with the component name followed by the settings it was built
+    from, so the API and the UI running in one process share their models
+    while a different model path still gets its own instance. Each entry has
+    its own lock: a request waiting for the LLM does not block one that only
+    needs the embedding model.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[tuple, Dict[str, Any]] = {}
+
+    def _entry(self, key: tuple) -> Dict[str, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"lock": threading.Lock(), "instance": None,
+                                              "state": "not_loaded", "load_seconds": None, "error": None}
+            return entry
+
+    def get(self, key: tuple, factory: Callable[[], Any]) -> Any:
+        entry = self._entry(key)
+        if entry["instance"] is not None:
+            return entry["instance"]
+        with entry["lock"]:
+            if entry["instance"] is None:
+                entry["state"] = "loading"
+                start = time.perf_counter()
+                try:
+                    instance = factory()
+                except Exception as e:
+                    # Not cached: the next caller retries the load
+                    entry["state"], entry["error"] = "error", str(e)
+                    raise
+                elapsed = time.perf_counter() - start
+                entry.update(instance=instance, state="loaded", error=None, load_seconds=round(elapsed, 3))
+                metrics.observe("rag_model_load_seconds", elapsed, component=key[0])
+                log_event("model_load", component=key[0], seconds=round(elapsed, 3))
+        return entry["instance"]
+
+    def peek(self, key: tuple) -> Optional[Any]:
+        """The instance if it is already loaded, never triggers a load"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry["instance"] if entry else None
+
+    def status(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._entries.items())
+        return [{"component": key[0], "state": entry["state"], "load_seconds": entry["load_seconds"],
+                 "error": entry["error"]} for key, entry in entries]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# Shared by every entry point of the process
+registry = ModelRegistry()
+
+
+def _pdf_processor_key(config: Dict[str, Any]) -> tuple:
+    return ("pdf_processor", config.get("extract_workers", 1), config.get("extract_pages_per_task", 8))
+
+
+def _embedding_model_key(config: Dict[str, Any]) -> tuple:
+    return ("embedding_model", config["embedding_model_path"], config.get("embedding_cache_dir"),
+            config.get("embedding_cache_max_mb", 512), config.get("embedding_backend", "torch"),
+            config.get("embedding_onnx_quantize", False))
+
+
+def _vector_db_key(config: Dict[str, Any]) -> tuple:
+    return ("vector_db", config["vector_db_dir"], config.get("hybrid_search", False), config.get("rrf_k", 60),
+            config.get("vector_backend", "chroma"), config.get("vector_dtype", "float32"),
+            config.get("vector_quantization", "none"), config.get("vector_rescore_factor"),
+            config.get("two_level_search", False), config.get("docs_to_expand", 5),
+            config.get("doc_section_chunks", 0))
+
+
+def _llm_key(config: Dict[str, Any]) -> tuple:
+    # Raw llm_* settings rather than cpu_options_from_config(), which would import torch
+    options = tuple(sorted((key, repr(value)) for key, value in config.items() if key.startswith("llm_")))
+    return ("llm", config["llm_model_path"], config.get("max_length", 256), config.get("temperature", 0.3),
+            config.get("prompt_token_budget", 1024), options)
+
+
+def _answer_cache_key(config: Dict[str, Any]) -> tuple:
+    return ("answer_cache", config.get("answer_cache_size", 256), config.get("answer_cache_threshold", 0.95))
+
+
+def get_pdf_processor(config: Dict[str, Any]):
+    def build():
+        from core.pdf_processor import PDFProcessor
+        return PDFProcessor(extract_workers=config.get("extract_workers", 1),
+                            pages_per_task=config.get("extract_pages_per_task", 8))
+    return registry.get(_pdf_processor_key(config), build)
+
+
+def get_embedding_model(config: Dict[str, Any], load: bool = True):
+    """load=False returns None instead of loading (metrics and status must not trigger a load)"""
+    key = _embedding_model_key(config)
+    if not load:
+        return registry.peek(key)
+
+    def build():
+        from core.embedding_model import EmbeddingModel
+        return EmbeddingModel(config["embedding_model_path"],
+                              cache_dir=config.get("embedding_cache_dir"),
+                              cache_max_mb=config.get("embedding_cache_max_mb", 512),
+                              backend=config.get("embedding_backend", "torch"),
+                              onnx_quantize=config.get("embedding_onnx_quantize", False))
+    return registry.get(key, build)
+
+
+def get_vector_db(config: Dict[str, Any], load: bool = True):
+    key = _vector_db_key(config)
+    if not load:
+        return registry.peek(key)
+
+    def build():
+        from core.vector_database import VectorDatabase
+        return VectorDatabase(persist_directory=config["vector_db_dir"],
+                              hybrid_search=config.get("hybrid_search", False),
+                              rrf_k=config.get("rrf_k", 60),
+                              backend=config.get("vector_backend", "chroma"),
+                              vector_dtype=config.get("vector_dtype", "float32"),
+                              quantization=config.get("vector_quantization", "none"),
+                              rescore_factor=config.get("vector_rescore_factor"),
+                              two_level_search=config.get("two_level_search", False),
+                              docs_to_expand=config.get("docs_to_expand", 5),
+                              section_chunks=config.get("doc_section_chunks", 0))
+    return registry.get(key, build)
+
+
+def get_llm(config: Dict[str, Any], load: bool = True):
+    key = _llm_key(config)
+    if not load:
+        return registry.peek(key)
+
+    def build():
+        if config.get("llm_workers", 0) > 1:
+            from core.llm_pool import LLMWorkerPool
+            return LLMWorkerPool.from_config(config)
+        from core.local_llm import LocalLLM, cpu_options_from_config
+        return LocalLLM(model_path=config["llm_model_path"],
+                        max_length=config.get("max_length", 256),
+                        temperature=config.get("temperature", 0.3),
+                        **cpu_options_from_config(config))
+    return registry.get(key, build)
+
+
+def get_context_packer(config: Dict[str, Any]):
+    def build():
+        from core.context_packer import ContextPacker
+        return ContextPacker(get_llm(config).tokenizer, max_prompt_tokens=config.get("prompt_token_budget", 1024))
+    return registry.get(("context_packer",) + _llm_key(config)[1:], build)
+
+
+def get_answer_cache(config: Dict[str, Any]):
+    def build():
+        from core.answer_cache import SemanticAnswerCache
+        return SemanticAnswerCache(max_entries=config.get("answer_cache_size", 256),
+                                   threshold=config.get("answer_cache_threshold", 0.95))
+    return registry.get(_answer_cache_key(config), build)
+
+
+_LOADERS = {
+    "vector_db": get_vector_db,
+    "embedding_model": get_embedding_model,
+    "llm": get_llm,
+    "context_packer": get_context_packer,
+}
+
+
+def warm_up(config: Dict[str, Any], components: List[str] = None) -> Optional[threading.Thread]:
+    """Loads ``components`` (default: config["warmup_models"]) in a daemon thread.
+
+    Returns immediately so a server can start accepting requests; a request
+    that needs a component still loading simply waits for it.
+    """
+    if components is None:
+        components = config.get("warmup_models") or []
+    unknown = [name for name in components if name not in _LOADERS]
+    if unknown:
+        raise ValueError(f"Unknown warm-up component(s): {', '.join(unknown)} "
+                         f"(choose from {', '.join(WARMUP_COMPONENTS)})")
+    if not components:
+        return None
+
+    def run():
+        start = time.perf_counter()
+        for name in sorted(components, key=WARMUP_COMPONENTS.index):
+            try:
+                _LOADERS[name](config)
+            except Exception as e:
+                console(f"Warm-up of {name} failed: {e}")
+        console(f"Models warmed up in {time.perf_counter() - start:.1f}s")
+
+    thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,586 @@
+import argparse
+import json
+import os
+import threading
+import uuid
+from typing import List, Dict, Any, Iterable, Tuple, Callable
+
+import numpy as np
+
+from core.vector_store import VectorStore, matches_where
+
+QUANTIZATIONS = ("none", "int8", "binary")
+
+# Candidates rescored per requested hit; binary codes are much coarser than int8
+DEFAULT_RESCORE_FACTOR = {"int8": 4, "binary": 16}
+
+# int8 codes are widened to float32 this many rows at a time for the BLAS product,
+# so a scan never holds more than a few MB of widened codes
+CODE_BLOCK_ROWS = 4096
+
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint16)
+
+
+def _hamming(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    xor = np.bitwise_xor(codes, query_code)
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(xor).sum(axis=1, dtype=np.int32)
+    return _POPCOUNT[xor].sum(axis=1, dtype=np.int32)
+
+
+class NumpyStore(VectorStore):
+    """Brute-force store: a memory-mapped matrix of unit vectors plus a JSON side file.
+
+    ``records.json`` holds the ids, documents and metadata, and for every id
+    the row of the vector file that holds its vector. The vector file is
+    append-only between flushes: added or updated vectors go to new rows and
+    deletes only drop ids, so the rows the last written records point to
+    never change. ``flush`` writes the records atomically, which is when
+    changes become visible to other processes and survive a crash. Rows
+    no longer referenced are dropped by rewriting the live rows into a new
+    file once they outnumber the live ones.
+
+    Opening the store maps the matrix instead of reading it, and a query is
+    one matrix product per block of rows followed by argpartition. Meant for
+    a single writer and up to a few hundred thousand chunks.
+
+    With ``quantization`` set to "int8" (one scale per row) or "binary"
+    (sign bits, Hamming distance) the first pass scans compact codes held in
+    memory, and only ``rescore_factor * top_k`` candidates per query are
+    read back from the full-precision matrix on disk and rescored exactly.
+
+    A query with a ``where`` filter scores only the matching rows, exactly.
+    Filters on "source" are answered from a source -> rows index, so
+    searching a few documents of a large library touches only their rows.
+    With one filter per query, all queries are scored against the union of
+    their rows in one pass and each keeps only its own rows.
+    """
+
+    def __init__(self, directory: str, dtype: str = "float32", block_rows: int = 65536,
+                 quantization: str = "none", rescore_factor: int = None):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.float32, np.float16):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+        self.block_rows = block_rows
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor or DEFAULT_RESCORE_FACTOR.get(quantization, 1)
+        self._records_path = os.path.join(directory, "records.json")
+        self._codes_path = os.path.join(directory, f"codes_{quantization}.npz")
+        self._lock = threading.RLock()
+        self._matrix = None
+        self._load()
+
+    @property
+    def _matrix_path(self) -> str:
+        return os.path.join(self.directory, self._vectors_file)
+
+    def _load(self):
+        self.dim = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[Dict] = []
+        self._mtime = None
+        self._generation = None
+        # Row of the vector file holding each id's vector, and the number of rows written
+        self._vector_rows: List[int] = []
+        self._used_rows = 0
+        self._vectors_file = "vectors.bin"
+        if os.path.exists(self._records_path):
+            with open(self._records_path, "r", encoding="utf-8") as f:
+                records = json.load(f)
+            if records["dtype"] != self.dtype.name:
+                raise ValueError(f"Vectors in {self.directory} are stored as {records['dtype']}, "
+                                 f"not {self.dtype.name}")
+            self.dim = records["dim"]
+            self.ids = records["ids"]
+            self.documents = records["documents"]
+            self.metadatas = records["metadatas"]
+            self._generation = records.get("generation")
+            # Stores written before the row mapping have row i for id i
+            self._vector_rows = records.get("vector_rows", list(range(len(self.ids))))
+            self._used_rows = records.get("used_rows", len(self.ids))
+            self._vectors_file = records.get("vectors_file", "vectors.bin")
+            self._mtime = os.stat(self._records_path).st_mtime_ns
+        self._index = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self._source_rows = None
+        self._row_maps = None
+        self._obsolete_files = []
+        self._open_matrix()
+        self._load_codes()
+        self.dirty = False
+
+    def _open_matrix(self):
+        self._matrix = None
+        self._capacity = 0
+        if self.dim is None or not os.path.exists(self._matrix_path):
+            return
+        self._capacity = os.path.getsize(self._matrix_path) // (self.dim * self.dtype.itemsize)
+        if self._capacity:
+            self._matrix = np.memmap(self._matrix_path, dtype=self.dtype, mode="r+",
+                                     shape=(self._capacity, self.dim))
+
+    def _close_matrix(self):
+        # numpy has no explicit close; dropping the last reference unmaps the file
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+
+    def _reserve(self, rows: int):
+        if rows <= self._capacity:
+            return
+        capacity = max(rows, 2 * self._capacity, 1024)
+        self._close_matrix()
+        with open(self._matrix_path, "ab") as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        self._open_matrix()
+
+    def _maps(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(file row of every id, id position of every file row or -1 for unreferenced rows)"""
+        if self._row_maps is None:
+            vector_rows = np.asarray(self._vector_rows, dtype=np.int64)
+            positions = np.full(self._used_rows, -1, dtype=np.int64)
+            positions[vector_rows] = np.arange(len(vector_rows))
+            self._row_maps = (vector_rows, positions)
+        return self._row_maps
+
+    def _vectors(self, rows) -> np.ndarray:
+        """Copies of the vectors of the ids at ``rows``"""
+        vector_rows = self._maps()[0][rows]
+        return np.array(self._matrix[vector_rows], dtype=np.float32)
+
+    def _load_codes(self):
+        self._codes = None
+        self._scales = None
+        self._codes_dirty = False
+        if self.quantization == "none" or self.dim is None:
+            return
+        if os.path.exists(self._codes_path):
+            with np.load(self._codes_path, allow_pickle=False) as data:
+                if str(data["generation"]) == str(self._generation) and len(data["codes"]) == self._used_rows:
+                    self._codes = data["codes"]
+                    self._scales = data["scales"]
+                    return
+        # Missing or written for another state of the store (e.g. quantization just turned on)
+        self._codes, self._scales = self._encode(np.zeros((0, self.dim), dtype=np.float32))
+        self._grow_codes(self._used_rows)
+        for start in range(0, self._used_rows, self.block_rows):
+            end = min(start + self.block_rows, self._used_rows)
+            self._codes[start:end], self._scales[start:end] = self._encode(
+                np.asarray(self._matrix[start:end], dtype=np.float32))
+        self._codes_dirty = bool(self._used_rows)
+
+    def _encode(self, unit_vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if self.quantization == "binary":
+            return np.packbits(unit_vectors > 0, axis=1), np.ones(len(unit_vectors), dtype=np.float32)
+        scales = np.abs(unit_vectors).max(axis=1, initial=0.0) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(unit_vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _grow_codes(self, rows: int):
+        if self._codes is None or rows <= len(self._codes):
+            return
+        capacity = max(rows, 2 * len(self._codes), 1024)
+        codes = np.zeros((capacity, self._codes.shape[1]), dtype=self._codes.dtype)
+        scales = np.ones(capacity, dtype=np.float32)
+        codes[:len(self._codes)] = self._codes
+        scales[:len(self._scales)] = self._scales
+        self._codes, self._scales = codes, scales
+
+    def _reload_if_changed(self):
+        if self.dirty or not os.path.exists(self._records_path):
+            return
+        if os.stat(self._records_path).st_mtime_ns != self._mtime:
+            self._close_matrix()
+            self._load()
+
+    def _changed(self):
+        self._source_rows = None
+        self._row_maps = None
+        self.dirty = True
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                if self.quantization != "none":
+                    self._codes, self._scales = self._encode(np.zeros((0, self.dim), dtype=np.float32))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store ({self.dim})")
+            # New rows only: the rows of updated ids may still be referenced by the records on disk
+            first = self._used_rows
+            self._reserve(first + len(ids))
+            unit_vectors = self._normalize(vectors)
+            self._matrix[first:first + len(ids)] = unit_vectors.astype(self.dtype)
+            if self._codes is not None:
+                self._grow_codes(first + len(ids))
+                self._codes[first:first + len(ids)], self._scales[first:first + len(ids)] = self._encode(unit_vectors)
+                self._codes_dirty = True
+            self._used_rows = first + len(ids)
+
+            for vector_row, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas), start=first):
+                row = self._index.get(doc_id)
+                if row is None:
+                    self._index[doc_id] = len(self.ids)
+                    self.ids.append(doc_id)
+                    self.documents.append(document)
+                    self.metadatas.append(metadata)
+                    self._vector_rows.append(vector_row)
+                else:
+                    self.documents[row] = document
+                    self.metadatas[row] = metadata
+                    self._vector_rows[row] = vector_row
+            self._changed()
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        with self._lock:
+            for doc_id, metadata in zip(ids, metadatas):
+                row = self._index.get(doc_id)
+                if row is not None:
+                    self.metadatas[row] = metadata
+            self._changed()
+
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None,
+            include: Iterable[str] = ("documents", "metadatas"), limit: int = None,
+            offset: int = 0) -> Dict[str, list]:
+        include = list(include)
+        with self._lock:
+            self._reload_if_changed()
+            if ids is None:
+                rows = range(len(self.ids))
+            else:
+                rows = [self._index[doc_id] for doc_id in ids if doc_id in self._index]
+            if where:
+                rows = [row for row in rows if matches_where(self.metadatas[row], where)]
+            rows = list(rows)[offset:None if limit is None else offset + limit]
+            found = {"ids": [self.ids[row] for row in rows]}
+            if "documents" in include:
+                found["documents"] = [self.documents[row] for row in rows]
+            if "metadatas" in include:
+                found["metadatas"] = [self.metadatas[row] for row in rows]
+            if "embeddings" in include:
+                found["embeddings"] = list(self._vectors(rows)) if rows else []
+            return found
+
+    def _top_k(self, n_queries: int, n_rows: int, k: int,
+               score_block: Callable[[int, int], np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and scores of the k best rows per query, best first; score_block(start, end) scores a block"""
+        # Best k of every block, then the best k of those
+        cand_rows, cand_scores = [], []
+        for start in range(0, n_rows, self.block_rows):
+            scores = score_block(start, min(start + self.block_rows, n_rows))
+            if scores.shape[1] > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, top, axis=1)
+            else:
+                top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            cand_rows.append(top + start)
+            cand_scores.append(scores)
+        cand_rows = np.concatenate(cand_rows, axis=1)
+        cand_scores = np.concatenate(cand_scores, axis=1)
+        order = np.argsort(-cand_scores, axis=1, kind="stable")[:, :k]
+        return np.take_along_axis(cand_rows, order, axis=1), np.take_along_axis(cand_scores, order, axis=1)
+
+    def _masked(self, score_block: Callable[[int, int], np.ndarray]) -> Callable[[int, int], np.ndarray]:
+        """score_block over file rows with unreferenced rows scored -inf"""
+        if self._used_rows == len(self.ids):
+            return score_block
+        positions = self._maps()[1]
+
+        def masked(start, end):
+            scores = score_block(start, end)
+            scores[:, positions[start:end] < 0] = -np.inf
+            return scores
+        return masked
+
+    def _rows_where(self, where: Dict[str, Any]) -> np.ndarray:
+        """Sorted rows matching ``where``"""
+        sources = where.get("source") if len(where) == 1 else None
+        if sources is None:
+            return np.asarray([row for row in range(len(self.ids)) if matches_where(self.metadatas[row], where)],
+                              dtype=np.int64)
+        if self._source_rows is None:
+            self._source_rows = {}
+            for row, metadata in enumerate(self.metadatas):
+                self._source_rows.setdefault((metadata or {}).get("source"), []).append(row)
+        sources = sources["$in"] if isinstance(sources, dict) else [sources]
+        rows = [row for source in set(sources) for row in self._source_rows.get(source, ())]
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+    def _filtered_search(self, queries: np.ndarray, k: int, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        top, scores = self._top_k(len(queries), len(rows), k,
+                                  lambda start, end: queries @ self._vectors(rows[start:end]).T)
+        return rows[top], scores
+
+    def _filtered_search_each(self, queries: np.ndarray, k: int,
+                              row_sets: List[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        union = np.unique(np.concatenate(row_sets))
+        allowed = np.stack([np.isin(union, rows) for rows in row_sets])
+
+        def score_block(start, end):
+            scores = queries @ self._vectors(union[start:end]).T
+            scores[~allowed[:, start:end]] = -np.inf
+            return scores
+        top, scores = self._top_k(len(queries), len(union), min(k, len(union)), score_block)
+        return union[top], scores
+
+    def _exact_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        rows, scores = self._top_k(len(queries), self._used_rows, k, self._masked(
+            lambda start, end: queries @ np.asarray(self._matrix[start:end], dtype=np.float32).T))
+        return self._maps()[1][rows], scores
+
+    def _quantized_search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.quantization == "binary":
+            query_codes = np.packbits(queries > 0, axis=1)
+
+            def score_block(start, end):
+                return -np.stack([_hamming(self._codes[start:end], code) for code in query_codes]).astype(np.float32)
+        else:
+            widened = np.empty((min(CODE_BLOCK_ROWS, self.block_rows), self.dim), dtype=np.float32)
+
+            def score_block(start, end):
+                scores = np.empty((len(queries), end - start), dtype=np.float32)
+                for sub in range(start, end, CODE_BLOCK_ROWS):
+                    sub_end = min(sub + CODE_BLOCK_ROWS, end)
+                    codes = widened[:sub_end - sub]
+                    np.copyto(codes, self._codes[sub:sub_end])
+                    scores[:, sub - start:sub_end - start] = queries @ codes.T
+                scores *= self._scales[start:end]
+                return scores
+
+        positions = self._maps()[1]
+        n_candidates = min(self._used_rows, k * self.rescore_factor)
+        candidates, _ = self._top_k(len(queries), self._used_rows, n_candidates, self._masked(score_block))
+        rows, scores = [], []
+        for query, query_rows in zip(queries, candidates):
+            # Only the candidate rows of the full-precision matrix are read from disk
+            query_rows = np.sort(query_rows)
+            query_rows = query_rows[positions[query_rows] >= 0]
+            exact = np.asarray(self._matrix[query_rows], dtype=np.float32) @ query
+            best = np.argsort(-exact, kind="stable")[:k]
+            rows.append(positions[query_rows[best]])
+            scores.append(exact[best])
+        return np.stack(rows), np.stack(scores)
+
+    def _search(self, queries: np.ndarray, k: int, exact: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions (indexes into ids) and scores of the k best ids per query"""
+        if exact or self._codes is None:
+            return self._exact_search(queries, k)
+        return self._quantized_search(queries, k)
+
+    def query(self, query_embeddings, top_k: int, where=None) -> List[List[Dict]]:
+        queries = self._normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        with self._lock:
+            self._reload_if_changed()
+            if isinstance(where, list):
+                row_sets = [self._rows_where(clause) if clause else np.arange(len(self.ids)) for clause in where]
+                k = min(top_k, max(len(rows) for rows in row_sets))
+            else:
+                allowed = self._rows_where(where) if where else None
+                k = min(top_k, len(self.ids) if allowed is None else len(allowed))
+            if k <= 0:
+                return [[] for _ in range(len(queries))]
+            if isinstance(where, list):
+                rows, scores = self._filtered_search_each(queries, k, row_sets)
+            elif allowed is None:
+                rows, scores = self._search(queries, k)
+            else:
+                rows, scores = self._filtered_search(queries, k, allowed)
+
+            all_formatted = []
+            for q in range(len(queries)):
+                formatted = []
+                for row, score in zip(rows[q], scores[q]):
+                    if score == -np.inf:
+                        # Fewer rows pass this query's filter than k
+                        continue
+                    row = int(row)
+                    formatted.append({
+                        'document': self.documents[row],
+                        'metadata': self.metadatas[row] or {},
+                        'distance': 1.0 - float(score),
+                        'id': self.ids[row]
+                    })
+                all_formatted.append(formatted)
+            return all_formatted
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Size of the full-precision vectors versus the in-memory first-pass index"""
+        with self._lock:
+            n_rows = len(self.ids)
+            full_bytes = n_rows * (self.dim or 0) * self.dtype.itemsize
+            index_bytes = full_bytes
+            if self._codes is not None:
+                index_bytes = self._codes[:self._used_rows].nbytes
+                if self.quantization == "int8":
+                    index_bytes += self._scales[:self._used_rows].nbytes
+            return {
+                "quantization": self.quantization,
+                "rows": n_rows,
+                "full_precision_mb": round(full_bytes / 2 ** 20, 2),
+                "search_index_mb": round(index_bytes / 2 ** 20, 2),
+                "memory_saved_mb": round((full_bytes - index_bytes) / 2 ** 20, 2),
+            }
+
+    def evaluate_recall(self, query_embeddings=None, top_k: int = 10, n_queries: int = 100,
+                        seed: int = 0) -> float:
+        """recall@k of the configured search against exact search over the same rows.
+
+        Without query embeddings, stored vectors are sampled as queries.
+        """
+        with self._lock:
+            self._reload_if_changed()
+            k = min(top_k, len(self.ids))
+            if k <= 0:
+                return 1.0
+            if query_embeddings is None:
+                rows = np.random.default_rng(seed).choice(len(self.ids), min(n_queries, len(self.ids)), replace=False)
+                queries = self._vectors(np.sort(rows))
+            else:
+                queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+            queries = self._normalize(queries)
+            approx, _ = self._search(queries, k)
+            exact, _ = self._search(queries, k, exact=True)
+            hits = sum(len(set(a.tolist()) & set(e.tolist())) for a, e in zip(approx, exact))
+            return hits / (len(queries) * k)
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            for doc_id in ids:
+                row = self._index.pop(doc_id, None)
+                if row is None:
+                    continue
+                # Keep ids dense: the last id moves into the hole, its vector stays where it is
+                last = len(self.ids) - 1
+                if row != last:
+                    self.ids[row] = self.ids[last]
+                    self.documents[row] = self.documents[last]
+                    self.metadatas[row] = self.metadatas[last]
+                    self._vector_rows[row] = self._vector_rows[last]
+                    self._index[self.ids[row]] = row
+                self.ids.pop()
+                self.documents.pop()
+                self.metadatas.pop()
+                self._vector_rows.pop()
+            self._changed()
+
+    def count(self) -> int:
+        with self._lock:
+            self._reload_if_changed()
+            return len(self.ids)
+
+    def clear(self):
+        with self._lock:
+            self._close_matrix()
+            self._obsolete_files.append(self._matrix_path)
+            # A new file name: the old one stays valid for the old records until the empty ones are written
+            self._vectors_file = f"vectors_{uuid.uuid4().hex[:12]}.bin"
+            self.dim = None
+            self.ids, self.documents, self.metadatas = [], [], []
+            self._index = {}
+            self._vector_rows = []
+            self._used_rows = 0
+            self._capacity = 0
+            self._codes = None
+            self._scales = None
+            self._changed()
+            self.flush()
+
+    def _compact(self):
+        """Rewrites the referenced rows, in id order, into a new vector file"""
+        vector_rows = self._maps()[0]
+        name = f"vectors_{uuid.uuid4().hex[:12]}.bin"
+        capacity = max(len(vector_rows), 1024)
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.truncate(capacity * self.dim * self.dtype.itemsize)
+        compacted = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        for start in range(0, len(vector_rows), self.block_rows):
+            chunk = vector_rows[start:start + self.block_rows]
+            compacted[start:start + len(chunk)] = self._matrix[chunk]
+        compacted.flush()
+        del compacted
+        if self._codes is not None:
+            self._codes, self._scales = self._codes[vector_rows], self._scales[vector_rows]
+            self._codes_dirty = True
+        self._close_matrix()
+        self._obsolete_files.append(self._matrix_path)
+        self._vectors_file = name
+        self._vector_rows = list(range(len(vector_rows)))
+        self._used_rows = len(vector_rows)
+        self._row_maps = None
+        self._open_matrix()
+
+    def flush(self):
+        with self._lock:
+            if not self.dirty and not self._codes_dirty:
+                return
+            if self.dirty and self.dim is not None and self._used_rows - len(self.ids) > max(1024, len(self.ids)):
+                self._compact()
+            if self._matrix is not None:
+                self._matrix.flush()
+            if self.dirty:
+                self._generation = uuid.uuid4().hex
+            if self._codes is not None:
+                # Written before the records, which name the generation the codes belong to
+                tmp_path = f"{self._codes_path}.tmp"
+                with open(tmp_path, "wb") as f:
+                    np.savez(f, codes=self._codes[:self._used_rows], scales=self._scales[:self._used_rows],
+                             generation=np.array(self._generation))
+                os.replace(tmp_path, self._codes_path)
+                self._codes_dirty = False
+            if not self.dirty:
+                return
+            # The records switch readers to the new state in one rename; the vectors they point to are on disk
+            records = {"dim": self.dim, "dtype": self.dtype.name, "generation": self._generation,
+                       "vectors_file": self._vectors_file, "used_rows": self._used_rows,
+                       "ids": self.ids, "vector_rows": self._vector_rows,
+                       "documents": self.documents, "metadatas": self.metadatas}
+            tmp_path = f"{self._records_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f, ensure_ascii=False, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._records_path)
+            self._mtime = os.stat(self._records_path).st_mtime_ns
+            self.dirty = False
+            for path in self._obsolete_files:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Still mapped by another process (Windows); removed by a later flush
+                    continue
+            self._obsolete_files = [path for path in self._obsolete_files if os.path.exists(path)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory and recall@k of quantized search over a NumPy vector store")
+    parser.add_argument("directory", help="vector_db_dir of a store created with vector_backend: numpy")
+    parser.add_argument("--dtype", default="float32")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS[1:], default="int8")
+    parser.add_argument("--rescore-factor", type=int, default=None)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    store = NumpyStore(args.directory, dtype=args.dtype, quantization=args.quantization,
+                       rescore_factor=args.rescore_factor)
+    stats = store.memory_stats()
+    print(f"{stats['rows']} vectors: {stats['full_precision_mb']} MB full precision, "
+          f"{stats['search_index_mb']} MB {args.quantization} index ({stats['memory_saved_mb']} MB saved)")
+    recall = store.evaluate_recall(top_k=args.top_k, n_queries=args.queries)
+    print(f"recall@{args.top_k} vs exact search (rescore x{store.rescore_factor}): {recall:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import inspect
+import json
+import os
+import time
+from typing import List, Dict, Any, Tuple
+
+import numpy as np
+
+from core.metrics import console
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _read_sentence_transformer_layout(model_path: str) -> Tuple[str, str, bool, int]:
+    """Transformer dir, pooling mode, normalize flag and max_seq_length of a local SentenceTransformer"""
+    modules = _read_json(os.path.join(model_path, "modules.json")) or []
+    transformer_dir, pooling_dir, normalize = model_path, None, False
+    for module in modules:
+        module_type = module.get("type", "")
+        module_dir = os.path.join(model_path, module.get("path", ""))
+        if module_type.endswith("Transformer"):
+            transformer_dir = module_dir
+        elif module_type.endswith("Pooling"):
+            pooling_dir = module_dir
+        elif module_type.endswith("Normalize"):
+            normalize = True
+        else:
+            # Only the transformer is exported: Dense and other layers would silently be skipped
+            raise ValueError(f"The onnx embedding backend does not support the '{module_type}' module "
+                             f"of {model_path}, use the torch backend")
+
+    pooling = "mean"
+    pooling_config = _read_json(os.path.join(pooling_dir, "config.json")) if pooling_dir else {}
+    if "pooling_mode" in pooling_config:
+        pooling = pooling_config["pooling_mode"]
+    elif pooling_config.get("pooling_mode_cls_token"):
+        pooling = "cls"
+    elif pooling_config.get("pooling_mode_max_tokens"):
+        pooling = "max"
+
+    st_config = _read_json(os.path.join(transformer_dir, "sentence_bert_config.json"))
+    return transformer_dir, pooling, normalize, st_config.get("max_seq_length", 0)
+
+
+class OnnxEmbeddingBackend:
+    """Runs a local SentenceTransformer through ONNX Runtime on CPU.
+
+    The transformer is exported once to ``<model_path>/onnx/model.onnx`` (and
+    ``model_int8.onnx`` with dynamic int8 weight quantization), later starts
+    load the cached file. Pooling and normalization follow the model's
+    SentenceTransformer config so vectors match the PyTorch backend.
+    """
+
+    def __init__(self, model_path: str, quantize: bool = False, num_threads: int = 0):
+        try:
+            import onnxruntime as ort
+        except ImportError as e:
+            raise ImportError("The onnx embedding backend needs 'onnxruntime' (pip install onnxruntime onnx)") from e
+        from transformers import AutoTokenizer
+
+        self.model_path = model_path
+        self.quantize = quantize
+        self.transformer_dir, self.pooling, self.normalize, max_seq_length = \
+            _read_sentence_transformer_layout(model_path)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.transformer_dir)
+        self.max_seq_length = max_seq_length or min(self.tokenizer.model_max_length, 512)
+
+        onnx_path = self._ensure_exported()
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+        self.embedding_size = self.session.get_outputs()[0].shape[-1]
+        console(f"ONNX embedding backend ready ({os.path.basename(onnx_path)})")
+
+    def _ensure_exported(self) -> str:
+        onnx_dir = os.path.join(self.model_path, "onnx")
+        fp32_path = os.path.join(onnx_dir, "model.onnx")
+        int8_path = os.path.join(onnx_dir, "model_int8.onnx")
+        if not os.path.exists(fp32_path):
+            os.makedirs(onnx_dir, exist_ok=True)
+            self._export(fp32_path)
+        if not self.quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            console("Quantizing ONNX embedding model to int8...")
+            tmp_path = int8_path + ".tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        return int8_path
+
+    def _export(self, onnx_path: str):
+        import torch
+        from transformers import AutoModel
+
+        console(f"Exporting embedding model to ONNX: {onnx_path}")
+        model = AutoModel.from_pretrained(self.transformer_dir)
+        model.eval()
+        input_names = [name for name in self.tokenizer.model_input_names
+                       if name in ("input_ids", "attention_mask", "token_type_ids")]
+        sample = self.tokenizer(["sample text"], return_tensors="pt")
+
+        class HiddenStates(torch.nn.Module):
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *args):
+                return self.inner(**dict(zip(input_names, args))).last_hidden_state
+
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+        # torch >= 2.5 can export through dynamo; the TorchScript exporter handles these models
+        # on every supported torch version, older ones do not know the argument
+        export_kwargs = {}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False
+        tmp_path = onnx_path + ".tmp"
+        with torch.no_grad():
+            torch.onnx.export(
+                HiddenStates(model),
+                tuple(sample[name] for name in input_names),
+                tmp_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=17,
+                **export_kwargs
+            )
+        os.replace(tmp_path, onnx_path)
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.embedding_size), dtype=np.float32)
+        # Sorting by length keeps padding (and wasted compute) per batch small
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = np.empty((len(texts), self.embedding_size), dtype=np.float32)
+        for start in range(0, len(texts), batch_size):
+            idx = order[start:start + batch_size]
+            encoded = self.tokenizer(
+                [texts[i] for i in idx],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np"
+            )
+            feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            out[idx] = self._pool(hidden, encoded["attention_mask"])
+        return out
+
+    def _pool(self, hidden: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        mask = attention_mask[..., None].astype(np.float32)
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        elif self.pooling == "max":
+            pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+def measure_drift(model_path: str, texts: List[str], quantize: bool = True) -> Dict[str, Any]:
+    """Compare ONNX vectors (and speed) against the PyTorch SentenceTransformer on the same texts"""
+    from sentence_transformers import SentenceTransformer
+
+    baseline_model = SentenceTransformer(model_path, device="cpu")
+    onnx_model = OnnxEmbeddingBackend(model_path, quantize=quantize)
+
+    start = time.perf_counter()
+    baseline = baseline_model.encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    torch_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    candidate = onnx_model.encode(texts)
+    onnx_seconds = time.perf_counter() - start
+
+    def unit(m):
+        return m / np.clip(np.linalg.norm(m, axis=1, keepdims=True), 1e-12, None)
+
+    cosine = (unit(baseline) * unit(candidate)).sum(axis=1)
+    # Does the ONNX model rank neighbours the same way? Top-1 agreement over the sample itself
+    same_top1 = float(np.mean(
+        np.argsort(-unit(baseline) @ unit(baseline).T, axis=1)[:, 1]
+        == np.argsort(-unit(candidate) @ unit(candidate).T, axis=1)[:, 1]
+    )) if len(texts) > 1 else 1.0
+    return {
+        "texts": len(texts),
+        "quantized": quantize,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "max_abs_diff": float(np.abs(baseline - candidate).max()),
+        "neighbour_agreement": same_top1,
+        "torch_seconds": round(torch_seconds, 4),
+        "onnx_seconds": round(onnx_seconds, 4),
+        "speedup": round(torch_seconds / onnx_seconds, 2) if onnx_seconds else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import yaml
+
+    parser = argparse.ArgumentParser(description="Check ONNX embedding drift against the PyTorch model")
+    parser.add_argument("--config", default="config.yaml")
+    parser.add_argument("--pdf", help="PDF whose chunks are used as sample texts (default: pdf_path from config)")
+    parser.add_argument("--samples", type=int, default=256)
+    parser.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+
+    from core.pdf_processor import PDFProcessor
+    chunks = PDFProcessor().load_pdf(
+        args.pdf or config["pdf_path"],
+        chunk_size=config.get("chunk_size", 400),
+        chunk_overlap=config.get("chunk_overlap", 50)
+    )[:args.samples]
+    report = measure_drift(config["embedding_model_path"], chunks, quantize=not args.no_quantize)
+    print(json.dumps(report, indent=2))
@@ -1,33 +1,142 @@
 from PyPDF2 import PdfReader
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import List, Dict, Any, Iterable, Iterator, Tuple
+import multiprocessing as mp
 import os
+import threading
+
+from core.metrics import console
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    # Runs in a worker process, so it opens its own reader
+    reader = PdfReader(pdf_path)
+    pages = []
+    for page_num in range(start, end):
+        page_text = reader.pages[page_num].extract_text() or ""
+        if page_text.strip():
+            pages.append((page_num + 1, page_text))
+    return pages
 
 
 class PDFProcessor:
-    def __init__(self):
+    def __init__(self, extract_workers: int = 1, pages_per_task: int = 8):
         self.text_chunks = []
+        self.extract_workers = max(1, extract_workers or 1)
+        self.pages_per_task = max(1, pages_per_task)
+        self._pool = None
+        self._pool_lock = threading.Lock()
 
     def load_pdf(self, pdf_path: str, chunk_size: int = 300, chunk_overlap: int = 50) -> List[str]:
-        print(f"Loading PDF: {pdf_path}")
+        console(f"Loading PDF: {pdf_path}")
         if not os.path.exists(pdf_path):
             raise FileNotFoundError(f"PDF not found: {pdf_path}")
 
         try:
-            reader = PdfReader(pdf_path)
-            full_text = ""
-            for page_num, page in enumerate(reader.pages):
-                page_text = page.extract_text() or ""
-                if page_text.strip():
-                    full_text += f"Page {page_num + 1}: {page_text}\n"
-
-            print(f"Extracted text from {len(reader.pages)} pages")
-            self.text_chunks = self._split_text(full_text, chunk_size, chunk_overlap)
-            print(f"Created {len(self.text_chunks)} chunks")
+            self.text_chunks = list(self.iter_chunks(pdf_path, chunk_size, chunk_overlap))
+            console(f"Extracted text from {self.count_pages(pdf_path)} pages")
+            console(f"Created {len(self.text_chunks)} chunks")
             return self.text_chunks
         except Exception as e:
             print(f"PDF load error: {e}")
             return []
 
+    def count_pages(self, pdf_path: str) -> int:
+        return len(PdfReader(pdf_path).pages)
+
+    def iter_pages(self, pdf_path: str) -> Iterator[Tuple[int, str]]:
+        """Yield (page_number, text) for every page with text, in page order"""
+        for _, page_num, page_text in self.iter_pages_many([pdf_path]):
+            yield page_num, page_text
+
+    def iter_pages_many(self, pdf_paths: List[str]) -> Iterator[Tuple[str, int, str]]:
+        """Yield (pdf_path, page_number, text) for several files, in file and page order.
+
+        With extract_workers > 1, page ranges of all files are extracted by a
+        process pool. Only a small window of ranges is in flight at a time so
+        memory stays bounded, and results are yielded in submission order.
+        """
+        for pdf_path in pdf_paths:
+            if not os.path.exists(pdf_path):
+                raise FileNotFoundError(f"PDF not found: {pdf_path}")
+
+        if self.extract_workers <= 1:
+            for pdf_path in pdf_paths:
+                reader = PdfReader(pdf_path)
+                for page_num, page in enumerate(reader.pages):
+                    page_text = page.extract_text() or ""
+                    if page_text.strip():
+                        yield pdf_path, page_num + 1, page_text
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        try:
+            for pdf_path, start, end in self._page_ranges(pdf_paths):
+                pending.append((pdf_path, pool.submit(_extract_page_range, pdf_path, start, end)))
+                if len(pending) >= self.extract_workers * 2:
+                    done_path, future = pending.popleft()
+                    for page_num, page_text in future.result():
+                        yield done_path, page_num, page_text
+            while pending:
+                done_path, future = pending.popleft()
+                for page_num, page_text in future.result():
+                    yield done_path, page_num, page_text
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def _page_ranges(self, pdf_paths: List[str]) -> Iterator[Tuple[str, int, int]]:
+        for pdf_path in pdf_paths:
+            total = self.count_pages(pdf_path)
+            for start in range(0, total, self.pages_per_task):
+                yield pdf_path, start, min(start + self.pages_per_task, total)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Kept alive between documents so bulk loads do not pay worker startup per file.
+        # spawn on every platform: forking a process whose torch/OpenMP threads are running
+        # can deadlock. Spawned workers re-import the entry script as __mp_main__, so entry
+        # points keep model loading and server start under `if __name__ == "__main__":`;
+        # the task itself only needs this module and PyPDF2.
+        with self._pool_lock:
+            if self._pool is None:
+                console(f"Starting {self.extract_workers} PDF extraction workers")
+                self._pool = ProcessPoolExecutor(max_workers=self.extract_workers,
+                                                 mp_context=mp.get_context("spawn"))
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    def iter_chunks(self, pdf_path: str, chunk_size: int = 300, chunk_overlap: int = 50) -> Iterator[str]:
+        return self.chunk_pages(self.iter_pages(pdf_path), chunk_size, chunk_overlap)
+
+    def chunk_pages(self, pages: Iterable[Tuple[int, str]], chunk_size: int,
+                    chunk_overlap: int) -> Iterator[str]:
+        """Streaming equivalent of _split_text over the "Page N: ..." text of all pages.
+
+        Only the words of the chunk being built are held, so memory does not
+        grow with the document, and the overlap carries across page breaks.
+        """
+        step = chunk_size - chunk_overlap
+        if step <= 0:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        buffer = []
+        for page_num, page_text in pages:
+            buffer.append("Page")
+            buffer.append(f"{page_num}:")
+            buffer.extend(page_text.split())
+            while len(buffer) >= chunk_size:
+                yield " ".join(buffer[:chunk_size])
+                del buffer[:step]
+        # Same tail as _split_text: every remaining start position yields a chunk
+        for i in range(0, len(buffer), step):
+            yield " ".join(buffer[i:i + chunk_size])
+
     def _split_text(self, text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
         words = text.split()
         if not words:
@@ -45,4 +154,4 @@ class PDFProcessor:
         return {
             "total_chunks": len(self.text_chunks),
             "sample_chunk": self.text_chunks[0][:200] + "..."
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,86 @@
+import copy
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+
+class PrefixKVCache:
+    """Keeps past-key-values of prompt prefixes so generation only prefills the new tokens.
+
+    Pinned entries (the fixed instruction preamble) are never evicted; recent
+    prompts live in a small LRU. A lookup returns a private copy of the best
+    match cropped to the tokens it shares with the new prompt, because
+    ``generate`` extends the cache in place.
+    """
+
+    def __init__(self, max_entries: int = 4, min_tokens: int = 8):
+        self.max_entries = max_entries
+        self.min_tokens = min_tokens
+        self.hits = 0
+        self.misses = 0
+        self.tokens_reused = 0
+        self._pinned: Dict[Tuple[int, ...], Any] = {}
+        self._recent: "OrderedDict[Tuple[int, ...], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _crop(state: Any, length: int):
+        # A negative crop removes tokens from the end, supported by all Cache versions
+        extra = state.get_seq_length() - length
+        if extra > 0:
+            state.crop(-extra)
+
+    @staticmethod
+    def _common_prefix(a: torch.Tensor, b: torch.Tensor) -> int:
+        n = min(len(a), len(b))
+        mismatch = (a[:n] != b[:n]).nonzero()
+        return int(mismatch[0]) if len(mismatch) else n
+
+    def lookup(self, input_ids: torch.Tensor) -> Tuple[Optional[Any], int]:
+        """Best cached state for a 1-D prompt, as (cache copy, cached length) or (None, 0)"""
+        with self._lock:
+            best_key, best_len = None, 0
+            for key in list(self._pinned) + list(self._recent):
+                shared = self._common_prefix(torch.tensor(key), input_ids)
+                if shared > best_len:
+                    best_key, best_len = key, shared
+            # At least one prompt token must be left for generate to run a forward pass on
+            best_len = min(best_len, len(input_ids) - 1)
+            if best_key is None or best_len < self.min_tokens:
+                self.misses += 1
+                return None, 0
+            if best_key in self._recent:
+                self._recent.move_to_end(best_key)
+            state = self._pinned.get(best_key, self._recent.get(best_key))
+            self.hits += 1
+            self.tokens_reused += best_len
+        state = copy.deepcopy(state)
+        self._crop(state, best_len)
+        return state, best_len
+
+    def store(self, input_ids: torch.Tensor, state: Any, pinned: bool = False):
+        """Remember ``state`` for the prompt ``input_ids`` (state is cropped to the prompt length)"""
+        key = tuple(int(t) for t in input_ids)
+        self._crop(state, len(key))
+        with self._lock:
+            if pinned:
+                self._pinned[key] = state
+                return
+            if self.max_entries <= 0:
+                return
+            self._recent[key] = state
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "tokens_reused": self.tokens_reused,
+            "entries": len(self._pinned) + len(self._recent),
+        }
@@ -0,0 +1,18 @@
+GENERATION_ERROR_MESSAGE = "I'm sorry, I ran into a technical issue while generating a response."
+
+
+class GenerationError(RuntimeError):
+    """A streamed generation failed; the text streamed so far is not an answer to keep"""
+
+PROMPT_PREAMBLE = 'Use only the following context to answer the question. If unsure, say "I don\'t know."'
+
+
+def build_prompt(question: str, context: str) -> str:
+    return f"""{PROMPT_PREAMBLE}
+
+Context:
+{context}
+
+Question: {question}
+
+Answer:""".strip()
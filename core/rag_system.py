@@ -1,7 +1,13 @@
-from pdf_processor import PDFProcessor
-from embedding_model import EmbeddingModel
-from vector_database import VectorDatabase
-from local_llm import LocalLLM
+from core.pdf_processor import PDFProcessor
+from core.embedding_model import EmbeddingModel
+from core.vector_database import VectorDatabase
+from core.local_llm import LocalLLM
+from core.ingestion import ingest_pdf, ingest_pdfs
+from core.prompt import build_prompt, GENERATION_ERROR_MESSAGE
+from core.answer_cache import SemanticAnswerCache
+from core.context_packer import ContextPacker
+from core.batch_qa import read_questions, run_batch_qa
+from core.metrics import metrics, console, log_event
 from typing import List, Dict, Any
 import os
 
@@ -16,70 +22,173 @@ class RAGSystem:
             max_length: int = 256,
             temperature: float = 0.3,
             vector_db_dir: str = "./chroma_db",
-            top_k: int = 2
+            top_k: int = 2,
+            ingest_batch_size: int = 64,
+            extract_workers: int = 1,
+            extract_pages_per_task: int = 8,
+            embedding_cache_dir: str = None,
+            embedding_cache_max_mb: float = 512,
+            embedding_backend: str = "torch",
+            embedding_onnx_quantize: bool = False,
+            answer_cache_size: int = 256,
+            answer_cache_threshold: float = 0.95,
+            llm_options: Dict[str, Any] = None,
+            prompt_token_budget: int = 1024,
+            hybrid_search: bool = False,
+            rrf_k: int = 60,
+            vector_backend: str = "chroma",
+            vector_dtype: str = "float32",
+            vector_quantization: str = "none",
+            vector_rescore_factor: int = None,
+            chunking: str = "words",
+            two_level_search: bool = False,
+            docs_to_expand: int = 5,
+            doc_section_chunks: int = 0
     ):
-        print("Initializing Edge RAG System...")
-        print("=" * 60)
+        console("Initializing Edge RAG System...")
+        console("=" * 60)
 
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.chunking = chunking
         self.max_length = max_length
         self.temperature = temperature
         self.top_k = top_k
+        self.ingest_batch_size = ingest_batch_size
 
-        self.pdf_processor = PDFProcessor()
-        self.embedding_model = EmbeddingModel(embedding_model_path)
-        self.vector_db = VectorDatabase(persist_directory=vector_db_dir)
-        self.llm = LocalLLM(llm_model_path, max_length=max_length)
+        self.pdf_processor = PDFProcessor(
+            extract_workers=extract_workers,
+            pages_per_task=extract_pages_per_task
+        )
+        self.embedding_model = EmbeddingModel(
+            embedding_model_path,
+            cache_dir=embedding_cache_dir,
+            cache_max_mb=embedding_cache_max_mb,
+            backend=embedding_backend,
+            onnx_quantize=embedding_onnx_quantize
+        )
+        self.vector_db = VectorDatabase(
+            persist_directory=vector_db_dir,
+            hybrid_search=hybrid_search,
+            rrf_k=rrf_k,
+            backend=vector_backend,
+            vector_dtype=vector_dtype,
+            quantization=vector_quantization,
+            rescore_factor=vector_rescore_factor,
+            two_level_search=two_level_search,
+            docs_to_expand=docs_to_expand,
+            section_chunks=doc_section_chunks
+        )
+        self.llm = LocalLLM(llm_model_path, max_length=max_length, **(llm_options or {}))
+        self.context_packer = ContextPacker(self.llm.tokenizer, max_prompt_tokens=prompt_token_budget)
+        self.answer_cache = SemanticAnswerCache(max_entries=answer_cache_size, threshold=answer_cache_threshold)
 
         self._setup_knowledge_base(pdf_path)
-        print("Edge RAG ready!")
-        print("=" * 60)
+        console("Edge RAG ready!")
+        console("=" * 60)
 
     def _setup_knowledge_base(self, pdf_path: str):
-        text_chunks = self.pdf_processor.load_pdf(
+        stats = ingest_pdf(
             pdf_path,
+            self.pdf_processor,
+            self.embedding_model,
+            self.vector_db,
             chunk_size=self.chunk_size,
-            chunk_overlap=self.chunk_overlap
+            chunk_overlap=self.chunk_overlap,
+            batch_size=self.ingest_batch_size,
+            progress=self._report_progress,
+            chunking=self.chunking
         )
-        if not text_chunks:
+        if not stats["chunks"]:
             raise ValueError("No text extracted from PDF!")
 
-        embeddings = self.embedding_model.create_embeddings(text_chunks)
-        metadatas = [{"chunk_id": i, "source": os.path.basename(pdf_path)} for i in range(len(text_chunks))]
-        self.vector_db.add_documents(text_chunks, embeddings, metadatas)
+        console(f"Knowledge Base Summary:")
+        console(f"   - Chunks: {stats['chunks']} ({stats['embedded']} newly embedded)")
+        console(f"   - Stored: {self.vector_db.get_collection_info()['total_documents']}")
+        console(f"   - Embed Dim: {self.embedding_model.embedding_size}")
+
+    def ingest_files(self, pdf_paths: List[str]) -> List[Dict[str, Any]]:
+        """Add several PDFs to the knowledge base, extraction overlapping across files"""
+        results = ingest_pdfs(
+            pdf_paths,
+            self.pdf_processor,
+            self.embedding_model,
+            self.vector_db,
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap,
+            batch_size=self.ingest_batch_size,
+            progress=self._report_progress,
+            chunking=self.chunking
+        )
+        for stats in results:
+            console(f"   - {stats['source']}: {stats['chunks']} chunks ({stats['embedded']} newly embedded)")
+        console(f"   - Stored: {self.vector_db.get_collection_info()['total_documents']}")
+        return results
 
-        print(f"Knowledge Base Summary:")
-        print(f"   - Chunks: {len(text_chunks)}")
-        print(f"   - Embed Dim: {self.embedding_model.embedding_size}")
+    def _report_progress(self, stats: Dict[str, Any]):
+        console(f"   ... page {stats['pages']}/{stats['total_pages']}, "
+                f"{stats['chunks']} chunks ({stats['embedded']} embedded)")
 
     def ask_question(self, question: str) -> Dict[str, Any]:  # top_k now from config
         print(f"\n❓ {question}")
         print("-" * 50)
 
+        timings = {}
+        metrics.inc("rag_queries_total", entry="cli")
         try:
-            q_emb = self.embedding_model.create_embeddings([question])[0]
-            similar = self.vector_db.search_similar(q_emb, top_k=self.top_k)
-
-            print(f"📚 Retrieved {len(similar)} context chunks.")
-            context = "\n\n".join([doc['document'] for doc in similar])
-            prompt = self._create_prompt(question, context)
-            answer = self.llm.generate_response(prompt, temperature=self.temperature)
+            kb_version = self.vector_db.version
+            with metrics.stage_timer("embed", timings):
+                q_emb = self.embedding_model.create_embeddings([question])[0]
+            cached = self.answer_cache.lookup(q_emb, kb_version)
+            metrics.inc("rag_answer_cache_total", result="hit" if cached else "miss")
+            if cached:
+                print(f"💡 Answer (cached, similarity {cached['similarity']:.3f}):\n{cached['answer']}")
+                print("-" * 50)
+                log_event("query", entry="cli", cached=True, **timings)
+                return {"question": question, "answer": cached["answer"],
+                        "context_chunks": cached["context_chunks"], "cached": True}
+
+            with metrics.stage_timer("retrieve", timings):
+                similar = self.vector_db.search_similar(q_emb, top_k=self.top_k, query_text=question)
+
+            with metrics.stage_timer("prompt_build", timings):
+                context, packed = self.context_packer.pack(question, similar)
+                prompt = self._create_prompt(question, context)
+            console(f"📚 Retrieved {len(similar)} context chunks, packed into {len(packed)}.")
+            generation = {}
+            with metrics.stage_timer("generate", timings):
+                answer = self.llm.generate_response(prompt, temperature=self.temperature, stats=generation)
+            if answer != GENERATION_ERROR_MESSAGE:
+                self.answer_cache.store(q_emb, kb_version, {"answer": answer, "context_chunks": packed})
 
             print(f"💡 Answer:\n{answer}")
             print("-" * 50)
-            return {"question": question, "answer": answer, "context_chunks": similar}
+            log_event("query", entry="cli", cached=False, **timings, **generation)
+            return {"question": question, "answer": answer, "context_chunks": packed}
 
         except Exception as e:
             print(f"Error: {e}")
             return {"error": str(e)}
 
-    def _create_prompt(self, question: str, context: str) -> str:
-        return f"""Use only the following context to answer the question. If unsure, say "I don't know."
-
-Context:
-{context}
-
-Question: {question}
+    def answer_questions_file(self, questions_path: str, output_path: str, batch_size: int = 0,
+                              max_batch_size: int = 8, memory_fraction: float = 0.5,
+                              resume: bool = True) -> Dict[str, Any]:
+        """Batch mode: answers every question of a .jsonl/.csv file into a JSONL file, see run_batch_qa"""
+        return run_batch_qa(
+            read_questions(questions_path),
+            output_path,
+            self.embedding_model,
+            self.vector_db,
+            self.llm,
+            self.context_packer,
+            top_k=self.top_k,
+            temperature=self.temperature,
+            batch_size=batch_size,
+            max_batch_size=max_batch_size,
+            memory_fraction=memory_fraction,
+            resume=resume,
+            progress=lambda stats: console(f"   ... {stats['answered']} answered")
+        )
 
-Answer:""".strip()
\ No newline at end of file
+    def _create_prompt(self, question: str, context: str) -> str:
+        return build_prompt(question, context)
\ No newline at end of file
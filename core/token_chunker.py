@@ -0,0 +1,151 @@
+import re
+from typing import List, Iterable, Iterator, Tuple
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+# End of sentence followed by what looks like the start of the next one ("e.g. foo" is not split)
+_SENTENCE_RE = re.compile(r"(?<=[.!?])[\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+
+# (text, page number, token count) of one sentence
+Unit = Tuple[str, int, int]
+
+
+def split_sentences(text: str) -> List[List[str]]:
+    """Paragraphs of a page as lists of whitespace-normalized sentences"""
+    paragraphs = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        sentences = [" ".join(s.split()) for s in _SENTENCE_RE.split(paragraph)]
+        sentences = [s for s in sentences if s]
+        if sentences:
+            paragraphs.append(sentences)
+    return paragraphs
+
+
+class TokenChunker:
+    """Packs sentences into chunks of at most ``max_tokens`` tokens of the embedding model.
+
+    Chunks end at sentence boundaries, and a paragraph that does not fit in
+    a chunk that is already half full starts a new chunk. Consecutive
+    chunks share their last sentences up to ``overlap_tokens``. Only a
+    sentence longer than ``max_tokens`` is cut mid-sentence, at word
+    boundaries, and a word longer than that at token boundaries. Sentences
+    are tokenized in one batch per ``pages_per_batch`` pages, which matters
+    for large documents: a fast tokenizer encodes a batch in parallel.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = 0, pages_per_batch: int = 16):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens must be positive")
+        if not 0 <= overlap_tokens < max_tokens:
+            raise ValueError("overlap_tokens must be smaller than max_tokens")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.pages_per_batch = max(1, pages_per_batch)
+
+    @classmethod
+    def for_model(cls, embedding_model, chunk_size: int = 0, chunk_overlap: int = 0) -> "TokenChunker":
+        """Chunker for an EmbeddingModel; ``chunk_size`` (tokens) is capped at what the model reads"""
+        tokenizer = embedding_model.tokenizer
+        special = tokenizer.num_special_tokens_to_add() if hasattr(tokenizer, "num_special_tokens_to_add") else 2
+        limit = embedding_model.max_seq_length - special
+        max_tokens = min(chunk_size, limit) if chunk_size else limit
+        return cls(tokenizer, max_tokens, min(chunk_overlap, max_tokens // 2))
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        if not texts:
+            return []
+        # verbose=False: counting sentences longer than the model limit is expected here
+        encoded = self.tokenizer(texts, add_special_tokens=False, verbose=False, return_attention_mask=False,
+                                 return_token_type_ids=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def chunk_pages(self, pages: Iterable[Tuple[int, str]]) -> Iterator[Tuple[str, int, int]]:
+        """Yield (text, page_start, page_end) for a stream of (page_number, text) pages"""
+        current: List[Unit] = []
+        used = 0
+        fresh = 0  # sentences of current not carried over from the previous chunk
+        for units in self._paragraphs(pages):
+            if fresh and used + sum(unit[2] for unit in units) > self.max_tokens and used >= self.max_tokens // 2:
+                yield self._emit(current)
+                current, fresh = self._overlap(current), 0
+                used = sum(unit[2] for unit in current)
+            for unit in units:
+                if unit[2] > self.max_tokens:
+                    if fresh:
+                        yield self._emit(current)
+                    current, used, fresh = [], 0, 0
+                    yield from self._split_long(unit)
+                    continue
+                if used + unit[2] > self.max_tokens:
+                    if fresh:
+                        yield self._emit(current)
+                        current, fresh = self._overlap(current), 0
+                        used = sum(u[2] for u in current)
+                    while current and used + unit[2] > self.max_tokens:
+                        used -= current.pop(0)[2]
+                current.append(unit)
+                used += unit[2]
+                fresh += 1
+        if fresh:
+            yield self._emit(current)
+
+    def _paragraphs(self, pages: Iterable[Tuple[int, str]]) -> Iterator[List[Unit]]:
+        batch = []
+        for page in pages:
+            batch.append(page)
+            if len(batch) >= self.pages_per_batch:
+                yield from self._tokenize_batch(batch)
+                batch = []
+        yield from self._tokenize_batch(batch)
+
+    def _tokenize_batch(self, pages: List[Tuple[int, str]]) -> Iterator[List[Unit]]:
+        paragraphs = [(page_num, sentences) for page_num, text in pages for sentences in split_sentences(text)]
+        counts = iter(self.count_tokens([s for _, sentences in paragraphs for s in sentences]))
+        for page_num, sentences in paragraphs:
+            yield [(sentence, page_num, next(counts)) for sentence in sentences]
+
+    def _overlap(self, current: List[Unit]) -> List[Unit]:
+        """Trailing sentences of a finished chunk that fit in overlap_tokens"""
+        kept, total = [], 0
+        for unit in reversed(current[1:]):
+            if total + unit[2] > self.overlap_tokens:
+                break
+            kept.insert(0, unit)
+            total += unit[2]
+        return kept
+
+    @staticmethod
+    def _emit(current: List[Unit]) -> Tuple[str, int, int]:
+        return " ".join(unit[0] for unit in current), current[0][1], current[-1][1]
+
+    def _split_long(self, unit: Unit) -> Iterator[Tuple[str, int, int]]:
+        text, page_num, n_tokens = unit
+        if getattr(self.tokenizer, "is_fast", False):
+            offsets = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                     verbose=False)["offset_mapping"]
+            start = done = 0  # done: tokens covered by the chunks so far
+            while True:
+                end = min(start + self.max_tokens, len(offsets))
+                # Never cut inside a word: its pieces would tokenize differently on their own
+                cut = end
+                while done < cut < len(offsets) and offsets[cut][0] == offsets[cut - 1][1]:
+                    cut -= 1
+                # Unless no word boundary past the previous chunk fits: then cut hard at the window end
+                if cut > done:
+                    end = cut
+                yield text[offsets[start][0]:offsets[end - 1][1]], page_num, page_num
+                if end == len(offsets):
+                    return
+                done = end
+                start = max(start + 1, end - self.overlap_tokens)
+                while start < end and offsets[start][0] == offsets[start - 1][1]:
+                    start += 1
+        # Slow tokenizers have no offsets: cut by words at the average tokens per word
+        words = text.split()
+        step = self.max_tokens - self.overlap_tokens
+        per_chunk = max(1, len(words) * self.max_tokens // n_tokens)
+        word_step = max(1, len(words) * step // n_tokens)
+        for start in range(0, len(words), word_step):
+            yield " ".join(words[start:start + per_chunk]), page_num, page_num
+            if start + per_chunk >= len(words):
+                break
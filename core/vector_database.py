@@ -1,45 +1,294 @@
-import chromadb
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
+import hashlib
+import numpy as np
 import os
+import uuid
+
+from core.bm25_index import BM25Index, reciprocal_rank_fusion
+from core.metrics import console
+from core.vector_store import create_vector_store, MAX_BATCH
+
+# Representative vectors of whole documents (and sections) for two-level search
+DOCUMENT_COLLECTION = "rag_document_vectors"
+
+# First-stage hits fetched per document to expand when section vectors are stored:
+# several sections of one document may rank above the next document
+SECTION_CANDIDATES = 4
 
 class VectorDatabase:
-    def __init__(self, persist_directory: str = "./chroma_db"):
+    def __init__(self, persist_directory: str = "./chroma_db", hybrid_search: bool = False,
+                 rrf_k: int = 60, hybrid_candidates: int = 4, backend: str = "chroma",
+                 vector_dtype: str = "float32", quantization: str = "none", rescore_factor: int = None,
+                 two_level_search: bool = False, docs_to_expand: int = 5, section_chunks: int = 0):
         os.makedirs(persist_directory, exist_ok=True)
-        self.client = chromadb.PersistentClient(path=persist_directory)
-        self.collection = self.client.get_or_create_collection(
-            name="rag_documents",
-            metadata={"hnsw:space": "cosine"}
-        )
-        print("Vector DB ready")
-
-    def add_documents(self, texts: List[str], embeddings: List[List[float]], metadatas: List[Dict] = None):
-        ids = [f"doc_{i}" for i in range(len(texts))]
-        self.collection.add(
-            embeddings=embeddings,
-            documents=texts,
-            metadatas=metadatas or [{}] * len(texts),
-            ids=ids
-        )
-        print(f"Stored {len(texts)} docs")
+        # Shared through the persist dir so other processes notice changes too
+        self._version_path = os.path.join(persist_directory, "kb_version")
+        self.backend = backend
+        self.store = create_vector_store(backend, persist_directory, vector_dtype,
+                                         quantization=quantization, rescore_factor=rescore_factor)
+        self.rrf_k = rrf_k
+        self.hybrid_candidates = hybrid_candidates
+        self.bm25 = None
+        if hybrid_search:
+            self.bm25 = BM25Index(os.path.join(persist_directory, "bm25_index.npz"))
+            self._sync_lexical_index()
+        # Two-level search: documents are ranked by their representative vectors first,
+        # then only the chunks of the best ``docs_to_expand`` documents are searched
+        self.docs_to_expand = docs_to_expand
+        self.section_chunks = section_chunks
+        self.doc_store = None
+        if two_level_search:
+            self.doc_store = create_vector_store(backend, persist_directory, vector_dtype,
+                                                 collection=DOCUMENT_COLLECTION)
+            self._sync_document_index()
+        console("Vector DB ready")
+
+    def _sync_lexical_index(self):
+        # One-off rebuild when the index is missing or out of step with the collection
+        if len(self.bm25) == self.store.count():
+            return
+        console("Rebuilding BM25 index from the collection...")
+        self.bm25.clear()
+        offset = 0
+        while True:
+            page = self.store.get(include=["documents"], limit=MAX_BATCH, offset=offset)
+            if not page["ids"]:
+                break
+            self.bm25.add(page["ids"], page["documents"])
+            offset += len(page["ids"])
+        self.bm25.save()
+
+    def _sync_document_index(self):
+        # Sources stored while two-level search was off, or interrupted before their vectors
+        # were written, would never be searched: build them; drop vectors of deleted sources
+        sources = set(self.list_sources())
+        indexed = {}
+        found = self.doc_store.get(include=["metadatas"])
+        for doc_id, metadata in zip(found["ids"], found["metadatas"]):
+            indexed.setdefault((metadata or {}).get("source"), []).append(doc_id)
+        missing = sources - set(indexed)
+        orphans = [doc_id for source, doc_ids in indexed.items() if source not in sources for doc_id in doc_ids]
+        if not missing and not orphans:
+            return
+        console(f"Syncing document vectors: {len(missing)} sources to add, {len(orphans)} stale vectors")
+        self.doc_store.delete(orphans)
+        for source in sorted(missing):
+            self.update_source_vectors(source)
+        self.doc_store.flush()
+
+    def update_source_vectors(self, source: str, if_missing: bool = False) -> int:
+        """Recompute the representative vectors of ``source`` from its stored chunks.
+
+        The document vector is the normalized mean of the chunk vectors; with
+        ``section_chunks`` set, every run of that many consecutive chunks also
+        gets a section vector, so a document matching in one section is not
+        lost in its average. No-op without two-level search. Returns the
+        number of vectors written.
+        """
+        if self.doc_store is None:
+            return 0
+        existing = self.doc_store.get(where={"source": source}, include=[])["ids"]
+        if existing and if_missing:
+            return 0
+        found = self.store.get(where={"source": source}, include=["metadatas", "embeddings"])
+        self.doc_store.delete(existing)
+        if not found["ids"]:
+            return 0
+        order = sorted(range(len(found["ids"])), key=lambda i: (found["metadatas"][i] or {}).get("chunk_id", i))
+        vectors = np.asarray([found["embeddings"][i] for i in order], dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        spans = [("document", 0, len(vectors))]
+        if self.section_chunks and len(vectors) > self.section_chunks:
+            spans += [("section", start, min(start + self.section_chunks, len(vectors)))
+                      for start in range(0, len(vectors), self.section_chunks)]
+        source_hash = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        ids, embeddings, metadatas = [], [], []
+        for level, start, end in spans:
+            ids.append(f"{source_hash}_{level}_{start}")
+            embeddings.append(vectors[start:end].mean(axis=0))
+            metadatas.append({"source": source, "level": level, "chunk_start": start, "chunk_end": end})
+        self.doc_store.upsert(ids, np.asarray(embeddings), [source] * len(ids), metadatas)
+        return len(ids)
+
+    def flush(self):
+        """Persist the store and the lexical index after a batch of changes"""
+        self.store.flush()
+        if self.doc_store is not None:
+            self.doc_store.flush()
+        if self.bm25 is not None:
+            self.bm25.save()
+
+    @property
+    def version(self) -> str:
+        """Token that changes whenever documents are added or removed"""
+        try:
+            with open(self._version_path, "r") as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return "0"
+
+    def _bump_version(self):
+        tmp_path = f"{self._version_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(uuid.uuid4().hex)
+        os.replace(tmp_path, self._version_path)
+
+    def add_documents(self, texts: List[str], embeddings: np.ndarray, metadatas: List[Dict] = None,
+                      ids: List[str] = None):
+        ids = ids or [f"doc_{i}" for i in range(len(texts))]
+        metadatas = metadatas or [{}] * len(texts)
+        self.store.upsert(ids, embeddings, texts, metadatas)
+        if self.bm25 is not None:
+            self.bm25.add(ids, texts)
+        self._bump_version()
+        console(f"Stored {len(texts)} docs")
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        self.store.update_metadatas(ids, metadatas)
 
-    def search_similar(self, query_embedding: List[float], top_k: int = 3) -> List[Dict]:
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
+    def get_existing_ids(self, ids: List[str]) -> Set[str]:
+        return set(self.store.get(ids=ids, include=[])["ids"])
+
+    def get_source_ids(self, source: str) -> List[str]:
+        return self.store.get(where={"source": source}, include=[])["ids"]
+
+    def count_source_version(self, source: str, doc_hash: str, ingest_key: str) -> int:
+        """Number of stored chunks of ``source`` if its stored version is complete, else 0"""
+        found = self.store.get(
+            where={"$and": [{"source": source}, {"doc_hash": doc_hash}, {"ingest_key": ingest_key}]},
+            include=["metadatas"]
         )
-        formatted = []
-        for i in range(len(results['documents'][0])):
-            formatted.append({
-                'document': results['documents'][0][i],
-                'metadata': results['metadatas'][0][i] if results['metadatas'] else {},
-                'distance': float(results['distances'][0][i]),
-                'id': results['ids'][0][i]
-            })
-        return formatted
+        if not found["ids"]:
+            return 0
+        # Only the last chunk of a fully ingested version carries the real count
+        if len(found["ids"]) != max(m.get("chunk_count", 0) for m in found["metadatas"]):
+            return 0
+        if len(self.get_source_ids(source)) != len(found["ids"]):
+            return 0
+        return len(found["ids"])
+
+    def delete_ids(self, ids: List[str]):
+        self.store.delete(ids)
+        if self.bm25 is not None:
+            self.bm25.remove(ids)
+        if ids:
+            self._bump_version()
+
+    def delete_source(self, source: str) -> int:
+        """Delete all chunks of one source document, returns the number removed"""
+        ids = self.get_source_ids(source)
+        self.delete_ids(ids)
+        if self.doc_store is not None:
+            self.doc_store.delete(self.doc_store.get(where={"source": source}, include=[])["ids"])
+        self.flush()
+        return len(ids)
+
+    def list_sources(self) -> Dict[str, int]:
+        sources = {}
+        metadatas = self.store.get(include=["metadatas"])["metadatas"] or []
+        for metadata in metadatas:
+            source = (metadata or {}).get("source", "")
+            sources[source] = sources.get(source, 0) + 1
+        return sources
+
+    def search_similar(self, query_embedding: np.ndarray, top_k: int = 3, query_text: str = None) -> List[Dict]:
+        query_texts = [query_text] if query_text is not None else None
+        return self.search_similar_batch([query_embedding], top_k=top_k, query_texts=query_texts)[0]
+
+    def search_similar_batch(self, query_embeddings: np.ndarray, top_k: int = 3,
+                             query_texts: List[str] = None) -> List[List[Dict]]:
+        """One query call for several embeddings, one result list per query.
+
+        With hybrid search enabled and query texts given, vector and BM25
+        candidates are fused with reciprocal rank fusion. With two-level
+        search the vector candidates come from the best documents only.
+        """
+        if self.bm25 is not None and query_texts is not None:
+            return self._search_hybrid(query_embeddings, query_texts, top_k)
+        return self._query_vectors(query_embeddings, top_k)
+
+    def select_documents(self, query_embeddings: np.ndarray) -> List[List[str]]:
+        """The ``docs_to_expand`` best sources per query by their representative vectors"""
+        n_candidates = self.docs_to_expand * (SECTION_CANDIDATES if self.section_chunks else 1)
+        selected = []
+        for hits in self.doc_store.query(query_embeddings, n_candidates):
+            sources = []
+            for hit in hits:
+                if hit["metadata"]["source"] not in sources:
+                    sources.append(hit["metadata"]["source"])
+            selected.append(sources[:self.docs_to_expand])
+        return selected
+
+    def _query_vectors(self, query_embeddings: np.ndarray, top_k: int) -> List[List[Dict]]:
+        if self.doc_store is None or not self.doc_store.count():
+            return self.store.query(query_embeddings, top_k)
+        # Still one call for the whole batch, each query filtered to its own documents
+        where = [{"source": {"$in": sources}} for sources in self.select_documents(query_embeddings)]
+        return self.store.query(query_embeddings, top_k, where=where)
+
+    def _search_hybrid(self, query_embeddings: np.ndarray, query_texts: List[str],
+                       top_k: int) -> List[List[Dict]]:
+        n_candidates = top_k * self.hybrid_candidates
+        # Lexical hits stay library-wide and can still surface a document the first stage missed
+        vector_results = self._query_vectors(query_embeddings, n_candidates)
+        self.bm25.reload_if_changed()
+
+        all_fused = []
+        missing = set()
+        for query_text, vector_hits in zip(query_texts, vector_results):
+            lexical_ids = [doc_id for doc_id, _ in self.bm25.search(query_text, n_candidates)]
+            fused = reciprocal_rank_fusion([[hit["id"] for hit in vector_hits], lexical_ids], k=self.rrf_k)
+            fused_ids = [doc_id for doc_id, _ in fused[:top_k]]
+            known = {hit["id"] for hit in vector_hits}
+            missing.update(doc_id for doc_id in fused_ids if doc_id not in known)
+            all_fused.append(fused_ids)
+
+        # Lexical-only hits are not in the vector results, fetch them (with embeddings for the distance)
+        fetched = {}
+        if missing:
+            found = self.store.get(ids=list(missing), include=["documents", "metadatas", "embeddings"])
+            for i, doc_id in enumerate(found["ids"]):
+                fetched[doc_id] = (found["documents"][i], found["metadatas"][i], np.asarray(found["embeddings"][i]))
+
+        all_formatted = []
+        for query_embedding, vector_hits, fused_ids in zip(query_embeddings, vector_results, all_fused):
+            by_id = {hit["id"]: hit for hit in vector_hits}
+            query = np.asarray(query_embedding, dtype=np.float32)
+            formatted = []
+            for doc_id in fused_ids:
+                if doc_id in by_id:
+                    formatted.append(by_id[doc_id])
+                elif doc_id in fetched:
+                    document, metadata, embedding = fetched[doc_id]
+                    cosine = float(query @ embedding / (np.linalg.norm(query) * np.linalg.norm(embedding) or 1.0))
+                    formatted.append({
+                        'document': document,
+                        'metadata': metadata or {},
+                        'distance': 1.0 - cosine,
+                        'id': doc_id
+                    })
+            all_formatted.append(formatted)
+        return all_formatted
+
+    def count(self) -> int:
+        return self.store.count()
 
     def get_collection_info(self) -> Dict[str, Any]:
-        return {"total_documents": self.collection.count()}
+        info = {"total_documents": self.store.count(), "backend": self.backend}
+        if self.doc_store is not None:
+            info["document_vectors"] = self.doc_store.count()
+            info["docs_to_expand"] = self.docs_to_expand
+        if hasattr(self.store, "memory_stats"):
+            info["vectors"] = self.store.memory_stats()
+        return info
 
     def clear_collection(self):
         """Delete all documents in the collection"""
-        self.collection.delete(where={})
\ No newline at end of file
+        self.store.clear()
+        if self.doc_store is not None:
+            self.doc_store.clear()
+        if self.bm25 is not None:
+            self.bm25.clear()
+            self.bm25.save()
+        self._bump_version()
@@ -0,0 +1,84 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Dict, Any, Iterable
+
+# Rows per call to a backend, also the page size used when scanning a store
+MAX_BATCH = 1000
+
+# The chunk collection; a NumPy store keeps it directly in the persist directory
+DEFAULT_COLLECTION = "rag_documents"
+
+
+def matches_where(metadata: Dict[str, Any], where: Dict[str, Any]) -> bool:
+    """Filter in Chroma's syntax: {"key": value}, {"key": {"$in": [values]}} or {"$and": [filter, ...]}"""
+    if not where:
+        return True
+    if "$and" in where:
+        return all(matches_where(metadata, clause) for clause in where["$and"])
+    return all(metadata.get(key) in value["$in"] if isinstance(value, dict) else metadata.get(key) == value
+               for key, value in where.items())
+
+
+class VectorStore(ABC):
+    """Storage engine behind VectorDatabase.
+
+    ``get`` returns a dict of parallel lists ("ids" plus whatever is named in
+    ``include``), ``query`` returns one list of hits per query embedding in
+    the ``search_similar`` format (document, metadata, cosine distance, id),
+    restricted to rows matching ``where`` if given: one filter for all
+    queries, or a list with one filter per query. Backends implement every
+    abstract method; ``flush`` is optional.
+    """
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, ids: List[str] = None, where: Dict[str, Any] = None,
+            include: Iterable[str] = ("documents", "metadatas"), limit: int = None,
+            offset: int = 0) -> Dict[str, list]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(self, query_embeddings, top_k: int, where=None) -> List[List[Dict]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        raise NotImplementedError
+
+    def flush(self):
+        """Persist pending changes (no-op for stores that write through)"""
+
+
+def create_vector_store(backend: str, persist_directory: str, vector_dtype: str = "float32",
+                        quantization: str = "none", rescore_factor: int = None,
+                        collection: str = DEFAULT_COLLECTION) -> VectorStore:
+    """``collection`` other than the default is a Chroma collection or a NumPy store subdirectory"""
+    # Backends are imported on demand so the NumPy store never pulls in chromadb
+    if backend == "chroma":
+        if quantization != "none":
+            raise ValueError("Quantized vector storage needs vector_backend: numpy")
+        from core.chroma_store import ChromaStore
+        return ChromaStore(persist_directory, collection)
+    if backend == "numpy":
+        from core.numpy_store import NumpyStore
+        if collection != DEFAULT_COLLECTION:
+            persist_directory = os.path.join(persist_directory, collection)
+            os.makedirs(persist_directory, exist_ok=True)
+        return NumpyStore(persist_directory, dtype=vector_dtype, quantization=quantization,
+                          rescore_factor=rescore_factor)
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -1,7 +1,10 @@
 # main.py
+import argparse
 import yaml
 import os
-from rag_system import RAGSystem
+from core.rag_system import RAGSystem
+from core.local_llm import cpu_options_from_config
+from core.metrics import configure as configure_metrics
 
 def load_config(config_path: str = "config.yaml"):
     if not os.path.exists(config_path):
@@ -9,8 +12,20 @@ def load_config(config_path: str = "config.yaml"):
     with open(config_path, "r", encoding="utf-8") as f:
         return yaml.safe_load(f)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ask questions about the PDF in config.yaml")
+    parser.add_argument("--questions", help="batch mode: .jsonl or .csv file of questions")
+    parser.add_argument("--output", default="answers.jsonl", help="batch mode: JSONL file answers are appended to")
+    parser.add_argument("--batch-size", type=int, default=0, help="questions per generate call (0 = fit memory)")
+    parser.add_argument("--no-resume", action="store_true", help="start over instead of skipping answered questions")
+    parser.add_argument("--ingest", nargs="+", metavar="PDF",
+                        help="also add these PDFs to the knowledge base (bulk load, see extract_workers)")
+    return parser.parse_args()
+
 def main():
+    args = parse_args()
     config = load_config("config.yaml")
+    configure_metrics(quiet=config.get("quiet", False), structured_logs=config.get("structured_logs", False))
 
     # Validate required paths
     required_paths = ["pdf_path", "embedding_model_path", "llm_model_path"]
@@ -29,9 +44,44 @@ def main():
             max_length=config.get("max_length", 256),
             temperature=config.get("temperature", 0.3),
             vector_db_dir=config.get("vector_db_dir", "./chroma_db"),
-            top_k=config.get("top_k", 2)
+            top_k=config.get("top_k", 2),
+            ingest_batch_size=config.get("ingest_batch_size", 64),
+            extract_workers=config.get("extract_workers", 1),
+            extract_pages_per_task=config.get("extract_pages_per_task", 8),
+            embedding_cache_dir=config.get("embedding_cache_dir"),
+            embedding_cache_max_mb=config.get("embedding_cache_max_mb", 512),
+            embedding_backend=config.get("embedding_backend", "torch"),
+            embedding_onnx_quantize=config.get("embedding_onnx_quantize", False),
+            answer_cache_size=config.get("answer_cache_size", 256),
+            answer_cache_threshold=config.get("answer_cache_threshold", 0.95),
+            llm_options=cpu_options_from_config(config),
+            prompt_token_budget=config.get("prompt_token_budget", 1024),
+            hybrid_search=config.get("hybrid_search", False),
+            rrf_k=config.get("rrf_k", 60),
+            vector_backend=config.get("vector_backend", "chroma"),
+            vector_dtype=config.get("vector_dtype", "float32"),
+            vector_quantization=config.get("vector_quantization", "none"),
+            vector_rescore_factor=config.get("vector_rescore_factor"),
+            chunking=config.get("chunking", "words"),
+            two_level_search=config.get("two_level_search", False),
+            docs_to_expand=config.get("docs_to_expand", 5),
+            doc_section_chunks=config.get("doc_section_chunks", 0)
         )
 
+        if args.ingest:
+            rag.ingest_files(args.ingest)
+
+        if args.questions:
+            rag.answer_questions_file(
+                args.questions,
+                args.output,
+                batch_size=args.batch_size or config.get("batch_qa_batch_size", 0),
+                max_batch_size=config.get("batch_qa_max_batch_size", 8),
+                memory_fraction=config.get("batch_qa_memory_fraction", 0.5),
+                resume=not args.no_resume
+            )
+            return
+
         print("\nAsk questions about your document. Type 'quit' to exit.\n")
         while True:
             user_input = input("Your question: ").strip()
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from core.numpy_store import NumpyStore
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def _fill(directory, n=50, **kwargs):
+    store = NumpyStore(str(directory), **kwargs)
+    ids = [f"id{i}" for i in range(n)]
+    vectors = _vectors(n)
+    store.upsert(ids, vectors, [f"doc {i}" for i in range(n)], [{"source": f"s{i % 3}"} for i in range(n)])
+    store.flush()
+    return store, ids, vectors
+
+
+def _assert_finds(store, expected):
+    """Each vector of ``expected`` (id -> vector) finds its own id and document first"""
+    ids = list(expected)
+    assert sorted(store.ids) == sorted(ids)
+    hits = store.query(np.stack([expected[doc_id] for doc_id in ids]), top_k=1)
+    assert [h[0]["id"] for h in hits] == ids
+    assert [h[0]["document"] for h in hits] == [f"doc {doc_id[2:]}" for doc_id in ids]
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8", "binary"])
+def test_unflushed_changes_are_invisible_to_a_reopened_store(tmp_path, quantization):
+    store, ids, vectors = _fill(tmp_path, quantization=quantization)
+    store.delete(ids[:10])
+    store.upsert([ids[20]], _vectors(1, seed=1), ["doc 20"], [{"source": "s2"}])
+
+    # Another process, or this one after a crash: the last flushed state, rows still matching ids
+    reopened = NumpyStore(str(tmp_path), quantization=quantization)
+    _assert_finds(reopened, dict(zip(ids, vectors)))
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_flushed_changes_keep_rows_aligned(tmp_path, quantization):
+    store, ids, vectors = _fill(tmp_path, quantization=quantization)
+    store.delete(ids[:10])
+    updated = _vectors(1, seed=1)
+    store.upsert([ids[20]], updated, ["doc 20"], [{"source": "s2"}])
+    expected = dict(zip(ids[10:], vectors[10:]), **{ids[20]: updated[0]})
+    _assert_finds(store, expected)
+    store.flush()
+
+    _assert_finds(NumpyStore(str(tmp_path), quantization=quantization), expected)
+
+
+def test_compaction_keeps_rows_aligned(tmp_path):
+    store, ids, vectors = _fill(tmp_path, n=1500)
+    documents = [f"doc {i}" for i in range(len(ids))]
+    metadatas = [{"source": f"s{i % 3}"} for i in range(len(ids))]
+    for _ in range(2):
+        # Unreferenced rows now outnumber the live ones
+        store.upsert(ids, vectors, documents, metadatas)
+    store.flush()
+    assert store.count() == 1500 and store._used_rows == 1500
+
+    reopened = NumpyStore(str(tmp_path))
+    _assert_finds(reopened, dict(zip(ids, vectors)))
+    hits = reopened.query(vectors[:1], top_k=5, where={"source": {"$in": ["s1"]}})[0]
+    assert {hit["metadata"]["source"] for hit in hits} == {"s1"}
+
+
+def test_clear(tmp_path):
+    store, _, _ = _fill(tmp_path)
+    store.clear()
+    assert NumpyStore(str(tmp_path)).count() == 0
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith("vectors")]
+
+
+def test_one_filter_per_query_matches_single_queries(tmp_path):
+    store, _, vectors = _fill(tmp_path)
+    where = [{"source": {"$in": ["s0"]}}, {"source": {"$in": ["s1", "s2"]}}, {"source": "s2"}]
+    batched = store.query(vectors[:3], top_k=4, where=where)
+    single = [store.query(vectors[q:q + 1], top_k=4, where=clause)[0] for q, clause in enumerate(where)]
+    assert [[hit["id"] for hit in hits] for hits in batched] == [[hit["id"] for hit in hits] for hits in single]
+    for hits, expected in zip(batched, single):
+        assert [hit["distance"] for hit in hits] == pytest.approx([hit["distance"] for hit in expected], abs=1e-5)
@@ -7,10 +7,10 @@ from pathlib import Path
 import gradio as gr
 
 # Import your core modules
-from core.pdf_processor import PDFProcessor
-from core.embedding_model import EmbeddingModel
-from core.vector_database import VectorDatabase
-from core.local_llm import LocalLLM
+from core import model_registry
+from core.ingestion import ingest_pdf
+from core.prompt import build_prompt, GenerationError
+from core.metrics import metrics, log_event, configure as configure_metrics
 
 # ----------------------------
 # Load config
@@ -22,44 +22,68 @@ if not os.path.exists(CONFIG_PATH):
 with open(CONFIG_PATH, "r") as f:
     config = yaml.safe_load(f)
 
+configure_metrics(quiet=config.get("quiet", False), structured_logs=config.get("structured_logs", False))
+
 # ----------------------------
 # Initialize shared components
 # ----------------------------
-pdf_processor = PDFProcessor()
-embedding_model = EmbeddingModel(config["embedding_model_path"])
-vector_db = VectorDatabase(persist_directory=config["vector_db_dir"])
-llm = LocalLLM(
-    model_path=config["llm_model_path"],
-    max_length=config.get("max_length", 256)
-)
+# Models come from the process-wide registry: loaded on first use (or warmed up
+# in the background at launch) and shared with the API when both run in one process
+pdf_processor = model_registry.get_pdf_processor(config)
+answer_cache = model_registry.get_answer_cache(config)
+
+
+def get_embedding_model():
+    return model_registry.get_embedding_model(config)
+
+
+def get_vector_db():
+    return model_registry.get_vector_db(config)
+
+
+def get_llm():
+    return model_registry.get_llm(config)
 
 
 # ----------------------------
 # Helper Functions
 # ----------------------------
-def upload_pdf(file):
+def upload_pdf(file, progress=gr.Progress()):
     if not file or not file.name.endswith(".pdf"):
         return "Please upload a valid PDF file.", "", []
 
+    def report(stats):
+        if stats["total_pages"]:
+            progress(stats["pages"] / stats["total_pages"],
+                     desc=f"{stats['chunks']} chunks indexed")
+
     try:
-        # Process PDF
-        chunks = pdf_processor.load_pdf(
+        # Stream the PDF in batches; the previous documents are only removed once it is indexed,
+        # so a failed or text-less upload leaves the knowledge base as it was
+        vector_db = get_vector_db()
+        embedding_model = get_embedding_model()
+        stats = ingest_pdf(
             file.name,
+            pdf_processor,
+            embedding_model,
+            vector_db,
             chunk_size=config.get("chunk_size", 400),
-            chunk_overlap=config.get("chunk_overlap", 50)
+            chunk_overlap=config.get("chunk_overlap", 50),
+            batch_size=config.get("ingest_batch_size", 64),
+            progress=report,
+            chunking=config.get("chunking", "words")
         )
-        if not chunks:
+        if not stats["chunks"]:
             return "No text could be extracted from the PDF.", "", []
-
-        # Generate embeddings
-        embeddings = embedding_model.create_embeddings(chunks)
-
-        # Clear old DB and add new
-        vector_db.collection.delete(where={})
-        metadatas = [{"chunk_id": i, "source": os.path.basename(file.name)} for i in range(len(chunks))]
-        vector_db.add_documents(chunks, embeddings, metadatas)
-
-        status = f"PDF '{os.path.basename(file.name)}' processed successfully!\nChunks: {len(chunks)}"
+        for source in vector_db.list_sources():
+            if source != stats["source"]:
+                vector_db.delete_source(source)
+        answer_cache.invalidate()
+
+        status = f"PDF '{os.path.basename(file.name)}' processed successfully!\nChunks: {stats['chunks']}"
+        cache_stats = embedding_model.get_cache_stats()
+        if cache_stats:
+            status += f"\nEmbedding cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses"
         return status, "", []
 
     except Exception as e:
@@ -68,7 +92,8 @@ def upload_pdf(file):
 
 def clear_knowledge():
     try:
-        vector_db.collection.delete(where={})
+        get_vector_db().clear_collection()
+        answer_cache.invalidate()
         # Optional: delete persist directory for full reset
         # if os.path.exists(config["vector_db_dir"]):
         #     shutil.rmtree(config["vector_db_dir"])
@@ -78,52 +103,88 @@ def clear_knowledge():
 
 
 def ask_question(question, history):
+    # Generator: Gradio re-renders the chat on every yield while the answer streams in
     if not question.strip():
-        return history, "Please ask a question."
+        yield history, "Please ask a question."
+        return
 
+    streaming = False
     try:
         # Check if any documents exist
-        if vector_db.collection.count() == 0:
-            return history, "Knowledge base is empty. Please upload a PDF first."
+        vector_db = get_vector_db()
+        if vector_db.count() == 0:
+            yield history, "Knowledge base is empty. Please upload a PDF first."
+            return
+
+        timings = {}
+        metrics.inc("rag_queries_total", entry="ui")
 
         # Embed query
-        q_emb = embedding_model.create_embeddings([question])[0]
+        kb_version = vector_db.version
+        with metrics.stage_timer("embed", timings):
+            q_emb = get_embedding_model().create_embeddings([question])[0]
+
+        # Reuse the answer of a near-identical earlier question
+        cached = answer_cache.lookup(q_emb, kb_version)
+        metrics.inc("rag_answer_cache_total", result="hit" if cached else "miss")
+        if cached:
+            history.append((question, cached["answer"]))
+            log_event("query", entry="ui", cached=True, **timings)
+            yield history, f"♻️ Cached answer (similarity {cached['similarity']:.3f})"
+            return
 
         # Retrieve context
         top_k = config.get("top_k", 2)
-        similar = vector_db.search_similar(q_emb, top_k=top_k)
-
-        # Build context
-        context = "\n\n".join([doc['document'] for doc in similar])
-
-        # Generate prompt
-        prompt = f"""Use only the following context to answer the question. If unsure, say "I don't know."
+        with metrics.stage_timer("retrieve", timings):
+            similar = vector_db.search_similar(q_emb, top_k=top_k, query_text=question)
 
-Context:
-{context}
+        # Loads the LLM on the first question unless it was warmed up
+        llm = get_llm()
+        context_packer = model_registry.get_context_packer(config)
+        with metrics.stage_timer("prompt_build", timings):
+            # Build context: merge overlapping neighbours and fit the prompt token budget
+            context, similar = context_packer.pack(question, similar)
 
-Question: {question}
-
-Answer:"""
-
-        # Generate answer
-        temperature = config.get("temperature", 0.3)
-        answer = llm.generate_response(prompt, temperature=temperature)
+            # Generate prompt
+            prompt = build_prompt(question, context)
 
         # Format retrieved context for display
         context_display = "\n\n".join([
             f"Chunk {i + 1} (Dist: {doc['distance']:.3f}):\n{doc['document'][:300]}..."
             for i, doc in enumerate(similar)
         ])
+        context_display = f"🔍 Retrieved Context:\n{context_display}"
 
-        # Update chat history
-        history.append((question, answer))
-        return history, f"🔍 Retrieved Context:\n{context_display}"
+        # Stream the answer into the chat history
+        temperature = config.get("temperature", 0.3)
+        history.append((question, ""))
+        streaming = True
+        answer = ""
+        generation = {}
+        for piece in llm.stream_response(prompt, temperature=temperature, stats=generation):
+            answer += piece
+            history[-1] = (question, answer)
+            yield history, context_display
+        answer = answer.strip()
+        history[-1] = (question, answer)
+        # Only reached when generation finished: a failed stream raises GenerationError
+        answer_cache.store(q_emb, kb_version, {"answer": answer, "context_chunks": similar})
+        # Prefill and decode timings come from the LLM's own measurement of this generation
+        log_event("query", entry="ui", cached=False, **timings, **generation)
+        yield history, context_display
+
+    except GenerationError as e:
+        # Keep what was streamed, but it is not stored in the answer cache
+        history[-1] = (question, f"{answer}\n\n{e}".strip())
+        yield history, str(e)
 
     except Exception as e:
         error_msg = f"Error: {str(e)}"
-        history.append((question, error_msg))
-        return history, error_msg
+        if streaming:
+            history[-1] = (question, error_msg)
+        else:
+            history.append((question, error_msg))
+        yield history, error_msg
 
 
 # ----------------------------
@@ -155,6 +216,10 @@ with gr.Blocks(title="Edge RAG - Local Document Q&A") as demo:
 
 # Launch
 if __name__ == "__main__":
+    # Daemon thread: the interface is served while the models load
+    model_registry.warm_up(config)
+    # One chat per LLM worker can generate at the same time
+    demo.queue(default_concurrency_limit=max(1, config.get("llm_workers", 1)))
     demo.launch(
         server_name="0.0.0.0",
         server_port=7860,